@@ -1,3 +1,7 @@
 from setuptools import setup, find_packages
 
-setup(name='contingency_space', version='1.0', packages=find_packages())
\ No newline at end of file
+setup(name='contingency_space',
+      version='1.0',
+      package_dir={'': 'src'},
+      packages=find_packages('src'),
+      entry_points={'console_scripts': ['contingency-space=contingency_space.cli:main']})
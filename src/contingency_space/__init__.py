@@ -1 +1 @@
-__all__ = ['cm_generator', 'confusion_matrix', 'contingency_space', 'imbalance_sensitivity']
\ No newline at end of file
+__all__ = ['cli', 'cm_batch', 'cm_generator', 'columnar', 'confusion_matrix', 'contingency_space', 'dtype_policy', 'imbalance_sensitivity', 'instrumentation', 'loadgen', 'merge', 'metric_cache', 'metrics', 'paths', 'scoring', 'service', 'streaming', 'thresholds']
\ No newline at end of file
@@ -0,0 +1,314 @@
+import os
+import sys
+import glob
+import pickle
+import argparse
+import importlib
+import importlib.util
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.contingency_space import ContingencySpace
+from contingency_space.cm_generator import CMGenerator
+from contingency_space.cm_batch import CMBatch
+from contingency_space.metrics import METRICS, calculate_scores
+from contingency_space.scoring import resolve_jobs
+
+
+def resolve_metric(name: str) -> Callable[[ConfusionMatrix], float]:
+    """Returns the metric with the given name.
+
+    Args:
+        name (str): The name of a built-in metric (see metrics.METRICS), or the import path of any metric as 'module:function'.
+
+    Raises:
+        ValueError: The metric could not be found.
+    """
+    if name in METRICS:
+        return METRICS[name]
+
+    module_name, _, function_name = name.partition(':')
+    if not function_name:
+        raise ValueError(f'Unknown metric "{name}". Use one of {sorted(METRICS)} or "module:function".')
+    try:
+        return getattr(importlib.import_module(module_name), function_name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f'Could not import the metric "{name}": {e}')
+
+
+class ResultStore:
+    """A directory of columnar part files that results are appended to.
+
+    Each flush writes a new part file, atomically, so an interrupted job leaves only complete files behind. The
+    directory can be read as one table by pandas, pyarrow or DuckDB. Rows are identified by their key columns,
+    which lets a job that is run again skip the cells it has already computed.
+    """
+
+    def __init__(self, directory: str, key_columns: list[str], file_format: str = 'parquet', flush_every: int = 32):
+        """Open (or create) a result directory.
+
+        Args:
+            directory (str): The directory holding the part files.
+            key_columns (list[str]): The columns that identify a cell.
+            file_format (str, optional): 'parquet' or 'csv'. Defaults to 'parquet'.
+            flush_every (int, optional): The number of rows buffered before a part file is written. Defaults to 32.
+
+        Raises:
+            ValueError: The format is unknown.
+            ImportError: The format is parquet, but no parquet engine is installed.
+        """
+        if file_format not in ('parquet', 'csv'):
+            raise ValueError(f'Unknown format "{file_format}". Use "parquet" or "csv".')
+        #fail before any work is done, rather than at the first flush.
+        if file_format == 'parquet' and not any(importlib.util.find_spec(engine) for engine in ('pyarrow', 'fastparquet')):
+            raise ImportError('Writing parquet requires pyarrow. Install it with `pip install pyarrow`, or use the csv format.')
+
+        self.directory: str = directory
+        self.key_columns: list[str] = key_columns
+        self.file_format: str = file_format
+        self.flush_every: int = flush_every
+        self.__buffer: list[pd.DataFrame] = []
+        self.__buffered_rows: int = 0
+
+        os.makedirs(directory, exist_ok=True)
+        #number new parts after the last one, so a removed part cannot make a new one overwrite another.
+        numbers = [int(os.path.basename(f)[len('part-'):].split('.')[0]) for f in self.part_files()]
+        self.__parts: int = max(numbers) + 1 if numbers else 0
+
+    def part_files(self) -> list[str]:
+        return sorted(glob.glob(os.path.join(self.directory, f'part-*.{self.file_format}')))
+
+    def read(self, columns: list[str] = None) -> pd.DataFrame:
+        """Returns every row written so far as one DataFrame.
+
+        Args:
+            columns (list[str], optional): The columns to read. Defaults to every column.
+        """
+        files = self.part_files()
+        if not files:
+            return pd.DataFrame(columns=columns if columns is not None else self.key_columns)
+
+        if self.file_format == 'parquet':
+            frames = [pd.read_parquet(f, columns=columns) for f in files]
+        else:
+            frames = [pd.read_csv(f, usecols=columns, keep_default_na=False) for f in files]
+        return pd.concat(frames, ignore_index=True)
+
+    def completed(self) -> set[tuple]:
+        """Returns the keys of every cell already written.
+        """
+        existing = self.read(self.key_columns).drop_duplicates()
+        return set(existing.itertuples(index=False, name=None))
+
+    def add(self, rows: dict | list[dict] | pd.DataFrame) -> None:
+        """Buffers rows, writing a part file once `flush_every` rows are buffered.
+        """
+        frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame([rows] if isinstance(rows, dict) else rows)
+        self.__buffer.append(frame)
+        self.__buffered_rows += len(frame)
+        if self.__buffered_rows >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes every buffered row to a new part file.
+        """
+        if not self.__buffer:
+            return
+
+        frame = pd.concat(self.__buffer, ignore_index=True)
+        path = os.path.join(self.directory, f'part-{self.__parts:05d}.{self.file_format}')
+        temporary = path + '.tmp'
+
+        if self.file_format == 'parquet':
+            frame.to_parquet(temporary, index=False)
+        else:
+            frame.to_csv(temporary, index=False)
+        os.replace(temporary, path)
+
+        self.__parts += 1
+        self.__buffer = []
+        self.__buffered_rows = 0
+
+
+def _run_cells(cells: list[tuple], task: Callable[..., list[dict] | dict], store: ResultStore, jobs: int) -> int:
+    """Runs a task for every cell, in parallel if jobs > 1, adding the results to the store as they complete.
+    """
+    if jobs == 1:
+        for cell in cells:
+            store.add(task(*cell))
+    else:
+        with ProcessPoolExecutor(jobs) as pool:
+            for future in as_completed([pool.submit(task, *cell) for cell in cells]):
+                store.add(future.result())
+
+    store.flush()
+    return len(cells)
+
+
+def _sensitivity_cell(ratio: str, metric: str, granularity: int, memory_budget: int | None) -> dict:
+    from contingency_space.imbalance_sensitivity import imbalance_sensitivity
+
+    value = imbalance_sensitivity(ratio, resolve_metric(metric), granularity, memory_budget=memory_budget)
+    return {'ratio': ratio, 'metric': metric, 'granularity': granularity, 'sensitivity': float(value)}
+
+
+def run_sensitivity(args: argparse.Namespace) -> int:
+    for metric in args.metrics:
+        resolve_metric(metric)
+
+    store = ResultStore(args.output, ['ratio', 'metric', 'granularity'], args.format, args.flush_every)
+    done = store.completed()
+
+    cells = [(ratio, metric, granularity, args.memory_budget)
+             for ratio in args.ratios for metric in args.metrics for granularity in args.granularity
+             if (ratio, metric, granularity) not in done]
+
+    print(f'{len(cells)} cells to compute, {len(done)} already done.', file=sys.stderr)
+    return _run_cells(cells, _sensitivity_cell, store, resolve_jobs(args.jobs))
+
+
+def run_surface(args: argparse.Namespace) -> int:
+    for metric in args.metrics:
+        resolve_metric(metric)
+
+    instances_per_class = {}
+    for entry in args.classes:
+        cls, _, size = entry.partition('=')
+        instances_per_class[cls] = int(size)
+
+    generator = CMGenerator(len(instances_per_class), instances_per_class)
+    labels = list(instances_per_class.keys())
+
+    chunk_size = args.chunk_size
+    if chunk_size is None:
+        chunk_size = generator.plan(args.granularity, args.memory_budget, keep_scores=False, return_points=True)['chunk_size']
+    num_chunks = -(-generator.num_matrices(args.granularity) // chunk_size)
+
+    #a cell is one chunk of one metric's surface, and each chunk is written to its own part file.
+    store = ResultStore(args.output, ['metric', 'granularity', 'chunk_size', 'chunk'], args.format, flush_every=1)
+    done = {(metric, int(chunk)) for metric, granularity, size, chunk in store.completed()
+            if granularity == args.granularity and size == chunk_size}
+
+    computed = 0
+    for metric in args.metrics:
+        #only the chunks missing from the store are generated and scored.
+        missing = [chunk for chunk in range(num_chunks) if (metric, chunk) not in done]
+        if not missing:
+            continue
+
+        chunks = generator.iter_scores(args.granularity, resolve_metric(metric), chunk_size, args.jobs, return_points=True, chunks=missing)
+        for chunk, (positions, scores, points) in zip(missing, chunks):
+            columns = {'metric': metric, 'granularity': args.granularity, 'chunk_size': chunk_size, 'chunk': chunk,
+                       'position': np.arange(positions.start, positions.stop)}
+            #the coordinates are ordered as ConfusionMatrix.vector orders them, i.e. with the classes reversed.
+            columns.update({f'rate_{cls}': points[:, -1 - i] for i, cls in enumerate(labels)})
+            columns['score'] = scores
+            store.add(pd.DataFrame(columns))
+            computed += 1
+
+    print(f'{computed} chunks computed, {len(done)} already done.', file=sys.stderr)
+    return computed
+
+
+def load_history(path: str) -> ContingencySpace:
+    """Loads a stored history as a ContingencySpace.
+
+    Args:
+        path (str): A pickle of a ContingencySpace, a dict of ConfusionMatrix or a list of ConfusionMatrix, or a .npy
+            array of matrices with shape (M, k, k).
+    """
+    if path.endswith('.npy'):
+        counts = np.load(path, allow_pickle=False)
+        return ContingencySpace(CMBatch(counts, [str(i) for i in range(counts.shape[1])]).to_matrices())
+
+    with open(path, 'rb') as f:
+        history = pickle.load(f)
+
+    match history:
+        case ContingencySpace():
+            return history
+        case dict() | list():
+            return ContingencySpace(history)
+        case _:
+            raise TypeError(f'{path} does not hold a ContingencySpace, or a dict or list of ConfusionMatrix.')
+
+
+def _path_cell(path: str, metric: str) -> dict:
+    space = load_history(path)
+    batch = CMBatch.from_matrices(list(space.matrices.values()))
+
+    #every point of the history, with the metric as an extra axis if one is given.
+    points = batch.vectors()
+    if metric:
+        points = np.column_stack([points, calculate_scores(batch, resolve_metric(metric))])
+
+    segments = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    return {'history': path, 'metric': metric, 'num_points': len(points), 'path_length': float(segments.sum()),
+            'max_step': float(segments.max()) if len(segments) > 0 else 0.0}
+
+
+def run_path(args: argparse.Namespace) -> int:
+    store = ResultStore(args.output, ['history', 'metric'], args.format, args.flush_every)
+    done = store.completed()
+
+    histories = [path for pattern in args.histories for path in sorted(glob.glob(pattern))]
+    metrics = args.metrics if args.metrics else ['']
+    for metric in args.metrics:
+        resolve_metric(metric)
+    cells = [(path, metric) for path in histories for metric in metrics if (path, metric) not in done]
+
+    print(f'{len(cells)} cells to compute, {len(done)} already done.', file=sys.stderr)
+    return _run_cells(cells, _path_cell, store, resolve_jobs(args.jobs))
+
+
+def _comma_list(value: str) -> list[str]:
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='contingency-space', description='Run contingency space jobs in batch.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--output', '-o', required=True, help='directory the result part files are written to. Existing results are skipped.')
+    common.add_argument('--format', choices=['parquet', 'csv'], default='parquet', help='format of the part files. Defaults to parquet.')
+    common.add_argument('--jobs', '-j', type=int, default=1, help='number of processes, or -1 for every core. Defaults to 1.')
+    common.add_argument('--memory-budget', type=int, default=None, help='bytes a single computation may use before switching to chunks.')
+
+    sensitivity = subparsers.add_parser('sensitivity', parents=[common], help='imbalance sensitivity of metrics over a sweep of ratios.')
+    sensitivity.add_argument('--ratios', type=_comma_list, required=True, help='comma separated ratios, e.g. 1:2,1:4,1:16.')
+    sensitivity.add_argument('--metrics', type=_comma_list, required=True, help='comma separated metric names or module:function paths.')
+    sensitivity.add_argument('--granularity', type=lambda v: [int(g) for g in _comma_list(v)], default=[15], help='comma separated granularities. Defaults to 15.')
+    sensitivity.add_argument('--flush-every', type=int, default=32, help='rows buffered before each part file is written.')
+    sensitivity.set_defaults(run=run_sensitivity)
+
+    surface = subparsers.add_parser('surface', parents=[common], help='score surfaces of metrics over a generated grid.')
+    surface.add_argument('--classes', type=_comma_list, required=True, help='comma separated class sizes, e.g. t=1000,f=16000.')
+    surface.add_argument('--metrics', type=_comma_list, required=True, help='comma separated metric names or module:function paths.')
+    surface.add_argument('--granularity', type=int, default=30, help='values along each axis. Defaults to 30.')
+    surface.add_argument('--chunk-size', type=int, default=None, help='matrices per part file. Defaults to the whole grid, or what fits the memory budget.')
+    surface.set_defaults(run=run_surface)
+
+    path = subparsers.add_parser('path', parents=[common], help='learning path analysis of stored histories.')
+    path.add_argument('histories', nargs='+', help='history files or glob patterns (.pkl or .npy).')
+    path.add_argument('--metrics', type=_comma_list, default=[], help='comma separated metrics to add as a third axis. Defaults to a 2D path.')
+    path.add_argument('--flush-every', type=int, default=32, help='rows buffered before each part file is written.')
+    path.set_defaults(run=run_path)
+
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        args.run(args)
+    except (ValueError, TypeError, ImportError, MemoryError, FileNotFoundError) as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import numpy as np
+import numpy.typing as npt
+from typing import Iterator
+from contingency_space.confusion_matrix import ConfusionMatrix, normalize_counts, one_vs_rest_counts
+from contingency_space.dtype_policy import DTypePolicy, DEFAULT_POLICY
+
+
+class CMBatch:
+    """A batch of confusion matrices that share the same classes.
+
+    The counts are stored as a single array of shape (N, k, k), where row i of every matrix holds the
+    frequencies of the i-th class, as in ConfusionMatrix. Vectorized metrics and the scoring functions
+    operate on this array directly, without building a ConfusionMatrix per entry.
+    """
+
+    def __init__(self, counts: npt.ArrayLike, labels: tuple[str, ...] | list[str], policy: DTypePolicy = None):
+        """Create a batch from an array of counts.
+
+        Args:
+            counts (npt.ArrayLike): The counts, of shape (N, k, k).
+            labels (tuple[str, ...] | list[str]): The k class labels, in row order.
+            policy (DTypePolicy, optional): The dtypes to store counts and compute rates with. Defaults to DEFAULT_POLICY.
+
+        Raises:
+            ValueError: The counts are not of shape (N, k, k), or do not match the number of labels.
+            OverflowError: The counts do not fit in the counts dtype of the policy.
+        """
+        self.policy: DTypePolicy = policy if policy is not None else DEFAULT_POLICY
+        self.labels: tuple[str, ...] = tuple(labels)
+
+        counts = np.asarray(counts)
+        if counts.ndim != 3 or counts.shape[1] != counts.shape[2]:
+            raise ValueError(f'Counts must be of shape (N, k, k), not {counts.shape}.')
+        if counts.shape[1] != len(self.labels):
+            raise ValueError(f'Expected {counts.shape[1]} labels, got {len(self.labels)}.')
+
+        self.counts: npt.NDArray = self.policy.counts_array(counts)
+
+    @classmethod
+    def from_matrices(cls, matrices: list[ConfusionMatrix], policy: DTypePolicy = None) -> 'CMBatch':
+        """Stack a list of confusion matrices into a batch.
+
+        Args:
+            matrices (list[ConfusionMatrix]): The matrices. All must have the same classes, in the same order.
+            policy (DTypePolicy, optional): The dtypes to use. Defaults to DEFAULT_POLICY.
+
+        Returns:
+            CMBatch: The batch.
+        """
+        if len(matrices) == 0:
+            raise ValueError('At least one matrix is needed to build a batch.')
+
+        labels = tuple(matrices[0].matrix.keys())
+        for cm in matrices:
+            if tuple(cm.matrix.keys()) != labels:
+                raise ValueError('Every matrix in a batch must have the same classes.')
+
+        return cls(np.stack([cm.array() for cm in matrices]), labels, policy)
+
+    def to_matrices(self) -> list[ConfusionMatrix]:
+        """Returns the batch as a list of ConfusionMatrix objects.
+        """
+        return [self[i] for i in range(len(self))]
+
+    def astype(self, policy: DTypePolicy) -> 'CMBatch':
+        """Returns a copy of the batch stored with another policy.
+
+        Args:
+            policy (DTypePolicy): The new policy.
+
+        Raises:
+            OverflowError: The counts do not fit in the counts dtype of the new policy.
+        """
+        return CMBatch(self.counts, self.labels, policy)
+
+    def class_sizes(self) -> npt.NDArray:
+        """Returns the number of instances of each class, with shape (N, k).
+        """
+        return self.counts.sum(axis=2)
+
+    def rates(self) -> npt.NDArray:
+        """Returns the rate at which each class was correctly classified, with shape (N, k).
+
+        Classes with no instances have a rate of 0.
+        """
+        sizes = self.class_sizes()
+        hits = np.diagonal(self.counts, axis1=1, axis2=2)
+
+        rates = np.zeros(sizes.shape, dtype=self.policy.scores)
+        np.divide(hits, sizes, out=rates, where=sizes != 0)
+        return rates
+
+    def normalized(self) -> npt.NDArray:
+        """Returns every matrix with each row divided by its sum, with shape (N, k, k) and the scores dtype.
+
+        Rows of classes with no instances are left as zeros.
+        """
+        return normalize_counts(self.counts, self.policy.scores)
+
+    def vectors(self) -> npt.NDArray:
+        """Returns the position of each matrix within the contingency space, with shape (N, k).
+
+        The coordinates are ordered as in ConfusionMatrix.vector, i.e. (tnr, tpr) for binary problems.
+        """
+        return self.rates()[:, ::-1]
+
+    def one_vs_rest(self) -> npt.NDArray:
+        """Returns the binary matrix of each class against all the others, with shape (N, k, 2, 2).
+
+        See one_vs_rest_counts. Swapping the first two axes gives k runs of N binary matrices, e.g. to measure the
+        learning path of each class with paths.analyze_runs.
+
+        Raises:
+            OverflowError: The binary counts do not fit in the counts dtype of the policy.
+        """
+        return self.policy.counts_array(one_vs_rest_counts(self.counts))
+
+    def binary(self, label: str, labels: tuple[str, str] = ('t', 'f')) -> 'CMBatch':
+        """Returns the binary matrices of one class against all the others as a batch.
+
+        Args:
+            label (str): The class.
+            labels (tuple[str, str], optional): The labels of the class and of the rest in the binary batch. Defaults to ('t', 'f').
+
+        Returns:
+            CMBatch: The binary matrices, with the class in the first row.
+
+        Raises:
+            ValueError: The class is not in the batch.
+            OverflowError: The binary counts do not fit in the counts dtype of the policy.
+        """
+        if label not in self.labels:
+            raise ValueError(f'Unknown class {label!r}. Expected one of {self.labels}.')
+        return CMBatch(self.one_vs_rest()[:, self.labels.index(label)], labels, self.policy)
+
+    @property
+    def num_classes(self) -> int:
+        return self.counts.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.counts.nbytes
+
+    def __len__(self) -> int:
+        return self.counts.shape[0]
+
+    def __getitem__(self, index: int | slice) -> 'ConfusionMatrix | CMBatch':
+        if isinstance(index, (int, np.integer)):
+            return ConfusionMatrix(dict(zip(self.labels, self.counts[index].tolist())))
+        return CMBatch(self.counts[index], self.labels, self.policy)
+
+    def __iter__(self) -> Iterator[ConfusionMatrix]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self) -> str:
+        return f'CMBatch(n={len(self)}, labels={self.labels}, policy={self.policy})'
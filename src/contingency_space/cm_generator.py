@@ -1,6 +1,29 @@
+import sys
+import functools
 import numpy as np
+import numpy.typing as npt
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
 from contingency_space.confusion_matrix import ConfusionMatrix
-import itertools
+from contingency_space.cm_batch import CMBatch
+from contingency_space.dtype_policy import DTypePolicy, DEFAULT_POLICY
+from contingency_space import instrumentation
+
+if TYPE_CHECKING:
+    from contingency_space.scoring import ScoringPool
+
+
+@functools.lru_cache
+def _matrix_object_bytes(num_classes: int) -> int:
+    """Measures the memory held by one ConfusionMatrix object with the given number of classes.
+    """
+    labels = [f'class_{i}' for i in range(num_classes)]
+    cm = ConfusionMatrix({cls: [1000 + i * num_classes + j for j in range(num_classes)] for i, cls in enumerate(labels)})
+    
+    table = cm.matrix
+    size = sys.getsizeof(cm) + sys.getsizeof(cm.__dict__) + sys.getsizeof(table) + sys.getsizeof(cm.class_freqs)
+    size += sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in table.values())
+    size += sum(sys.getsizeof(value) for value in cm.class_freqs.values())
+    return size
 
 
 class CMGenerator:
@@ -11,71 +34,356 @@ class CMGenerator:
     Object will generate a series when generate_cms() is called. 
     """
     
-    def __init__(self, num_classes: int, instances_per_class: dict[str, int]):
+    def __init__(self, num_classes: int, instances_per_class: dict[str, int], policy: DTypePolicy = None):
         """Create an object capable of generating Confusion Matrices using the parameters given.
 
         Args:
             num_classes (int): The number of classes.
             instances_per_class (list): The number of instances of each class.
+            policy (DTypePolicy, optional): The dtypes used to store generated counts. Defaults to DEFAULT_POLICY.
+            
+        Raises:
+            OverflowError: The size of a class does not fit in the counts dtype of the policy.
         """
         
+        self.policy: DTypePolicy = policy if policy is not None else DEFAULT_POLICY
+        self.policy.check_counts(max(instances_per_class.values(), default=0))
+        
         self.num_classes: int = num_classes
         self.n_instances: int = sum(instances_per_class.values())
         self.n_per_class: dict[str, int] = instances_per_class
         self.all_cms: list[ConfusionMatrix] = []
+        self.unique_cms: list[ConfusionMatrix] = []
+        self.inverse: npt.NDArray = np.empty(0, dtype=int)
         
         #We could either use lists, or have num_instances_perclass be a dict instead, with the class names as keys.      
         return
 
-    def generate_cms(self, granularity: int) -> list[ConfusionMatrix]:
+    def generate_array(self, granularity: int) -> npt.NDArray:
+        """Generates the series of confusion matrices as a single array, without building ConfusionMatrix objects.
+        
+        Row i of every matrix belongs to the i-th class of `instances_per_class`. The matrices are ordered as
+        itertools.product would order the per-class rates, i.e. the rate of the last class changes fastest.
+
+        Args:
+            granularity (int): The number of values you wish to have on each axis.
+
+        Returns:
+            npt.NDArray: An array of shape (granularity^k, k, k) holding the counts of every matrix, with the counts dtype of the policy.
+        """
+        
+        with instrumentation.phase('cm_generator.generate_array'):
+            matrices = self.__matrices_at(np.arange(self.num_matrices(granularity)), granularity)
+        
+        instrumentation.count('matrices_generated', len(matrices))
+        instrumentation.record_array(matrices)
+        return matrices
+    
+    def __matrices_at(self, positions: npt.NDArray, granularity: int) -> npt.NDArray:
+        """Builds the matrices at the given positions of the grid.
+        """
+        k = self.num_classes
+        sizes = np.array(list(self.n_per_class.values()), dtype=int)
+        
+        #every rate possible for each class, and the rate each class takes at each position of the grid.
+        all_rates = np.stack([np.linspace(0, n, granularity, dtype=int) for n in sizes])
+        rate_indices = np.unravel_index(positions, (granularity,) * k)
+        hits = np.stack([all_rates[cls][rate_indices[cls]] for cls in range(k)], axis=1)
+        
+        #evenly spread the missed instances of each class across the other cells of its row.
+        misses = (sizes - hits) // (k - 1) if k > 1 else np.zeros_like(hits)
+        
+        matrices = np.repeat(misses[:, :, np.newaxis].astype(self.policy.counts), k, axis=2)
+        diagonal = np.arange(k)
+        matrices[:, diagonal, diagonal] = hits
+        
+        return matrices
+    
+    def num_matrices(self, granularity: int) -> int:
+        """Returns the number of matrices in a grid of the given granularity, i.e. granularity^k.
+        """
+        return granularity ** self.num_classes
+    
+    def iter_arrays(self, granularity: int, chunk_size: int, chunks: Iterable[int] = None) -> Iterator[npt.NDArray]:
+        """Generates the grid in consecutive chunks, so that it never has to be held in memory at once.
+
+        Args:
+            granularity (int): The number of values you wish to have on each axis.
+            chunk_size (int): The number of matrices in each chunk.
+            chunks (Iterable[int], optional): The indices of the chunks to generate, e.g. to resume an interrupted job.
+                Defaults to None, i.e. every chunk.
+
+        Yields:
+            npt.NDArray: The counts of up to `chunk_size` matrices, in the order of generate_array.
+        """
+        for _, matrices in self.__iter_chunks(granularity, chunk_size, chunks):
+            yield matrices
+    
+    def __iter_chunks(self, granularity: int, chunk_size: int, chunks: Iterable[int] = None) -> Iterator[tuple[int, npt.NDArray]]:
+        #yields the position of the first matrix of each chunk along with its counts.
+        n = self.num_matrices(granularity)
+        starts = range(0, n, chunk_size) if chunks is None else (chunk * chunk_size for chunk in chunks)
+        for start in starts:
+            if not 0 <= start < n:
+                raise ValueError(f'The grid has no chunk starting at {start}; it holds {n} matrices.')
+            with instrumentation.phase('cm_generator.generate_array'):
+                matrices = self.__matrices_at(np.arange(start, min(start + chunk_size, n)), granularity)
+            instrumentation.count('matrices_generated', len(matrices))
+            instrumentation.record_array(matrices)
+            yield start, matrices
+    
+    def estimate_memory(self, granularity: int, mode: str = 'scores', return_points: bool = False, num_metrics: int = 1) -> int:
+        """Predicts the peak memory needed to generate (and score) a grid, without allocating it.
+
+        Args:
+            granularity (int): The number of values you wish to have on each axis.
+            mode (str, optional): What will be done with the grid. One of
+                'array' (generate_array),
+                'objects' (generate_cms),
+                'unique' (generate_cms with return_inverse), or
+                'scores' (score, in a single chunk).
+                Defaults to 'scores'.
+            return_points (bool, optional): For 'scores', whether the coordinates are also returned. Defaults to False.
+            num_metrics (int, optional): For 'scores', the number of metrics scored at once. Defaults to 1.
+
+        Returns:
+            int: The estimated peak number of bytes.
+        """
+        n = self.num_matrices(granularity)
+        outputs = n * self.__output_bytes(return_points, num_metrics)
+        
+        match mode:
+            case 'array':
+                return n * self.__array_bytes()
+            case 'objects':
+                return n * (self.__array_bytes() + _matrix_object_bytes(self.num_classes))
+            case 'unique':
+                #deduplication sorts a copy of the grid, and at worst every matrix is unique.
+                return n * (self.__array_bytes() + self.__unique_bytes() + _matrix_object_bytes(self.num_classes))
+            case 'scores':
+                return n * (self.__array_bytes() + self.__unique_bytes()) + outputs
+            case _:
+                raise ValueError(f'Unknown mode "{mode}". Use one of "array", "objects", "unique" or "scores".')
+    
+    def plan(self, granularity: int, memory_budget: int = None, keep_scores: bool = True, return_points: bool = False,
+             num_metrics: int = 1, deduplicate: bool = True) -> dict[str, int | str]:
+        """Decides how to score a grid within a memory budget.
+
+        If scoring the whole grid at once is predicted to exceed the budget, the grid is instead generated and
+        scored in chunks small enough to fit.
+
+        Args:
+            granularity (int): The number of values you wish to have on each axis.
+            memory_budget (int, optional): The number of bytes available. Defaults to None, i.e. unlimited.
+            keep_scores (bool, optional): Whether the scores of the whole grid are kept, as score does. Defaults to True.
+            return_points (bool, optional): Whether the coordinates of the whole grid are kept too. Defaults to False.
+            num_metrics (int, optional): The number of metrics scored at once. Defaults to 1.
+            deduplicate (bool, optional): Whether each chunk is deduplicated before it is scored. Defaults to True.
+
+        Returns:
+            dict[str, int | str]: The 'mode' ('in_memory' or 'chunked'), the 'chunk_size', and the 'estimated_bytes' of the in-memory plan.
+
+        Raises:
+            MemoryError: Even the scores of the grid do not fit within the budget.
+        """
+        n = self.num_matrices(granularity)
+        outputs = n * self.__output_bytes(return_points, num_metrics) if keep_scores else 0
+        unique_bytes = self.__unique_bytes() if deduplicate else 0
+        estimate = n * (self.__array_bytes() + unique_bytes) + outputs
+        
+        if memory_budget is None or estimate <= memory_budget:
+            return {'mode': 'in_memory', 'chunk_size': n, 'estimated_bytes': estimate}
+        
+        #each matrix of a chunk needs its counts, its share of deduplication, and its scores and coordinates.
+        per_matrix = self.__array_bytes() + unique_bytes + self.__output_bytes(True, num_metrics)
+        if return_points:
+            #the class sizes and rates the coordinates are computed from.
+            per_matrix += self.num_classes * (np.dtype(int).itemsize + self.policy.scores.itemsize)
+        chunk_size = (memory_budget - outputs) // per_matrix
+        if chunk_size < 1:
+            raise MemoryError(f'Scoring {n} matrices needs at least {outputs + per_matrix} bytes, '
+                              f'but the budget is {memory_budget} bytes.')
+        
+        return {'mode': 'chunked', 'chunk_size': int(chunk_size), 'estimated_bytes': estimate}
+    
+    def iter_scores(self, granularity: int, metric: Callable[[ConfusionMatrix], float] | list[Callable[[ConfusionMatrix], float]], chunk_size: int = None,
+                    n_jobs: int = None, return_points: bool = False, deduplicate: bool = None,
+                    chunks: Iterable[int] = None, pool: 'ScoringPool' = None) -> Iterator[tuple[slice, npt.NDArray] | tuple[slice, npt.NDArray, npt.NDArray]]:
+        """Generates and scores the grid chunk by chunk. Given a list of metrics, each chunk is generated once and
+        scored by all of them.
+
+        Unless every metric is batched, each chunk is deduplicated first, so every unique matrix within it is scored
+        once. Batched metrics score a whole chunk faster than it can be deduplicated, so they score it as generated.
+
+        Args:
+            granularity (int): The number of values you wish to have on each axis.
+            metric (Callable[[ConfusionMatrix], float] | list[Callable[[ConfusionMatrix], float]]): A metric taking a
+                ConfusionMatrix or a batched metric, or a list of them.
+            chunk_size (int, optional): The number of matrices in each chunk. Defaults to the whole grid.
+            n_jobs (int, optional): The number of processes to score with, or -1 for every core. Defaults to None, i.e. serially.
+            return_points (bool, optional): Whether to also yield the coordinates of each matrix. Defaults to False.
+            deduplicate (bool, optional): Whether to deduplicate each chunk. Defaults to None, i.e. unless every metric is batched.
+            chunks (Iterable[int], optional): The indices of the chunks to generate and score. Defaults to None, i.e. every chunk.
+            pool (ScoringPool, optional): A started pool holding the metrics that are not batched, to score with instead of
+                starting one. It is left open for the caller to close. Defaults to None.
+
+        Yields:
+            tuple[slice, npt.NDArray]: The positions of the chunk within the grid and their scores, with shape (M, chunk)
+                for a list of M metrics, followed by their coordinates if return_points is True.
+        """
+        from contingency_space.metrics import calculate_scores, is_batched
+        from contingency_space.scoring import ScoringPool, resolve_jobs
+        
+        k = self.num_classes
+        labels = tuple(self.n_per_class.keys())
+        chunk_size = chunk_size if chunk_size is not None else self.num_matrices(granularity)
+        deduplicate = self.__deduplicates(metric, deduplicate)
+        
+        #the processes scoring metrics that are not batched are started once, and reused by every chunk and metric.
+        #a pool given by the caller may be shared with other grids, so only a pool started here is closed here.
+        owns_pool = pool is None
+        if owns_pool:
+            metrics = metric if isinstance(metric, (list, tuple)) else [metric]
+            unbatched = [m for m in metrics if not is_batched(m)]
+            pool = ScoringPool(unbatched, n_jobs) if unbatched and resolve_jobs(n_jobs) > 1 else None
+        
+        try:
+            for start, matrices in self.__iter_chunks(granularity, chunk_size, chunks):
+                if deduplicate:
+                    with instrumentation.phase('cm_generator.unique'):
+                        unique, inverse = np.unique(matrices.reshape(len(matrices), -1), axis=0, return_inverse=True)
+                    instrumentation.count('unique_matrices_generated', len(unique))
+                    batch = CMBatch(unique.reshape(-1, k, k), labels, self.policy)
+                    #maps the scores (and coordinates) of the unique matrices back onto the chunk.
+                    index = inverse.reshape(-1)
+                else:
+                    batch = CMBatch(matrices, labels, self.policy)
+                    index = slice(None)
+                
+                if isinstance(metric, (list, tuple)):
+                    scores = np.stack([calculate_scores(batch, m, pool=pool) for m in metric])[:, index]
+                else:
+                    scores = calculate_scores(batch, metric, pool=pool)[index]
+                positions = slice(start, start + len(matrices))
+                
+                if return_points:
+                    yield positions, scores, batch.vectors()[index]
+                else:
+                    yield positions, scores
+        finally:
+            if owns_pool and pool is not None:
+                pool.close()
+    
+    @staticmethod
+    def __deduplicates(metric: Callable | list[Callable], deduplicate: bool = None) -> bool:
+        from contingency_space.metrics import is_batched
+        
+        if deduplicate is not None:
+            return deduplicate
+        metrics = metric if isinstance(metric, (list, tuple)) else [metric]
+        return not all(is_batched(m) for m in metrics)
+    
+    def score(self, granularity: int, metric: Callable[[ConfusionMatrix], float] | list[Callable[[ConfusionMatrix], float]], memory_budget: int = None,
+              n_jobs: int = None, return_points: bool = False, deduplicate: bool = None) -> npt.NDArray | tuple[npt.NDArray, npt.NDArray]:
+        """Scores every matrix of the grid, in the order of generate_array.
+        
+        If a memory budget is given and the grid would not fit within it, the grid is generated and scored in
+        chunks (see plan), and only the scores are kept.
+
+        Args:
+            granularity (int): The number of values you wish to have on each axis.
+            metric (Callable[[ConfusionMatrix], float] | list[Callable[[ConfusionMatrix], float]]): A metric taking a
+                ConfusionMatrix or a batched metric, or a list of them to score the grid with, generating it only once.
+            memory_budget (int, optional): The number of bytes available. Defaults to None, i.e. unlimited.
+            n_jobs (int, optional): The number of processes to score with, or -1 for every core. Defaults to None, i.e. serially.
+            return_points (bool, optional): Whether to also return the coordinates of each matrix. Defaults to False.
+            deduplicate (bool, optional): Whether to deduplicate the grid before scoring it (see iter_scores). Defaults to
+                None, i.e. unless every metric is batched.
+
+        Returns:
+            npt.NDArray: The score of each matrix, with shape (M, granularity^k) for a list of M metrics, and their
+                coordinates with shape (granularity^k, k) if return_points is True.
+        """
+        n = self.num_matrices(granularity)
+        num_metrics = len(metric) if isinstance(metric, (list, tuple)) else 1
+        deduplicate = self.__deduplicates(metric, deduplicate)
+        chunk_size = self.plan(granularity, memory_budget, return_points=return_points, num_metrics=num_metrics,
+                               deduplicate=deduplicate)['chunk_size']
+        
+        scores = np.empty((num_metrics, n) if isinstance(metric, (list, tuple)) else n, dtype=self.policy.scores)
+        points = np.empty((n, self.num_classes), dtype=self.policy.scores) if return_points else None
+        
+        for positions, *results in self.iter_scores(granularity, metric, chunk_size, n_jobs, return_points, deduplicate):
+            scores[..., positions] = results[0]
+            if return_points:
+                points[positions] = results[1]
+        
+        return (scores, points) if return_points else scores
+    
+    def __array_bytes(self) -> int:
+        #the counts of one matrix, plus its position and the rate indices, rates, hits and misses used to build it.
+        k = self.num_classes
+        return k * k * self.policy.counts.itemsize + 5 * k * np.dtype(int).itemsize + np.dtype(int).itemsize
+    
+    def __unique_bytes(self) -> int:
+        #np.unique sorts a copy of the rows, returns another, and keeps the sort order, a mask and the inverse index.
+        k = self.num_classes
+        return 2 * k * k * self.policy.counts.itemsize + 4 * np.dtype(int).itemsize + 1
+    
+    def __output_bytes(self, return_points: bool, num_metrics: int = 1) -> int:
+        return self.policy.scores.itemsize * (num_metrics + (self.num_classes if return_points else 0))
+    
+    def generate_batch(self, granularity: int) -> CMBatch:
+        """Generates the series of confusion matrices as a CMBatch.
+
+        Args:
+            granularity (int): The number of values you wish to have on each axis.
+
+        Returns:
+            CMBatch: The batch of granularity^k matrices, stored with the policy of the generator.
+        """
+        return CMBatch(self.generate_array(granularity), tuple(self.n_per_class.keys()), self.policy)
+
+    def generate_cms(self, granularity: int, return_inverse: bool = False) -> list[ConfusionMatrix] | tuple[list[ConfusionMatrix], npt.NDArray]:
         """Generates a series of confusion matrices.
+        
+        Integer truncation of the rates means small classes or a high granularity produce many identical matrices.
+        With `return_inverse`, only the unique matrices are built, alongside an index that maps every grid position
+        to its matrix (as np.unique(..., return_inverse=True) does). Scores computed once per unique matrix can then
+        be expanded back to the full grid with `scores[inverse]`.
 
         Args:
             granularity (int): The number of values you wish to have on each axis. 
+            return_inverse (bool, optional): Whether to return only the unique matrices and the inverse index. Defaults to False.
             
         Returns:
             (list[ConfusionMatrix]): The matrices generated. These can also by accessed by calling show_all_cms().
+            (tuple[list[ConfusionMatrix], npt.NDArray]): If return_inverse is True, the unique matrices and an array of
+                length granularity^k with the index of the unique matrix at each grid position. These are also stored
+                in `unique_cms` and `inverse`.
         """
-
-        #Generate every rate possible for each class.
-        all_rates: dict[str, list] = {}
-        for cls in self.n_per_class.keys():
-            all_rates.update({cls: np.linspace(0, self.n_per_class[cls], granularity, dtype=int)})
-            
-        #grab the values and make a list of every possible combination of the rates.
-        lists: list[list[int]] = all_rates.values()
-        combinations = list(itertools.product(*lists))
         
-        #zip the combinations back up with their keys. 
-        keys = all_rates.keys()
-        combinations_with_keys = [dict(zip(keys, comb)) for comb in combinations]
+        matrices = self.generate_array(granularity)
         
-        
-        #generate every possible matrix
-        for comb in combinations_with_keys:
-            matrix = ConfusionMatrix()
+        if return_inverse:
+            k = self.num_classes
+            with instrumentation.phase('cm_generator.unique'):
+                unique, inverse = np.unique(matrices.reshape(len(matrices), -1), axis=0, return_inverse=True)
             
-            #generate each row and insert it into the matrix
-            for i, (cls, hits) in enumerate(comb.items()):
-                row = []
-                
-                for j in range(self.num_classes):
-                    
-                    #if the loop is on the diagonal, append the number of successful hits.
-                    if i == j:
-                        row.append(int(hits))
-                        continue
-                    
-                    #otherwise, evenly spread the instances across the other cells.
-                    row.append((int((int(self.n_per_class[cls]) - int(hits)) / (self.num_classes - 1))))
-                    
-                matrix.add_class(cls, row)
-                
-                
-                
-            self.all_cms.append(matrix)
+            with instrumentation.phase('cm_generator.build_matrices'):
+                self.unique_cms = [self.__to_matrix(counts) for counts in unique.reshape(-1, k, k)]
+            self.inverse = inverse.reshape(-1)
+            
+            instrumentation.count('unique_matrices_generated', len(self.unique_cms))
+            return self.unique_cms, self.inverse
+        
+        with instrumentation.phase('cm_generator.build_matrices'):
+            self.all_cms.extend(self.__to_matrix(counts) for counts in matrices)
         
         return self.all_cms
+    
+    def __to_matrix(self, counts: npt.NDArray) -> ConfusionMatrix:
+        return ConfusionMatrix(dict(zip(self.n_per_class.keys(), counts.tolist())))
 
     def show_all_cms(self, limit: int = None):
         
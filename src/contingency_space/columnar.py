@@ -0,0 +1,276 @@
+import json
+import numpy as np
+import numpy.typing as npt
+from typing import Callable, Iterable
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.contingency_space import ContingencySpace
+from contingency_space.cm_batch import CMBatch
+from contingency_space.cm_generator import CMGenerator
+from contingency_space.dtype_policy import DTypePolicy
+from contingency_space.metrics import calculate_scores
+
+#the schema metadata key holding the class labels, in row order.
+LABELS_KEY = b'contingency_space.labels'
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError('Columnar export requires pyarrow. Install it with `pip install pyarrow`.') from e
+    return pa, pq
+
+
+def cell_column(real: str, pred: str) -> str:
+    """Returns the name of the column holding one cell of the matrices.
+
+    Args:
+        real (str): The real class, i.e. the row of the cell.
+        pred (str): The predicted class, i.e. the column of the cell.
+    """
+    return f'count_{real}_{pred}'
+
+
+def score_column(metric: str) -> str:
+    """Returns the name of the column holding the scores of a metric.
+    """
+    return f'score_{metric}'
+
+
+def batch_to_table(batch: CMBatch, keys: Iterable[str] = None, metrics: dict[str, Callable[[ConfusionMatrix], float]] = None,
+                   extra_columns: dict[str, npt.ArrayLike] = None):
+    """Converts a batch of matrices to an Arrow table with one column per cell and per metric.
+
+    Args:
+        batch (CMBatch): The matrices.
+        keys (Iterable[str], optional): A key for each matrix, stored in a 'key' column. Defaults to no key column.
+        metrics (dict[str, Callable[[ConfusionMatrix], float]], optional): Metrics to score the matrices with, by name. Defaults to None.
+        extra_columns (dict[str, npt.ArrayLike], optional): Additional columns, e.g. a grid position. Defaults to None.
+
+    Returns:
+        pyarrow.Table: The table. The class labels are stored in its schema metadata.
+    """
+    pa, _ = _require_pyarrow()
+
+    columns = {}
+    if keys is not None:
+        columns['key'] = pa.array([str(key) for key in keys], type=pa.string())
+    for name, values in (extra_columns or {}).items():
+        columns[name] = pa.array(np.asarray(values))
+
+    #a view of each cell across the batch; pyarrow copies it into a contiguous column.
+    for i, real in enumerate(batch.labels):
+        for j, pred in enumerate(batch.labels):
+            columns[cell_column(real, pred)] = pa.array(np.ascontiguousarray(batch.counts[:, i, j]))
+
+    for name, metric in (metrics or {}).items():
+        columns[score_column(name)] = pa.array(calculate_scores(batch, metric))
+
+    table = pa.table(columns)
+    return table.replace_schema_metadata({LABELS_KEY: json.dumps(list(batch.labels)).encode()})
+
+
+def table_to_batch(table, policy: DTypePolicy = None) -> CMBatch:
+    """Converts an Arrow table written by batch_to_table back into a batch.
+
+    Args:
+        table (pyarrow.Table): The table. Its schema metadata must hold the class labels.
+        policy (DTypePolicy, optional): The dtypes of the batch. Defaults to DEFAULT_POLICY.
+
+    Returns:
+        CMBatch: The matrices, in the order of the rows.
+    """
+    metadata = table.schema.metadata or {}
+    if LABELS_KEY not in metadata:
+        raise ValueError('The table has no class labels in its metadata. Was it written by batch_to_table?')
+    labels = json.loads(metadata[LABELS_KEY])
+
+    k = len(labels)
+    counts = np.empty((table.num_rows, k, k), dtype=np.int64)
+    for i, real in enumerate(labels):
+        for j, pred in enumerate(labels):
+            counts[:, i, j] = table.column(cell_column(real, pred)).to_numpy()
+
+    return CMBatch(counts, labels, policy)
+
+
+def space_to_table(space: ContingencySpace, metrics: dict[str, Callable[[ConfusionMatrix], float]] = None):
+    """Converts the history of a contingency space to an Arrow table, with the key of each matrix in a 'key' column.
+
+    Args:
+        space (ContingencySpace): The space.
+        metrics (dict[str, Callable[[ConfusionMatrix], float]], optional): Metrics to add a column for, by name. Defaults to None.
+
+    Returns:
+        pyarrow.Table: The table.
+    """
+    batch = CMBatch.from_matrices(list(space.matrices.values()), space.policy)
+    return batch_to_table(batch, keys=space.matrices.keys(), metrics=metrics)
+
+
+def table_to_space(table, policy: DTypePolicy = None) -> ContingencySpace:
+    """Converts an Arrow table written by space_to_table back into a contingency space.
+
+    Args:
+        table (pyarrow.Table): The table.
+        policy (DTypePolicy, optional): The dtypes of the space. Defaults to DEFAULT_POLICY.
+
+    Returns:
+        ContingencySpace: The space, with the matrices keyed as they were when written.
+    """
+    matrices = table_to_batch(table, policy).to_matrices()
+    if 'key' in table.column_names:
+        return ContingencySpace(dict(zip(table.column('key').to_pylist(), matrices)), policy)
+    return ContingencySpace(matrices, policy)
+
+
+class ParquetWriter:
+    """Writes batches of matrices to a Parquet file as they are produced, one row group per batch.
+
+    Use as a context manager::
+
+        with ParquetWriter('history.parquet', labels=('t', 'f'), metrics={'accuracy': accuracy}) as writer:
+            for step, batch in training:
+                writer.write(batch, keys=step)
+    """
+
+    def __init__(self, path: str, labels: tuple[str, ...] | list[str], metrics: dict[str, Callable[[ConfusionMatrix], float]] = None,
+                 keys: bool = True, extra_columns: dict[str, npt.DTypeLike] = None, compression: str = 'zstd'):
+        """Open a file for writing.
+
+        Args:
+            path (str): The Parquet file to write.
+            labels (tuple[str, ...] | list[str]): The class labels of every batch.
+            metrics (dict[str, Callable[[ConfusionMatrix], float]], optional): Metrics to add a column for, by name. Defaults to None.
+            keys (bool, optional): Whether each row has a 'key' column. Defaults to True.
+            extra_columns (dict[str, npt.DTypeLike], optional): Additional columns and their dtypes. Defaults to None.
+            compression (str, optional): The Parquet compression codec. Defaults to 'zstd'.
+        """
+        self.path: str = path
+        self.labels: tuple[str, ...] = tuple(labels)
+        self.metrics: dict[str, Callable[[ConfusionMatrix], float]] = dict(metrics or {})
+        self.keys: bool = keys
+        self.extra_columns: dict[str, npt.DTypeLike] = dict(extra_columns or {})
+        self.compression: str = compression
+        self.rows_written: int = 0
+        self.__writer = None
+
+    def write(self, batch: CMBatch, keys: Iterable[str] = None, extra_columns: dict[str, npt.ArrayLike] = None) -> None:
+        """Appends a batch as a new row group.
+
+        Args:
+            batch (CMBatch): The matrices. Their labels must match the labels of the writer.
+            keys (Iterable[str], optional): A key for each matrix. Required if the writer has a key column.
+            extra_columns (dict[str, npt.ArrayLike], optional): The values of the additional columns. Defaults to None.
+        """
+        if batch.labels != self.labels:
+            raise ValueError(f'Expected a batch with labels {self.labels}, got {batch.labels}.')
+        if self.keys and keys is None:
+            raise ValueError('This writer has a key column, so every batch needs keys.')
+
+        extra = {name: np.asarray((extra_columns or {})[name], dtype=dtype) for name, dtype in self.extra_columns.items()}
+        table = batch_to_table(batch, keys if self.keys else None, self.metrics, extra)
+
+        if self.__writer is None:
+            _, pq = _require_pyarrow()
+            self.__writer = pq.ParquetWriter(self.path, table.schema, compression=self.compression)
+
+        self.__writer.write_table(table)
+        self.rows_written += table.num_rows
+
+    def close(self) -> None:
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+
+    def __enter__(self) -> 'ParquetWriter':
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.close()
+        return False
+
+
+def write_space(space: ContingencySpace, path: str, metrics: dict[str, Callable[[ConfusionMatrix], float]] = None, row_group_size: int = 65536) -> None:
+    """Writes the history of a contingency space to a Parquet file.
+
+    Args:
+        space (ContingencySpace): The space.
+        path (str): The Parquet file to write.
+        metrics (dict[str, Callable[[ConfusionMatrix], float]], optional): Metrics to add a column for, by name. Defaults to None.
+        row_group_size (int, optional): The number of matrices per row group. Defaults to 65536.
+    """
+    keys = list(space.matrices.keys())
+    matrices = list(space.matrices.values())
+    if not matrices:
+        raise ValueError('The space has no history to write.')
+
+    labels = tuple(matrices[0].matrix.keys())
+    with ParquetWriter(path, labels, metrics) as writer:
+        for start in range(0, len(matrices), row_group_size):
+            stop = start + row_group_size
+            writer.write(CMBatch.from_matrices(matrices[start:stop], space.policy), keys[start:stop])
+
+
+def write_grid(generator: CMGenerator, granularity: int, path: str, metrics: dict[str, Callable[[ConfusionMatrix], float]] = None,
+               chunk_size: int = None, memory_budget: int = None) -> int:
+    """Generates a grid and writes it, with the score surface of each metric, to a Parquet file.
+
+    The grid is generated, scored and written one chunk at a time, each chunk as its own row group, so it never
+    has to be held in memory at once. Each row holds the 'position' of the matrix in the grid, its counts, and
+    its score for each metric.
+
+    Args:
+        generator (CMGenerator): The generator of the grid.
+        granularity (int): The number of values along each axis.
+        path (str): The Parquet file to write.
+        metrics (dict[str, Callable[[ConfusionMatrix], float]], optional): Metrics to add a column for, by name. Defaults to None.
+        chunk_size (int, optional): The number of matrices per row group. Defaults to what fits in the memory budget.
+        memory_budget (int, optional): The number of bytes available. Defaults to None, i.e. unlimited.
+
+    Returns:
+        int: The number of matrices written.
+    """
+    if chunk_size is None:
+        chunk_size = min(generator.plan(granularity, memory_budget, keep_scores=False)['chunk_size'], 1 << 20)
+
+    labels = tuple(generator.n_per_class.keys())
+    start = 0
+    with ParquetWriter(path, labels, metrics, keys=False, extra_columns={'position': np.int64}) as writer:
+        for counts in generator.iter_arrays(granularity, chunk_size):
+            positions = np.arange(start, start + len(counts))
+            writer.write(CMBatch(counts, labels, generator.policy), extra_columns={'position': positions})
+            start += len(counts)
+
+    return start
+
+
+def read_batch(path: str, filters=None, policy: DTypePolicy = None) -> CMBatch:
+    """Reads the matrices of a Parquet file written by this module.
+
+    Args:
+        path (str): The Parquet file, or a directory of them.
+        filters (optional): Row filters pushed down to the reader, e.g. [('score_accuracy', '>', 0.9)]. Defaults to None.
+        policy (DTypePolicy, optional): The dtypes of the batch. Defaults to DEFAULT_POLICY.
+
+    Returns:
+        CMBatch: The matrices of the rows that pass the filters.
+    """
+    _, pq = _require_pyarrow()
+    return table_to_batch(pq.read_table(path, filters=filters), policy)
+
+
+def read_space(path: str, filters=None, policy: DTypePolicy = None) -> ContingencySpace:
+    """Reads a contingency space written by write_space.
+
+    Args:
+        path (str): The Parquet file.
+        filters (optional): Row filters pushed down to the reader, e.g. [('key', 'in', ['10', '20'])]. Defaults to None.
+        policy (DTypePolicy, optional): The dtypes of the space. Defaults to DEFAULT_POLICY.
+
+    Returns:
+        ContingencySpace: The space, with the matrices of the rows that pass the filters.
+    """
+    _, pq = _require_pyarrow()
+    return table_to_space(pq.read_table(path, filters=filters), policy)
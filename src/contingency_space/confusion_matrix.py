@@ -7,10 +7,61 @@ from typing import Callable
 # this is an edit placed here in notepad.
 
 
+def normalize_counts(counts: npt.ArrayLike, dtype: npt.DTypeLike = np.float64) -> npt.NDArray:
+    """Divides every row of one or more matrices by its sum.
+
+    Args:
+        counts (npt.ArrayLike): The counts, of shape (k, k) or (N, k, k).
+        dtype (npt.DTypeLike, optional): The floating point dtype of the result. Defaults to np.float64.
+
+    Returns:
+        npt.NDArray: The normalized matrices, with the shape of counts. Rows with no instances are left as zeros.
+    """
+    counts = np.asarray(counts)
+    sizes = counts.sum(axis=-1, keepdims=True)
+
+    normalized = np.zeros(counts.shape, dtype=dtype)
+    np.divide(counts, sizes, out=normalized, where=sizes != 0)
+    return normalized
+
+
+def one_vs_rest_counts(counts: npt.ArrayLike) -> npt.NDArray:
+    """Decomposes one or more matrices into a binary matrix per class, that class against all the others.
+
+    The binary matrix of class i is [[tp, fn], [fp, tn]], where tp is its count on the diagonal, fn its missed
+    classifications (see ConfusionMatrix.get_missed_classifications), fp its wrong classifications (see
+    ConfusionMatrix.get_wrong_classifications) and tn every other instance.
+
+    Args:
+        counts (npt.ArrayLike): The counts, of shape (k, k) or (N, k, k).
+
+    Returns:
+        npt.NDArray: The binary matrices, of shape (k, 2, 2) or (N, k, 2, 2). Integer counts are summed in int64,
+            since the cells of the rest of the classes can outgrow a compact counts dtype.
+    """
+    counts = np.asarray(counts)
+    counts = counts.astype(np.promote_types(counts.dtype, np.int64), copy=False)
+    true = np.diagonal(counts, axis1=-2, axis2=-1)
+    real = counts.sum(axis=-1)
+    predicted = counts.sum(axis=-2)
+    total = real.sum(axis=-1, keepdims=True)
+
+    binary = np.empty(true.shape + (2, 2), dtype=counts.dtype)
+    binary[..., 0, 0] = true
+    binary[..., 0, 1] = real - true
+    binary[..., 1, 0] = predicted - true
+    binary[..., 1, 1] = total - real - predicted + true
+    return binary
+
+
 class ConfusionMatrix:
     """
     Confusion matrix class for multi-class problems.
     """
+    
+    #the cached result of normalized(). declared here too so matrices pickled before it existed still load.
+    __normalized: npt.NDArray | None = None
+    
     def __init__(self, table: dict[str, list[int]]={}):
         """
         The class constructor.
@@ -48,6 +99,7 @@ class ConfusionMatrix:
         for k, v in self.__table.items():
             self.class_freqs.update({k: int(np.sum(np.array(v)))})
         self.dim = len(self.class_freqs.keys())
+        self.__normalized: npt.NDArray | None = None
 
     def add_class(self, cls: str, values: list[int]) -> None:
         """Adds a row to the matrix. Do not use this function unless you are building
@@ -60,6 +112,7 @@ class ConfusionMatrix:
         self.__table.update({cls: values})
         self.class_freqs.update({cls: int(np.sum(np.array(values)))})
         self.__num_classes += 1
+        self.__normalized = None
         
     def normalize(self):
         """
@@ -71,14 +124,28 @@ class ConfusionMatrix:
                     a  | 30  60  10      =>          a  |0.3 0.6 0.1
              (real) b  | 60  20  20      =>   (real) b  |0.6 0.2 0.2
                     c  | 30  20  50      =>          c  |0.3 0.2 0.5
+        
+        Rows with no instances are left as zeros. To read the normalized matrix without modifying this one, use normalized().
         """
         
+        normalized = self.normalized()
+        self.__table = {cls: row.tolist() for cls, row in zip(self.__table.keys(), normalized)}
+        self.class_freqs = {cls: int(freq != 0) for cls, freq in self.class_freqs.items()}
+    
+    def normalized(self) -> npt.NDArray:
+        """Returns the matrix with every row divided by its sum, as in normalize(), without modifying this matrix.
         
-        cm_normalized = {}
-        for k, freqs in self.__table.items():
-            norm_freqs = [e / self.class_freqs[k] if self.class_freqs[k] != 0 else 0 for e in freqs]
-            cm_normalized.update({k: norm_freqs})
-        self.__init__(cm_normalized)
+        The result is computed once and cached until the matrix is changed through add_class or by assigning to
+        `matrix`, so it is returned as a read-only array. Rows with no instances are left as zeros.
+
+        Returns:
+            npt.NDArray: The normalized matrix, of shape (k, k).
+        """
+        if self.__normalized is None:
+            normalized = normalize_counts(self.array())
+            normalized.flags.writeable = False
+            self.__normalized = normalized
+        return self.__normalized
 
     def get_total_true(self, per_class: bool = False) -> int | dict[str, int]:
         """ Returns the total number of true classifications in the matrix.
@@ -247,7 +314,10 @@ class ConfusionMatrix:
         rates.reverse() # flip to (tnr, tpr)
             
         if metric is not None:
-            if metric.__module__.startswith('sklearn'):
+            if getattr(metric, 'batched', False) is True:
+                #vectorized metrics score a batch of matrices, so pass this one as a batch of one.
+                rates.append(metric(cm[np.newaxis])[0])
+            elif metric.__module__.startswith('sklearn'):
                 true_labels, predicted_labels = self.labels()
                 rates.append(true_labels, predicted_labels)
             else:
@@ -317,6 +387,7 @@ class ConfusionMatrix:
                 raise ValueError("Number of elements in each row must match the number of classes in the original matrix.")
             
         self.__table = new_table
+        self.__normalized = None
     
     @property
     def num_classes(self):
@@ -353,8 +424,8 @@ class ConfusionMatrix:
     def __eq__(self, other) -> bool:
         """Compares this CM with another CM. 
         
-        Returns whether the frequencies in this matrix match the frequencies of
-        another matrix.
+        Returns whether the class labels and every cell of this matrix match those
+        of another matrix.
 
         Args:
             other (CM): 
@@ -362,17 +433,118 @@ class ConfusionMatrix:
 
         Returns:
             bool: 
-                Returns True if the frequencies of the given matrices match, and
+                Returns True if the labels and frequencies of the given matrices match, and
                 False if they do not.
         """
-        if other.__class__ is self.__class__:
-            for this_freq, that_freq in zip(self.class_freqs, other.class_freqs):
-                if this_freq != that_freq:
-                    return False
-            return True
-        else:
+        if not isinstance(other, ConfusionMatrix):
             return NotImplemented
+        if other is self:
+            return True
+        if tuple(self.matrix.keys()) != tuple(other.matrix.keys()):
+            return False
         
+        this, that = self.array(), other.array()
+        return this.shape == that.shape and bool(np.array_equal(this, that))
+    
+    def freeze(self) -> 'FrozenConfusionMatrix':
+        """Returns an immutable, hashable copy of this matrix.
+
+        Returns:
+            FrozenConfusionMatrix: A frozen matrix with the same labels and counts.
+        """
+        return FrozenConfusionMatrix(self.matrix)
+
+
+class FrozenConfusionMatrix(ConfusionMatrix):
+    """
+    An immutable confusion matrix.
+    
+    The counts are stored once as a read-only numpy array alongside a tuple of the class labels, so
+    the matrix can be hashed and used as a key in dictionaries and sets. The hash is computed on first
+    use and cached. Any attempt to modify the matrix raises a TypeError.
+    """
+    def __init__(self, table: dict[str, list[int]]={}):
+        """
+        The class constructor. Takes the same table as ConfusionMatrix.
+        
+        :param table: a dictionary with all class names as keys and their corresponding frequencies
+        as values.
+        """
+        super().__init__(table)
+        
+        self.__labels: tuple[str, ...] = tuple(table.keys())
+        self.__counts: npt.NDArray = np.array([list(row) for row in table.values()])
+        self.__counts.flags.writeable = False
+        self.__hash: int | None = None
+    
+    def add_class(self, cls: str, values: list[int]) -> None:
+        raise TypeError('FrozenConfusionMatrix is immutable.')
+    
+    def normalize(self):
+        raise TypeError('FrozenConfusionMatrix is immutable. Use ConfusionMatrix.normalize on a mutable copy instead.')
+    
+    def thaw(self) -> ConfusionMatrix:
+        """Returns a mutable copy of this matrix.
+
+        Returns:
+            ConfusionMatrix: A mutable matrix with the same labels and counts.
+        """
+        return ConfusionMatrix(self.matrix)
+    
+    def freeze(self) -> 'FrozenConfusionMatrix':
+        return self
+    
+    def array(self) -> npt.NDArray:
+        """Returns the matrix as a read-only numpy array. The array is not copied.
+
+        Returns:
+            npt.NDArray: A numpy array representation of the FrozenConfusionMatrix.
+        """
+        return self.__counts
+    
+    def get_matrix(self):
+        return self.__counts
+    
+    @property
+    def class_labels(self) -> tuple[str, ...]:
+        return self.__labels
+    
+    @property
+    def matrix(self):
+        #hand out a copy so the rows cannot be modified through the returned dict.
+        return {cls: list(row) for cls, row in super().matrix.items()}
+    @matrix.setter
+    def matrix(self, new_table = dict[str, list[int]]):
+        raise TypeError('FrozenConfusionMatrix is immutable.')
+    
+    def __getitem__(self, index: str, give_index: bool = False):
+        result = super().__getitem__(index, give_index)
+        if give_index == True:
+            return (list(result[0]), result[1])
+        return list(result)
+    
+    def __eq__(self, other) -> bool:
+        if isinstance(other, FrozenConfusionMatrix):
+            if other is self:
+                return True
+            if self.__hash is not None and other.__hash is not None and self.__hash != other.__hash:
+                return False
+            return (self.__labels == other.__labels 
+                    and self.__counts.shape == other.__counts.shape 
+                    and bool(np.array_equal(self.__counts, other.__counts)))
+        return super().__eq__(other)
+    
+    def __hash__(self) -> int:
+        if self.__hash is None:
+            counts = self.__counts
+            #matrices that compare equal must hash equal, so integral float counts hash like ints.
+            if counts.dtype.kind == 'f' and np.all(np.mod(counts, 1) == 0):
+                counts = counts.astype(np.int64)
+            elif counts.dtype.kind in 'iub':
+                counts = counts.astype(np.int64, copy=False)
+            self.__hash = hash((self.__labels, counts.shape, counts.tobytes()))
+        return self.__hash
+    
     
 if __name__ == "__main__":
     matrix_1 = ConfusionMatrix({
@@ -1,8 +1,15 @@
 import copy
+import threading
+from collections import deque
 import pandas as pd
 import numpy as np
+import numpy.typing as npt
 from contingency_space.confusion_matrix import ConfusionMatrix
-from typing import Callable
+from contingency_space.cm_batch import CMBatch
+from contingency_space.dtype_policy import DTypePolicy, DEFAULT_POLICY
+from contingency_space.metric_cache import SurfaceCache, default_surface_cache
+from contingency_space import instrumentation
+from typing import Callable, Iterable
 
 class ContingencySpace:
     """ 
@@ -25,35 +32,156 @@ class ContingencySpace:
             print(f'--[{index}]-----------------------------------------')
             print(matrix) #adapt to show 
     
-    def add_history(self, values: list | dict):
-        """Add a history entry.
+    def add_history(self, values: list | dict | ConfusionMatrix):
+        """Add a history entry. Safe to call from several threads at once.
 
         Args:
             values: 
-                the rates at which the model performed. Can either be a list with the rates of a single model 
-                or a dictionary consisting of multiple models with associated keys.
+                the matrices of the model. Can either be a single ConfusionMatrix or a list of them, which are keyed
+                by their position in the history, or a dictionary consisting of multiple models with associated keys.
             
         """
         match values:
+            case ConfusionMatrix():
+                self.add_history([values])
+                return
             case list():
-                #add to the dict, generate a key.
-                
-                #if the number of classes does not match, throw an error to the user <-- to be implemented
-                
-                
-                index: int = len(self.matrices.keys())
-                self.matrices.update({str(index), values})
+                #add to the dict, generating a key for each matrix. the key is taken under the lock so that two
+                #threads appending at once never compute the same one.
+                with self.__lock:
+                    self.__check_classes(values)
+                    for matrix in values:
+                        #skip over keys already taken, e.g. by matrices added with keys of their own.
+                        index = len(self.matrices)
+                        while str(index) in self.matrices:
+                            index += 1
+                        self.matrices.update({str(index): matrix})
+                    self.__version += 1
                 return
             case dict():
                 #add all rows to the dict
-                
-                for key, matrix in values.items():
-                    self.matrices.update({key: matrix})
-
+                with self.__lock:
+                    self.__check_classes(values.values())
+                    for key, matrix in values.items():
+                        self.matrices.update({key: matrix})
+                    self.__version += 1
                 return
             case _:
-                print('Something has gone wrong. You must pass a list or dictionary of ConfusionMatrix')
-                return
+                raise TypeError('You must pass a ConfusionMatrix, or a list or dictionary of ConfusionMatrix.')
+    
+    def __check_classes(self, matrices: Iterable[ConfusionMatrix]) -> None:
+        #the number of classes is taken from the first matrix and must then remain the same. every matrix is
+        #checked before any is added, so a mismatched one leaves the history unchanged.
+        matrices = list(matrices)
+        if not matrices:
+            return
+        
+        num_classes = self.num_classes if self.matrices else matrices[0].num_classes
+        if any(matrix.num_classes != num_classes for matrix in matrices):
+            raise ValueError('Number of classes must remain the same over every matrix.')
+        self.num_classes = num_classes
+    
+    def log(self, step: int, matrix: ConfusionMatrix) -> None:
+        """Buffer the matrix of a training step, to be added to the history by the next commit().
+        
+        Each thread logs into its own buffer, so many threads can log at a high rate without contending for a lock.
+        The matrices are not visible in the history until commit() is called.
+
+        Args:
+            step (int): The step of the matrix. It is used as the key of the matrix and to order the history.
+            matrix (ConfusionMatrix): The matrix.
+        """
+        shard = getattr(self.__local, 'shard', None)
+        if shard is None:
+            shard = self.__local.shard = deque()
+            with self.__lock:
+                self.__shards.append(shard)
+        
+        #deque.append is atomic, so commit() can drain the buffer while this thread keeps logging.
+        shard.append((step, matrix))
+    
+    def commit(self) -> int:
+        """Add every matrix buffered by log() to the history, in order of step.
+        
+        Matrices logged while the commit runs are left for the next one. To keep the history ordered by step
+        across commits, commit once every thread has logged the steps in question, e.g. at the end of an epoch.
+
+        Raises:
+            ValueError: If a step is logged twice or is already in the history, or a matrix has a different number of
+                classes than the history. Nothing is added in that case.
+
+        Returns:
+            int: The number of matrices added.
+        """
+        with self.__lock:
+            pending = []
+            for shard in self.__shards:
+                for _ in range(len(shard)):
+                    pending.append(shard.popleft())
+            
+            #sorting is stable and the buffers are visited in a fixed order, so the history is deterministic.
+            pending.sort(key=lambda entry: entry[0])
+            
+            keys = [str(step) for step, _ in pending]
+            try:
+                if len(set(keys)) != len(keys) or any(key in self.matrices for key in keys):
+                    raise ValueError('Every step must be logged once and must not already be in the history.')
+                self.__check_classes(matrix for _, matrix in pending)
+            except ValueError:
+                #put the matrices back so that the caller can resolve the conflict without losing them.
+                self.__shards[0].extendleft(reversed(pending))
+                raise
+            
+            for key, (_, matrix) in zip(keys, pending):
+                self.matrices[key] = matrix
+            self.__version += 1
+        
+        return len(pending)
+    
+    def __getstate__(self) -> dict:
+        #locks and thread-local buffers cannot be pickled; uncommitted matrices are not part of the history.
+        state = self.__dict__.copy()
+        for name in ('_ContingencySpace__lock', '_ContingencySpace__local', '_ContingencySpace__shards', '_ContingencySpace__batch'):
+            state.pop(name, None)
+        return state
+    
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        #spaces pickled before they had a policy use the default one.
+        self.__dict__.setdefault('policy', DEFAULT_POLICY)
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__shards = []
+        self.__version = 0
+        self.__batch = None
+    
+    def __cached(self) -> tuple[CMBatch, npt.NDArray]:
+        #the batch and coordinates of the history, rebuilt only when the history has changed since the last call.
+        key = (self.__version, len(self.matrices))
+        cached = self.__batch
+        if cached is None or cached[0] != key:
+            batch = CMBatch.from_matrices(list(self.matrices.values()), self.policy)
+            cached = self.__batch = (key, batch, batch.vectors())
+        return cached[1], cached[2]
+    
+    def batch(self) -> CMBatch:
+        """Returns the history as a batch of matrices, in order.
+        
+        The batch is cached until the history changes through add_history or commit, so repeated calls (e.g. to
+        visualize the same space several times) do not rebuild it.
+
+        Returns:
+            CMBatch: The matrices of the history.
+        """
+        return self.__cached()[0]
+    
+    def coordinates(self) -> npt.NDArray:
+        """Returns the position of every matrix of the history within the space, with shape (N, k).
+        
+        The coordinates are ordered as in ConfusionMatrix.vector, i.e. (tnr, tpr) for binary problems, and are
+        cached along with batch().
+        """
+        return self.__cached()[1]
     
     def grab_entry(self, key: int | str) -> ConfusionMatrix | None:
         """
@@ -76,6 +204,7 @@ class ContingencySpace:
         
         return self.matrices[str(key)]
     
+    @instrumentation.timed('contingency_space.learning_path_length_2D')
     def learning_path_length_2D(self, points: tuple[str, str]) -> float:
         """Calculate the learning path between the first and last points given. Currently only works for binary classification problems.
         
@@ -116,6 +245,7 @@ class ContingencySpace:
         
         return distance_traveled
     
+    @instrumentation.timed('contingency_space.learning_path_length_3D')
     def learning_path_length_3D(self, points: tuple[str, str], metric: Callable[[ConfusionMatrix], float]) -> float:
         """Calculate the learning path between the first and last points given, using an accuracy metric to determine a third dimension. Currently only works for binary classification problems. 
 
@@ -157,6 +287,7 @@ class ContingencySpace:
             distance_traveled += d
             previous_key = key
         
+        instrumentation.count('metric_calls', 2 * (last_matrix_index - first_matrix_index))
         return distance_traveled
     
     def learning_path(self, points: tuple[str, str], metric: Callable[[ConfusionMatrix], float] = None) -> float:
@@ -175,17 +306,19 @@ class ContingencySpace:
             
         self.learning_path_length_3D()
         
+    @instrumentation.timed('contingency_space.visualize')
     def visualize(self, metric: Callable[[ConfusionMatrix], float] | list[Callable[[ConfusionMatrix], float]], step_size: int = 30, ax=None, projection: str = '2d', **kwargs):
 
         """Visualize the contingency space in 2D or 3D.
         
         Args:
             metric (Callable): 
-                The metric to be used to determine the z-axis. If a list of metrics is provided, the user will be prompted to select one.
+                The metric to be used to determine the z-axis. If a list of metrics is provided, the grid is generated and
+                scored by every metric at once, and each metric is drawn in its own subplot, with shared axes in 2D.
             step_size (int): 
                 The granularity of the space. Defaults to 30.
             ax (matplotlib.axes._subplots.AxesSubplot): 
-                The axes to plot on. If not provided, a new figure will be created.
+                The axes to plot on, or one per metric if a list of metrics is provided. If not provided, a new figure will be created.
             projection (str): 
                 The projection to use. Can be either '2d' or '3d'. Defaults to '2d'.
             fig_size (tuple):
@@ -196,6 +329,30 @@ class ContingencySpace:
                 Whether to draw lines between the points. Defaults to True.
             title (str):
                 The title of the plot. Defaults to None.
+            n_jobs (int):
+                The number of processes to score the surface with, or -1 for every core. Defaults to None, i.e. serially.
+            memory_budget (int):
+                The number of bytes generating the surface may use. Past it, the surface is scored in chunks. Defaults to None, i.e. unlimited.
+            max_points (int):
+                The largest number of points of the history drawn when lines is True. Longer histories are simplified first. Defaults to 2000.
+            path_tolerance (float):
+                The largest distance, in rates, between a dropped point and the simplified path. Defaults to 0.0.
+            simplify (str):
+                How histories are simplified: 'rdp' (Ramer-Douglas-Peucker) or 'resample'. See contingency_space.paths. Defaults to 'rdp'.
+            density (str):
+                Draw the models as a density layer instead of individual points, for spaces holding many models (e.g. a
+                hyperparameter sweep): 'hist2d' for a 2D histogram at the resolution of the surface, or 'hexbin'. Only
+                available in 2D. Defaults to None, i.e. draw every point.
+            density_cmap (str):
+                The colormap of the density layer. Defaults to 'magma'.
+            ncols (int):
+                The number of columns of subplots when a list of metrics is provided. Defaults to at most 4.
+            surface (tuple):
+                The (scores, points) of the grid, as returned by CMGenerator.score(step_size, metric, return_points=True),
+                to draw instead of generating it. Defaults to None.
+            surface_cache (SurfaceCache):
+                The cache of the surfaces already drawn, keyed by class sizes, step size and metric, or None to always
+                generate the surface. Defaults to contingency_space.metric_cache.default_surface_cache.
         """
         
         point_size_list = [kwargs.get('point_size') for _ in range(len(self.matrices.keys()))]
@@ -204,12 +361,31 @@ class ContingencySpace:
         lines = kwargs.get('lines', True)
         title = kwargs.get('title', None)
         lines = kwargs.get('lines', True)
+        n_jobs = kwargs.get('n_jobs', None)
+        memory_budget = kwargs.get('memory_budget', None)
+        max_points = kwargs.get('max_points', 2000)
+        path_tolerance = kwargs.get('path_tolerance', 0.0)
+        simplify_method = kwargs.get('simplify', 'rdp')
+        density = kwargs.get('density', None)
+        density_cmap = kwargs.get('density_cmap', 'magma')
+        surface = kwargs.get('surface', None)
+        surface_cache = kwargs.get('surface_cache', default_surface_cache)
+        
+        if density not in (None, 'hist2d', 'hexbin'):
+            raise ValueError(f"Unknown density mode {density!r}. Expected 'hist2d' or 'hexbin'.")
+        if density is not None and projection != '2d':
+            raise ValueError('Density rendering is only available in 2D.')
         
         import matplotlib.pyplot as plt
-        from contingency_space.cm_generator import CMGenerator
+        from matplotlib.colors import LogNorm
+        from contingency_space.metrics import calculate_scores
+        from contingency_space.paths import simplify
         
         point_size_list = [point_size for _ in range(len(self.matrices.keys()))]
         
+        if isinstance(metric, (list, tuple)):
+            return self.__visualize_metrics(list(metric), step_size, ax, projection, **kwargs)
+        
         # Generate the space we will draw the points on.
         # ----------------------------------------------
         example_matrix: ConfusionMatrix = list(self.matrices.values())[0]
@@ -218,37 +394,31 @@ class ContingencySpace:
         matrix_instances = {cls: sum(row) for (cls, row) in example_matrix.matrix.items()}
         matrix_instances_per_class_list = [x for x in matrix_instances.values()]
         
+        if surface is not None:
+            base_scores, base_points = surface
+        else:
+            base_scores, base_points = self.__base_surfaces([metric], step_size, memory_budget, n_jobs, surface_cache)
+            base_scores = base_scores[0]
         
-        generator = CMGenerator(self.num_classes, instances_per_class = matrix_instances)
-        generator.generate_cms(granularity=step_size)
-        
-        base_matrices = generator.all_cms
-
-        
-        
-        base_points = [matrix.vector(metric=metric) for matrix in base_matrices]
-        
-        base_x = [x*matrix_instances_per_class_list[1] for x, y, z in base_points]
-        base_y = [y*matrix_instances_per_class_list[0] for x, y, z in base_points]
-        base_z = [z for x, y, z in base_points]
-        
-        
-        base_x = np.array(base_x[:step_size]) # every nth element
-        base_y = np.array(base_y[::step_size])  # first n elements
-        base_z = np.array(base_z).reshape((step_size, step_size))
+        base_x = base_points[:step_size, 0] * matrix_instances_per_class_list[1] # first n elements
+        base_y = base_points[::step_size, 1] * matrix_instances_per_class_list[0] # every nth element
+        base_z = base_scores.reshape((step_size, step_size))
         
         base_x_mesh, base_y_mesh = np.meshgrid(base_x, base_y)
         
-        space_matrix_points = [matrix.vector(metric=metric) for matrix in self.matrices.values()]
-        
-        
-        # deconstruct tuple
-        model_points_x, model_points_y, model_points_z = map(list, zip(*space_matrix_points))
+        with instrumentation.phase('visualize.model_points'):
+            model_points = self.coordinates()
+            if projection == '3d':
+                model_points = np.column_stack([model_points, calculate_scores(self.batch(), metric, dtype=self.policy.scores)])
+            
+            #a long history is drawn as a simplified path, keeping the points that best preserve its shape.
+            if density is None and lines and len(model_points) > max_points:
+                model_points = simplify(model_points, max_points, path_tolerance, method=simplify_method)
         
         # rescale values
-        model_points_x = [x * matrix_instances_per_class_list[1] for x in model_points_x]
-        model_points_y = [y * matrix_instances_per_class_list[0] for y in model_points_y]
-        model_points_z = [round(z, 2) for z in model_points_z]
+        model_points_x = model_points[:, 0] * matrix_instances_per_class_list[1]
+        model_points_y = model_points[:, 1] * matrix_instances_per_class_list[0]
+        model_points_z = np.round(model_points[:, 2], 2) if projection == '3d' else None
         
         match projection:
             case '2d':
@@ -272,6 +442,8 @@ class ContingencySpace:
                     base_x_mesh, base_y_mesh = np.meshgrid(base_x, base_y)
                     
                     surf = ax.plot_surface(base_x_mesh, base_y_mesh, base_z, cmap='twilight_shifted', vmin=-1, vmax=1, alpha=1)
+                    if title is not None:
+                        ax.set_title(title)
                 else:
                     fig = plt.figure(figsize=fig_size)
                     ax = fig.add_subplot(111, projection='3d')
@@ -281,6 +453,20 @@ class ContingencySpace:
                     surf = ax.plot_surface(base_x_mesh, base_y_mesh, base_z, cmap='twilight_shifted', vmin=-1, vmax=1, alpha=1)
         
         match projection:
+            case '2d' if density is not None:
+                #bin every model at once rather than drawing one marker each; empty bins are left transparent.
+                target = ax if ax is not None else plt.gca()
+                extent = (0, matrix_instances_per_class_list[1], 0, matrix_instances_per_class_list[0])
+                
+                with instrumentation.phase('visualize.density'):
+                    match density:
+                        case 'hist2d':
+                            counts, _, _ = np.histogram2d(model_points_x, model_points_y, bins=step_size, range=[extent[:2], extent[2:]])
+                            target.imshow(np.ma.masked_equal(counts.T, 0), origin='lower', extent=extent, aspect='auto',
+                                          cmap=density_cmap, norm=LogNorm(vmin=1), interpolation='nearest', zorder=2)
+                        case 'hexbin':
+                            target.hexbin(model_points_x, model_points_y, gridsize=step_size, extent=extent, mincnt=1,
+                                          bins='log', cmap=density_cmap, zorder=2)
             case '2d':
                 if ax is not None:
                     if lines:
@@ -301,9 +487,63 @@ class ContingencySpace:
         
         if ax is None:
             plt.show()
+    
+    def __base_surfaces(self, metrics: list[Callable[[ConfusionMatrix], float]], step_size: int, memory_budget: int = None,
+                        n_jobs: int = None, cache: SurfaceCache | None = default_surface_cache) -> tuple[npt.NDArray, npt.NDArray]:
+        #the scores of the grid drawn under the history, with shape (M, step_size^2), and the coordinates of the grid.
+        from contingency_space.cm_generator import CMGenerator
+        
+        example_matrix: ConfusionMatrix = list(self.matrices.values())[0]
+        matrix_instances = {cls: sum(row) for (cls, row) in example_matrix.matrix.items()}
+        
+        with instrumentation.phase('visualize.base_grid'):
+            if cache is not None:
+                return cache.surfaces(matrix_instances, step_size, metrics, self.policy, memory_budget, n_jobs)
+            
+            #score each unique matrix of the grid once, in chunks if the grid would not fit within the memory budget.
+            generator = CMGenerator(self.num_classes, instances_per_class = matrix_instances, policy = self.policy)
+            return generator.score(step_size, metrics, memory_budget=memory_budget, n_jobs=n_jobs, return_points=True)
+    
+    def __visualize_metrics(self, metrics: list[Callable[[ConfusionMatrix], float]], step_size: int, ax, projection: str, **kwargs):
+        #draw one subplot per metric, generating the grid once and scoring it with every metric in the same pass.
+        import matplotlib.pyplot as plt
+        
+        if len(metrics) == 0:
+            raise ValueError('At least one metric is needed to visualize the space.')
+        
+        base_scores, base_points = self.__base_surfaces(metrics, step_size, kwargs.get('memory_budget', None), kwargs.get('n_jobs', None),
+                                                        kwargs.get('surface_cache', default_surface_cache))
+        
+        title = kwargs.pop('title', None)
+        ncols = kwargs.pop('ncols', min(len(metrics), 4))
+        kwargs.pop('surface', None)
+        
+        if ax is None:
+            nrows = -(-len(metrics) // ncols)
+            width, height = kwargs.get('fig_size', (5, 5))
+            #3D axes cannot share their axes, but are drawn over the same grid so their limits match regardless.
+            fig, axes = plt.subplots(nrows, ncols, figsize=(width * ncols, height * nrows), squeeze=False,
+                                     sharex=projection == '2d', sharey=projection == '2d',
+                                     subplot_kw={'projection': '3d'} if projection == '3d' else None)
+            axes = axes.ravel()
+            for unused in axes[len(metrics):]:
+                unused.set_visible(False)
+            if title is not None:
+                fig.suptitle(title)
+        else:
+            axes = np.ravel(ax)
+            if len(axes) < len(metrics):
+                raise ValueError(f'Expected an axis per metric, got {len(axes)} axes for {len(metrics)} metrics.')
+        
+        for metric, scores, target in zip(metrics, base_scores, axes):
+            self.visualize(metric, step_size, ax=target, projection=projection, surface=(scores, base_points),
+                           title=getattr(metric, '__name__', repr(metric)), **kwargs)
+        
+        if ax is None:
+            plt.show()
         
         
-    def __init__(self, matrices: dict[str, ConfusionMatrix] | list[ConfusionMatrix] = None):
+    def __init__(self, matrices: dict[str, ConfusionMatrix] | list[ConfusionMatrix] = None, policy: DTypePolicy = None):
         """
         
         The constructor for the contingency space.
@@ -314,9 +554,17 @@ class ContingencySpace:
         
         Args:
             matrices: A pre-defined set of models and their values to be plotted on the contingency space. If one is not provided, an empty dictionary will be generated.
+            policy: The dtypes used for the counts and scores computed from the space, e.g. the surface drawn by visualize. Defaults to DEFAULT_POLICY.
         
         """
         
+        self.policy: DTypePolicy = policy if policy is not None else DEFAULT_POLICY
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__shards: list[deque] = []
+        self.__version: int = 0
+        self.__batch: tuple[tuple[int, int], CMBatch, npt.NDArray] | None = None
+        
         #If the user has passed in matrices, copy them to the object. Otherwise, initialize an empty dictionary.
         
         if not matrices:
@@ -328,16 +576,13 @@ class ContingencySpace:
             match matrices:
                 case list():
                     #generate keys for each ConfusionMatrix
+                    self.__check_classes(matrices)
                     for index, cm in enumerate(matrices):
                         self.matrices.update({str(index): cm})
-                        if self.num_classes != cm.num_classes:
-                            if self.num_classes == 0:
-                                self.num_classes = cm.num_classes
-                            else:
-                                raise ValueError('Number of classes must remain the same over every matrix.')
                 case dict():
-                    self.matrices = copy.deepcopy(matrices)
                     # add num classes
+                    self.__check_classes(matrices.values())
+                    self.matrices = copy.deepcopy(matrices)
                     
                     
             
@@ -0,0 +1,106 @@
+import numpy as np
+import numpy.typing as npt
+
+
+class DTypePolicy:
+    """The dtypes used to store counts and scores.
+
+    Every array of counts (generated grids, batches of matrices) is stored with the `counts` dtype, and every
+    array of scores or coordinates (metric results, surfaces) with the `scores` dtype. Counts are checked
+    against the range of the integer dtype before they are stored, so a compact dtype can never silently wrap.
+    """
+
+    def __init__(self, counts: npt.DTypeLike = np.int64, scores: npt.DTypeLike = np.float64):
+        """Create a policy.
+
+        Args:
+            counts (npt.DTypeLike, optional): An integer dtype for counts. Defaults to np.int64.
+            scores (npt.DTypeLike, optional): A floating point dtype for scores and coordinates. Defaults to np.float64.
+        """
+        self.counts: np.dtype = np.dtype(counts)
+        self.scores: np.dtype = np.dtype(scores)
+
+        if self.counts.kind not in 'iu':
+            raise TypeError(f'The counts dtype must be an integer type, not {self.counts}.')
+        if self.scores.kind != 'f':
+            raise TypeError(f'The scores dtype must be a floating point type, not {self.scores}.')
+
+    @classmethod
+    def fit(cls, max_count: int, scores: npt.DTypeLike = np.float32) -> 'DTypePolicy':
+        """Returns the most compact policy that can hold counts up to `max_count`.
+
+        Args:
+            max_count (int): The largest count that will be stored.
+            scores (npt.DTypeLike, optional): The dtype for scores. Defaults to np.float32.
+
+        Returns:
+            DTypePolicy: A policy using the smallest signed integer type that fits `max_count`.
+        """
+        for counts in (np.int8, np.int16, np.int32, np.int64):
+            if max_count <= np.iinfo(counts).max:
+                return cls(counts, scores)
+        raise OverflowError(f'Counts of up to {max_count} do not fit in any supported integer type.')
+
+    def check_counts(self, max_count: int, min_count: int = 0) -> None:
+        """Checks that counts within the given range can be stored with this policy.
+
+        Args:
+            max_count (int): The largest count that will be stored.
+            min_count (int, optional): The smallest count that will be stored. Defaults to 0.
+
+        Raises:
+            OverflowError: The counts do not fit in the counts dtype.
+        """
+        info = np.iinfo(self.counts)
+        if max_count > info.max or min_count < info.min:
+            raise OverflowError(f'Counts in [{min_count}, {max_count}] do not fit in {self.counts} '
+                                f'(range [{info.min}, {info.max}]). Use a wider counts dtype.')
+
+    def counts_array(self, values: npt.ArrayLike) -> npt.NDArray:
+        """Converts values to an array of counts, checking that they fit first.
+
+        Args:
+            values (npt.ArrayLike): The counts.
+
+        Returns:
+            npt.NDArray: The counts, with the counts dtype.
+
+        Raises:
+            ValueError: The values are not whole numbers, e.g. 2.7 or NaN, which casting would silently truncate.
+            OverflowError: The counts do not fit in the counts dtype.
+        """
+        values = np.asarray(values)
+        if values.dtype.kind == 'f' and not np.array_equal(values, np.trunc(values)):
+            raise ValueError('Counts must be whole numbers. Round them first if that is intended.')
+        if values.size > 0 and values.dtype != self.counts:
+            self.check_counts(int(values.max()), int(values.min()))
+        return values.astype(self.counts, copy=False)
+
+    def scores_array(self, values: npt.ArrayLike) -> npt.NDArray:
+        """Converts values to an array of scores.
+
+        Args:
+            values (npt.ArrayLike): The scores.
+
+        Returns:
+            npt.NDArray: The scores, with the scores dtype.
+        """
+        return np.asarray(values, dtype=self.scores)
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is self.__class__:
+            return self.counts == other.counts and self.scores == other.scores
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((self.counts, self.scores))
+
+    def __repr__(self) -> str:
+        return f'DTypePolicy(counts={self.counts}, scores={self.scores})'
+
+
+#NumPy's defaults, used when no policy is given.
+DEFAULT_POLICY = DTypePolicy(np.int64, np.float64)
+
+#half the memory and bandwidth of the defaults.
+COMPACT_POLICY = DTypePolicy(np.int32, np.float32)
@@ -1,37 +1,18 @@
 import numpy as np
+import numpy.typing as npt
 import pandas as pd
 import matplotlib.pyplot as plt
-from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.confusion_matrix import ConfusionMatrix, normalize_counts
+from contingency_space.cm_batch import CMBatch
 from contingency_space.cm_generator import CMGenerator
+from contingency_space.dtype_policy import DTypePolicy
+from contingency_space.metrics import calculate_scores, is_batched
+from contingency_space.scoring import ScoringPool, resolve_jobs
+from contingency_space import instrumentation
 from typing import Callable, Optional
 
-def calculate_scores(matrices: list[ConfusionMatrix], metric: Callable[[ConfusionMatrix], float]) -> list[float]:
-    all_scores = []
-    for cm in matrices:
-        m = metric(cm)
-        all_scores.append(m)
-    return all_scores
-
-def imbalance_sensitivity(imbalance: int | str | tuple[int, int], metric: Callable[[ConfusionMatrix], float], granularity: Optional[int] = 15) -> float:
-    """Calculates the sensitivity of a given metric to a given imbalance ratio. Only works for binary
-    classification problems. 
-
-    Args:
-        imbalance (float | int): An integer representing the larger half of the imbalance ratio, or float containing the numerator and denominator
-        metric (Callable[[ConfusionMatrix], float]): A function that calculates a metric given a Confusion Matrix. Should return a float. 
-        granularity (int, optional): The number of points along each axis to generate confusion matrices from. Defaults to 15.
-
-    Returns:
-        float: A value representing the sensitivity of the given metric to the imbalance ratio. 
-        The range may vary depending on the metric function passed. 
-        
-    Raises:
-        ValueError: 
-            An error occurred while attempting to process the ratio passed.
-        TypeError:
-            The type of input passed is not valid.
-    """
-    num_classes = 2
+def _parse_ratio(imbalance: int | str | tuple[int, int]) -> tuple[int, int]:
+    #parses an imbalance ratio into the size of the first class relative to the second.
     numerator = 1
     denominator = 1
     
@@ -61,38 +42,154 @@ def imbalance_sensitivity(imbalance: int | str | tuple[int, int], metric: Callab
                 raise TypeError('Values in tuple must be of type int.')
         case _:
             raise TypeError("Check valid types for imbalance ratio")
+    
+    if numerator < 1 or denominator < 1:
+        raise ValueError('Both parts of the ratio must be positive.')
+        
+    return numerator, denominator
+
+
+def imbalance_sensitivity(imbalance: int | str | tuple[int, int], metric: Callable[[ConfusionMatrix], float], granularity: Optional[int] = 15, policy: Optional[DTypePolicy] = None, n_jobs: Optional[int] = None, memory_budget: Optional[int] = None) -> float:
+    """Calculates the sensitivity of a given metric to a given imbalance ratio. Only works for binary
+    classification problems. 
+
+    Args:
+        imbalance (float | int): An integer representing the larger half of the imbalance ratio, or float containing the numerator and denominator
+        metric (Callable[[ConfusionMatrix], float]): A function that calculates a metric given a Confusion Matrix. Should return a float. 
+        granularity (int, optional): The number of points along each axis to generate confusion matrices from. Defaults to 15.
+        policy (DTypePolicy, optional): The dtypes used for the generated counts and their scores. Defaults to DEFAULT_POLICY.
+        n_jobs (int, optional): The number of processes to score the matrices with, or -1 for every core. Defaults to None, i.e. serially.
+        memory_budget (int, optional): The number of bytes the calculation may use. If generating the grids at once would exceed it,
+            they are generated and scored in chunks instead (see CMGenerator.plan). Defaults to None, i.e. unlimited.
+
+    Returns:
+        float: A value representing the sensitivity of the given metric to the imbalance ratio. 
+        The range may vary depending on the metric function passed. 
         
+    Raises:
+        ValueError: 
+            An error occurred while attempting to process the ratio passed.
+        TypeError:
+            The type of input passed is not valid.
+    """
+    num_classes = 2
+    numerator, denominator = _parse_ratio(imbalance)
+    
     power: int = 0
     
-    #ensure the parts of the ratio are of suitable size for the calculation
-    while numerator < 1000 or not (numerator.is_integer() and denominator.is_integer()):
+    #ensure the parts of the ratio are of suitable size for the calculation. they are integers already.
+    while numerator < 1000:
         numerator *= 10
         denominator *= 10
         power += 1
     
-    #generate the imbalanced matrices
     n_per_class_imbalanced: dict[str, int] = {'t': numerator, 'f': denominator}
-    matrices_imbalanced = CMGenerator(num_classes, n_per_class_imbalanced)
-    matrices_imbalanced.generate_cms(granularity)
-    
-    #generate the balanced matrices
     n_per_class_balanced: dict[str, int] = {'t': int((denominator / 2)*1000), 'f': int((denominator / 2)*1000)}
-    matrices_balanced = CMGenerator(num_classes, n_per_class_balanced)
-    matrices_balanced.generate_cms(granularity)
+    matrices_imbalanced = CMGenerator(num_classes, n_per_class_imbalanced, policy)
+    matrices_balanced = CMGenerator(num_classes, n_per_class_balanced, policy)
     
-    #calculate the scores for all cms
-    imbalanced_scores: list[float] = calculate_scores(matrices_imbalanced.all_cms, metric)
-    balanced_scores: list[float] = calculate_scores(matrices_balanced.all_cms, metric)
+    #both grids are scored side by side, so each gets half of the budget.
+    chunk_size = None
+    if memory_budget is not None:
+        chunk_size = matrices_imbalanced.plan(granularity, memory_budget // 2, keep_scores=False)['chunk_size']
     
-    #re-organize the matrices so that they are aligned as they belong on a contingency space
-    imbalanced_scores_as_mat = np.flip(np.array(imbalanced_scores).reshape((granularity, granularity)), 0)
-    balanced_scores_as_mat = np.flip(np.array(balanced_scores).reshape((granularity, granularity)), 0)
-
+    #both grids are scored by one pool of processes, rather than a pool each.
+    pool = ScoringPool([metric], n_jobs) if not is_batched(metric) and resolve_jobs(n_jobs) > 1 else None
+    
+    try:
+        #generate and score the grids chunk by chunk, scoring each unique matrix of a chunk once.
+        imbalanced_chunks = matrices_imbalanced.iter_scores(granularity, metric, chunk_size, n_jobs, pool=pool)
+        balanced_chunks = matrices_balanced.iter_scores(granularity, metric, chunk_size, n_jobs, pool=pool)
+        
+        #pairwise difference between points. Both grids are laid out identically, so the points can be compared
+        #in generation order rather than as they belong on a contingency space.
+        total_difference = 0.0
+        with instrumentation.phase('imbalance_sensitivity.score'):
+            for (_, imbalanced_scores), (_, balanced_scores) in zip(imbalanced_chunks, balanced_chunks):
+                total_difference += np.sum(np.abs(imbalanced_scores - balanced_scores))
+    finally:
+        if pool is not None:
+            pool.close()
     
-    #pairwise difference between points
-    differences = imbalanced_scores_as_mat - balanced_scores_as_mat
-    #return the 
-    return np.sum(np.abs(differences)) / pow(granularity, num_classes)
+    return total_difference / pow(granularity, num_classes)
+
+def shift_priors(matrices: ConfusionMatrix | list[ConfusionMatrix] | CMBatch, ratios: list[int | str | tuple[int, int]] | npt.NDArray,
+                 total: Optional[int] = None, policy: Optional[DTypePolicy] = None) -> CMBatch:
+    """Rescales the rows of each matrix to the class priors of each imbalance ratio, keeping the rate at which
+    every class is classified as each other class.
+
+    This is how the matrix of a trained model would change if it were evaluated on data with other class priors.
+    Every (matrix, ratio) pair is computed in a single broadcast operation.
+
+    Args:
+        matrices (ConfusionMatrix | list[ConfusionMatrix] | CMBatch): The N matrices to shift.
+        ratios (list[int | str | tuple[int, int]] | npt.NDArray): R binary imbalance ratios, in any form imbalance_sensitivity
+            accepts, or an array of shape (R, k) holding the relative size of each class for each ratio.
+        total (int, optional): The number of instances in each shifted matrix. Defaults to None, i.e. the total of the matrix shifted.
+        policy (DTypePolicy, optional): The dtypes of the shifted batch. Defaults to the policy of the batch, or DEFAULT_POLICY.
+
+    Returns:
+        CMBatch: The N * R shifted matrices, every ratio of the first matrix followed by every ratio of the second, and so on.
+            The counts are rounded to the nearest integer, and rows of classes with no instances stay empty.
+
+    Raises:
+        ValueError: The ratios do not match the number of classes, or are not positive.
+    """
+    match matrices:
+        case CMBatch():
+            batch = matrices
+        case ConfusionMatrix():
+            batch = CMBatch.from_matrices([matrices], policy)
+        case _:
+            batch = CMBatch.from_matrices(list(matrices), policy)
+    policy = policy if policy is not None else batch.policy
+
+    if isinstance(ratios, np.ndarray) and ratios.ndim == 2:
+        sizes = ratios.astype(np.float64)
+    else:
+        sizes = np.array([_parse_ratio(ratio) for ratio in ratios], dtype=np.float64)
+    if sizes.shape[1:] != (batch.num_classes,):
+        raise ValueError(f'Expected ratios of {batch.num_classes} classes, got shape {sizes.shape}.')
+    if (sizes <= 0).any():
+        raise ValueError('Every part of an imbalance ratio must be positive.')
+    priors = sizes / sizes.sum(axis=1, keepdims=True)
+
+    if total is None:
+        totals = batch.counts.sum(axis=(1, 2)).astype(np.float64)
+    else:
+        totals = np.full(len(batch), total, dtype=np.float64)
+
+    #(N, 1, k, k) rows of rates times (1, R, k, 1) priors times (N, 1, 1, 1) totals.
+    rows = normalize_counts(batch.counts, np.float64)[:, np.newaxis]
+    shifted = rows * priors[np.newaxis, :, :, np.newaxis] * totals[:, np.newaxis, np.newaxis, np.newaxis]
+
+    k = batch.num_classes
+    return CMBatch(np.rint(shifted).reshape(-1, k, k), batch.labels, policy)
+
+
+def prior_shift_curve(matrices: ConfusionMatrix | list[ConfusionMatrix] | CMBatch, ratios: list[int | str | tuple[int, int]] | npt.NDArray,
+                      metric: Callable[[ConfusionMatrix], float], total: Optional[int] = None, policy: Optional[DTypePolicy] = None,
+                      n_jobs: Optional[int] = None) -> npt.NDArray:
+    """Scores each matrix as it would be under each imbalance ratio (see shift_priors), giving a metric-vs-ratio
+    curve per model.
+
+    Args:
+        matrices (ConfusionMatrix | list[ConfusionMatrix] | CMBatch): The N matrices, e.g. one per trained model.
+        ratios (list[int | str | tuple[int, int]] | npt.NDArray): The R imbalance ratios, or an array of shape (R, k) of relative class sizes.
+        metric (Callable[[ConfusionMatrix], float]): A metric taking a ConfusionMatrix, or a batched metric.
+        total (int, optional): The number of instances in each shifted matrix. Defaults to None, i.e. the total of the matrix shifted.
+            A larger total reduces the error of rounding the shifted counts.
+        policy (DTypePolicy, optional): The dtypes of the shifted matrices and their scores. Defaults to the policy of the batch, or DEFAULT_POLICY.
+        n_jobs (int, optional): The number of processes to score with, or -1 for every core. Defaults to None, i.e. serially.
+
+    Returns:
+        npt.NDArray: The scores, of shape (N, R).
+    """
+    shifted = shift_priors(matrices, ratios, total, policy)
+    with instrumentation.phase('imbalance_sensitivity.prior_shift'):
+        scores = calculate_scores(shifted, metric, n_jobs=n_jobs)
+    return scores.reshape(-1, len(ratios))
+
 
 if __name__ == "__main__":
     res = imbalance_sensitivity((1, 16), accuracy)
@@ -0,0 +1,177 @@
+import json
+import time
+import threading
+import functools
+import contextlib
+import numpy.typing as npt
+from typing import Callable, Iterator
+
+
+class Stats:
+    """Timings and counters recorded while instrumentation is enabled.
+
+    Phases are named sections of work (e.g. 'imbalance_sensitivity.score'); for each one the number of
+    calls, the total time and the longest single call are kept. Counters hold event totals such as
+    'matrices_generated', 'metric_calls' and 'cache_hits'. The size of the largest array recorded is kept
+    as 'peak_array_bytes'.
+    """
+
+    def __init__(self):
+        self.phases: dict[str, dict[str, float]] = {}
+        self.counters: dict[str, int] = {}
+        self.peak_array_bytes: int = 0
+        self.__lock = threading.Lock()
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self.__lock:
+            phase = self.phases.setdefault(name, {'calls': 0, 'total_s': 0.0, 'max_s': 0.0})
+            phase['calls'] += 1
+            phase['total_s'] += seconds
+            phase['max_s'] = max(phase['max_s'], seconds)
+
+    def add_count(self, name: str, n: int = 1) -> None:
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_array(self, nbytes: int) -> None:
+        with self.__lock:
+            self.peak_array_bytes = max(self.peak_array_bytes, nbytes)
+
+    def reset(self) -> None:
+        """Clears every phase and counter.
+        """
+        with self.__lock:
+            self.phases.clear()
+            self.counters.clear()
+            self.peak_array_bytes = 0
+
+    def to_dict(self) -> dict:
+        """Returns the statistics as a dictionary of plain values.
+        """
+        with self.__lock:
+            return {'phases': {name: dict(phase) for name, phase in self.phases.items()},
+                    'counters': dict(self.counters),
+                    'peak_array_bytes': self.peak_array_bytes}
+
+    def to_json(self, path: str = None, indent: int = 2) -> str:
+        """Returns the statistics as JSON, also writing them to a file if a path is given.
+
+        Args:
+            path (str, optional): The file to write to. Defaults to None.
+            indent (int, optional): The indentation of the JSON. Defaults to 2.
+
+        Returns:
+            str: The JSON document.
+        """
+        document = json.dumps(self.to_dict(), indent=indent)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(document)
+        return document
+
+    def __repr__(self) -> str:
+        return f'Stats({self.to_dict()})'
+
+
+#the stats being recorded into, or None while instrumentation is disabled.
+_active: Stats | None = None
+
+#returned by phase() while disabled, so a disabled phase costs one global lookup and no allocation.
+_disabled_phase = contextlib.nullcontext()
+
+
+def enabled() -> bool:
+    """Returns whether instrumentation is currently enabled.
+    """
+    return _active is not None
+
+
+@contextlib.contextmanager
+def instrument(stats: Stats = None) -> Iterator[Stats]:
+    """Enables instrumentation for the duration of a with block::
+
+        with instrument() as stats:
+            imbalance_sensitivity((1, 16), metric)
+        stats.to_json('stats.json')
+
+    Instrumentation is process-wide: work done by any thread inside the block is recorded.
+
+    Args:
+        stats (Stats, optional): The stats to record into, e.g. to accumulate over several blocks. Defaults to a new Stats.
+
+    Yields:
+        Stats: The stats being recorded into.
+    """
+    global _active
+
+    stats = stats if stats is not None else Stats()
+    previous, _active = _active, stats
+    try:
+        yield stats
+    finally:
+        _active = previous
+
+
+class _Phase:
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats: Stats, name: str):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add_phase(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def phase(name: str) -> contextlib.AbstractContextManager:
+    """Times a section of work as the named phase::
+
+        with phase('cm_generator.generate_array'):
+            ...
+
+    Args:
+        name (str): The name of the phase.
+    """
+    stats = _active
+    if stats is None:
+        return _disabled_phase
+    return _Phase(stats, name)
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Decorator that times every call of a function as the named phase.
+
+    Args:
+        name (str): The name of the phase.
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            stats = _active
+            if stats is None:
+                return fn(*args, **kwargs)
+            with _Phase(stats, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, n: int = 1) -> None:
+    """Adds n to the named counter.
+    """
+    stats = _active
+    if stats is not None:
+        stats.add_count(name, n)
+
+
+def record_array(array: npt.NDArray) -> None:
+    """Records the size of an array, keeping track of the largest one.
+    """
+    stats = _active
+    if stats is not None:
+        stats.add_array(array.nbytes)
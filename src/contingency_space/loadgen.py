@@ -0,0 +1,111 @@
+import io
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+from contingency_space.service import ScoringServer, ScoringService
+
+
+async def _client(host: str, port: int, client_id: int, requests: int, matrices_per_request: int, num_classes: int,
+                  binary: bool, latencies: list[float], rng: np.random.Generator) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    run = f'run-{client_id}'
+
+    try:
+        for _ in range(requests):
+            counts = rng.integers(0, 500, size=(matrices_per_request, num_classes, num_classes))
+
+            if binary:
+                buffer = io.BytesIO()
+                np.save(buffer, counts)
+                body = buffer.getvalue()
+                head = f'POST /score?run={run} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/octet-stream\r\n'
+            else:
+                body = json.dumps({'run': run, 'matrices': counts.tolist()}).encode()
+                head = f'POST /score HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+
+            start = time.perf_counter()
+            writer.write(f'{head}Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+            await writer.drain()
+
+            response_head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+            length = next(int(line.split(':', 1)[1]) for line in response_head.split('\r\n') if line.lower().startswith('content-length:'))
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+
+            if not response_head.startswith('HTTP/1.1 200'):
+                raise RuntimeError(f'Request failed: {response_head.splitlines()[0]}')
+    finally:
+        writer.close()
+
+
+async def run_load(host: str = '127.0.0.1', port: int = None, clients: int = 32, requests: int = 200, matrices_per_request: int = 1,
+                   num_classes: int = 2, binary: bool = False, window: float = 0.002, seed: int = 0) -> dict[str, float]:
+    """Sends concurrent scoring requests to a service and measures its latency and throughput.
+
+    Args:
+        host (str, optional): The address of the service. Defaults to '127.0.0.1'.
+        port (int, optional): The port of the service. If None, a service is started on a free local port for the duration of the run.
+        clients (int, optional): The number of concurrent clients, each on its own connection and run. Defaults to 32.
+        requests (int, optional): The number of requests sent by each client, one after the other. Defaults to 200.
+        matrices_per_request (int, optional): The number of matrices in each request. Defaults to 1.
+        num_classes (int, optional): The number of classes of each matrix. Defaults to 2.
+        binary (bool, optional): Whether to send .npy bodies instead of JSON. Defaults to False.
+        window (float, optional): The batching window of the service started when port is None. Defaults to 0.002.
+        seed (int, optional): The seed used to generate the matrices. Defaults to 0.
+
+    Returns:
+        dict[str, float]: The p50, p99 and max latency in milliseconds, the requests and matrices per second,
+            and the mean batch size if the service was started locally.
+    """
+    server = None
+    if port is None:
+        server = ScoringServer(ScoringService(window=window), host, 0)
+        await server.start()
+        port = server.port
+
+    latencies: list[float] = []
+    rng = np.random.default_rng(seed)
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*[_client(host, port, i, requests, matrices_per_request, num_classes, binary, latencies, rng)
+                               for i in range(clients)])
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            stats = server.service.stats()
+            await server.close()
+
+    latencies_ms = np.array(latencies) * 1000
+    report = {'requests': len(latencies),
+              'p50_ms': float(np.percentile(latencies_ms, 50)),
+              'p99_ms': float(np.percentile(latencies_ms, 99)),
+              'max_ms': float(latencies_ms.max()),
+              'requests_per_s': len(latencies) / elapsed,
+              'matrices_per_s': len(latencies) * matrices_per_request / elapsed}
+    if server is not None:
+        report['mean_batch_size'] = stats['mean_batch_size']
+    return report
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description='Generate load against the contingency space scoring service.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None, help='port of a running service. If omitted, one is started locally.')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200, help='requests per client.')
+    parser.add_argument('--matrices', type=int, default=1, help='matrices per request.')
+    parser.add_argument('--classes', type=int, default=2)
+    parser.add_argument('--binary', action='store_true', help='send .npy bodies instead of JSON.')
+    parser.add_argument('--window', type=float, default=0.002, help='batching window of the local service, in seconds.')
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args.host, args.port, args.clients, args.requests, args.matrices, args.classes, args.binary, args.window))
+    for key, value in report.items():
+        print(f'{key:>16}: {value:.3f}' if isinstance(value, float) else f'{key:>16}: {value}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import numpy as np
+import numpy.typing as npt
+from typing import Iterable
+from contingency_space.cm_batch import CMBatch
+from contingency_space.contingency_space import ContingencySpace
+from contingency_space.dtype_policy import DTypePolicy
+
+#a history in the form merge() works on: the key of each matrix, and the matrices in the same order.
+KeyedBatch = tuple[list[str], CMBatch]
+
+
+def _as_keyed_batch(history: ContingencySpace | KeyedBatch, policy: DTypePolicy = None) -> KeyedBatch:
+    match history:
+        case ContingencySpace():
+            return list(history.matrices.keys()), CMBatch.from_matrices(list(history.matrices.values()), policy)
+        case (keys, CMBatch() as batch):
+            keys = list(map(str, keys))
+            if len(keys) != len(batch):
+                raise ValueError(f'Got {len(keys)} keys for {len(batch)} matrices.')
+            return keys, batch
+        case _:
+            raise TypeError('A history must be a ContingencySpace or a (keys, CMBatch) pair.')
+
+
+def _order(keys: npt.NDArray, first_seen: npt.NDArray) -> npt.NDArray:
+    #steps are ordered numerically when every key is an integer, otherwise by first appearance.
+    try:
+        steps = keys.astype(np.int64)
+    except ValueError:
+        return np.argsort(first_seen, kind='stable')
+    return np.argsort(steps, kind='stable')
+
+
+def merge_counts(counts: npt.ArrayLike, weights: npt.ArrayLike = None) -> npt.NDArray:
+    """Reduces aligned histories of counts, of shape (R, S, k, k), into one of shape (S, k, k).
+
+    Args:
+        counts (npt.ArrayLike): The counts of R histories that hold the same S steps, in the same order.
+        weights (npt.ArrayLike, optional): A weight for each history. Defaults to None, i.e. the counts are summed.
+
+    Returns:
+        npt.NDArray: The summed counts, or the weighted sum rounded to the nearest count if weights are given.
+    """
+    counts = np.asarray(counts)
+    if counts.ndim != 4:
+        raise ValueError(f'Counts must be of shape (R, S, k, k), not {counts.shape}.')
+
+    if weights is None:
+        return counts.sum(axis=0)
+
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.shape != (counts.shape[0],):
+        raise ValueError(f'Expected {counts.shape[0]} weights, got {weights.shape}.')
+    return np.rint(np.tensordot(weights, counts, axes=1))
+
+
+def merge(histories: list[ContingencySpace | KeyedBatch], weights: npt.ArrayLike = None, join: str = 'outer',
+          policy: DTypePolicy = None) -> KeyedBatch:
+    """Aligns histories by the key of each step and reduces the matrices of each step into one.
+
+    This is the operation used to combine the partial matrices each rank computes during distributed evaluation.
+    When every history holds the same keys in the same order they are stacked and reduced at once; otherwise the
+    matrices of every history are scattered into their step in a single pass.
+
+    Args:
+        histories (list[ContingencySpace | KeyedBatch]): The histories, as spaces or (keys, CMBatch) pairs with the same classes.
+        weights (npt.ArrayLike, optional): A weight for each history. Defaults to None, i.e. the counts are summed.
+            Weighted counts are rounded to the nearest count.
+        join (str, optional): 'outer' to keep every step, reducing over the histories that hold it, or 'inner' to keep
+            only the steps held by every history. Defaults to 'outer'.
+        policy (DTypePolicy, optional): The dtypes of the merged batch. Defaults to DEFAULT_POLICY.
+
+    Returns:
+        KeyedBatch: The keys of the merged steps, ordered numerically when every key is an integer and by first
+            appearance otherwise, and the merged matrices.
+    """
+    if join not in ('outer', 'inner'):
+        raise ValueError(f"join must be 'outer' or 'inner', not {join!r}.")
+    if len(histories) == 0:
+        raise ValueError('At least one history is needed to merge.')
+
+    histories = [_as_keyed_batch(history, policy) for history in histories]
+    labels = histories[0][1].labels
+    if any(batch.labels != labels for _, batch in histories):
+        raise ValueError('Every history must have the same classes.')
+
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.shape != (len(histories),):
+            raise ValueError(f'Expected {len(histories)} weights, got {weights.shape}.')
+
+    keys = histories[0][0]
+    if all(other == keys for other, _ in histories[1:]):
+        #the histories are aligned already, so reduce the stacked counts directly.
+        merged = merge_counts(np.stack([batch.counts for _, batch in histories]), weights)
+        order = _order(np.asarray(keys), np.arange(len(keys)))
+        return [keys[i] for i in order], CMBatch(merged[order], labels, policy)
+
+    all_keys = np.concatenate([np.asarray(keys, dtype=str) for keys, _ in histories])
+    unique, first_seen, inverse = np.unique(all_keys, return_index=True, return_inverse=True)
+
+    k = len(labels)
+    flat = np.concatenate([batch.counts.reshape(-1, k * k) for _, batch in histories])
+    if weights is not None:
+        row_weights = np.repeat(weights, [len(batch) for _, batch in histories])
+        flat = flat * row_weights[:, np.newaxis]
+
+    #one bincount per cell sums every matrix into its step.
+    merged = np.empty((len(unique), k * k), dtype=np.float64 if weights is not None else flat.dtype)
+    for cell in range(k * k):
+        merged[:, cell] = np.bincount(inverse, weights=flat[:, cell], minlength=len(unique))
+    if weights is not None:
+        merged = np.rint(merged)
+
+    keep = np.arange(len(unique))
+    if join == 'inner':
+        keep = np.flatnonzero(np.bincount(inverse, minlength=len(unique)) == len(histories))
+
+    keep = keep[_order(unique[keep], first_seen[keep])]
+    return unique[keep].tolist(), CMBatch(merged[keep].reshape(-1, k, k), labels, policy)
+
+
+def merge_histories(histories: list[ContingencySpace | KeyedBatch], weights: npt.ArrayLike = None, join: str = 'outer',
+                    policy: DTypePolicy = None) -> ContingencySpace:
+    """Merges histories as merge() does, returning the result as a contingency space.
+
+    Args:
+        histories (list[ContingencySpace | KeyedBatch]): The histories.
+        weights (npt.ArrayLike, optional): A weight for each history. Defaults to None, i.e. the counts are summed.
+        join (str, optional): 'outer' or 'inner'. Defaults to 'outer'.
+        policy (DTypePolicy, optional): The dtypes of the space. Defaults to DEFAULT_POLICY.
+
+    Returns:
+        ContingencySpace: The merged space.
+    """
+    keys, batch = merge(histories, weights, join, policy)
+    return ContingencySpace(dict(zip(keys, batch.to_matrices())), policy)
+
+
+def tree_reduce(histories: Iterable[ContingencySpace | KeyedBatch], weights: npt.ArrayLike = None, fanout: int = 16,
+                join: str = 'outer', policy: DTypePolicy = None) -> KeyedBatch:
+    """Merges many histories by merging groups of `fanout` of them, then groups of the results, until one remains.
+
+    This bounds the number of histories held at once to `fanout` results per level when the histories are produced
+    lazily, e.g. loaded one shard at a time.
+
+    Args:
+        histories (Iterable[ContingencySpace | KeyedBatch]): The histories.
+        weights (npt.ArrayLike, optional): A weight for each history, applied when it is first merged. Defaults to None.
+            Each group of weighted histories is rounded to the nearest count before it is merged further.
+        fanout (int, optional): The number of histories merged at once. Defaults to 16.
+        join (str, optional): 'outer' or 'inner'. With 'inner', a step is kept only if every history holds it. Defaults to 'outer'.
+        policy (DTypePolicy, optional): The dtypes of the merged batch. Defaults to DEFAULT_POLICY.
+
+    Returns:
+        KeyedBatch: The keys of the merged steps and the merged matrices.
+    """
+    if fanout < 2:
+        raise ValueError('fanout must be at least 2.')
+
+    weights = None if weights is None else np.asarray(weights, dtype=np.float64)
+
+    #each level holds partial results waiting to be merged into the level above.
+    levels: list[list[KeyedBatch]] = [[]]
+    group, group_weights = [], []
+    total = 0
+
+    def push(level: int, result: KeyedBatch) -> None:
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(result)
+        if len(levels[level]) == fanout:
+            push(level + 1, merge(levels[level], join=join, policy=policy))
+            levels[level] = []
+
+    for history in histories:
+        group.append(history)
+        if weights is not None:
+            if total == len(weights):
+                raise ValueError(f'Expected {len(weights)} histories, got more.')
+            group_weights.append(weights[total])
+        total += 1
+        if len(group) == fanout:
+            push(0, merge(group, group_weights if weights is not None else None, join, policy))
+            group, group_weights = [], []
+
+    if weights is not None and total != len(weights):
+        raise ValueError(f'Expected {len(weights)} histories, got {total}.')
+    if total == 0:
+        raise ValueError('At least one history is needed to merge.')
+
+    if group:
+        push(0, merge(group, group_weights if weights is not None else None, join, policy))
+
+    #merge what is left at every level, from the bottom up.
+    remaining = [result for level in levels for result in level]
+    return remaining[0] if len(remaining) == 1 else merge(remaining, join=join, policy=policy)
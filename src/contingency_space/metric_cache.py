@@ -0,0 +1,330 @@
+import sys
+import hashlib
+import functools
+import threading
+import numpy as np
+import numpy.typing as npt
+from collections import OrderedDict
+from typing import Callable
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.dtype_policy import DTypePolicy, DEFAULT_POLICY
+from contingency_space import instrumentation
+
+
+class MetricCache:
+    """A content-addressed cache of metric evaluations.
+
+    Results are keyed by the metric itself and a hash of the matrix contents (counts, dtype, shape
+    and class labels), so two distinct ConfusionMatrix objects holding the same counts share one entry. Entries
+    are evicted in least-recently-used order once the total size of the cache exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """Create an empty cache.
+
+        Args:
+            max_bytes (int, optional): The approximate upper bound on the memory used by the cache, in bytes. Defaults to 64MiB.
+        """
+        if max_bytes <= 0:
+            raise ValueError('max_bytes must be a positive integer.')
+
+        self.max_bytes: int = max_bytes
+        self.__entries: OrderedDict[tuple, tuple[float, int]] = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    @staticmethod
+    def metric_key(metric: Callable) -> Callable:
+        """Returns the identity of a metric as used in cache keys.
+
+        Args:
+            metric (Callable): The metric function.
+
+        Returns:
+            Callable: The metric, unwrapped if it is decorated.
+        """
+        #the function itself is the key rather than its id, so the cache keeps it alive and a later function
+        #cannot reuse the id (and be served the scores) of one that was garbage collected.
+        return getattr(metric, '__wrapped__', metric)
+
+    @staticmethod
+    def matrix_key(cm: ConfusionMatrix) -> bytes:
+        """Returns a digest of the contents of a confusion matrix.
+
+        Args:
+            cm (ConfusionMatrix): The matrix to hash.
+
+        Returns:
+            bytes: A 16 byte digest of the counts, their dtype and shape, and the class labels.
+        """
+        arr = cm.array()
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(arr.dtype).encode())
+        digest.update(str(arr.shape).encode())
+        digest.update('\x00'.join(map(str, cm.matrix.keys())).encode())
+        digest.update(arr.tobytes())
+        return digest.digest()
+
+    def evaluate(self, metric: Callable[[ConfusionMatrix], float], cm: ConfusionMatrix) -> float:
+        """Returns metric(cm), using the cached value if one is available.
+
+        Args:
+            metric (Callable[[ConfusionMatrix], float]): The metric to evaluate.
+            cm (ConfusionMatrix): The matrix to evaluate the metric on.
+
+        Returns:
+            float: The score of the matrix.
+        """
+        key = (self.metric_key(metric), self.matrix_key(cm))
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                instrumentation.count('cache_hits')
+                return entry[0]
+            self.misses += 1
+        
+        instrumentation.count('cache_misses')
+
+        #evaluate outside of the lock so slow metrics do not serialize other threads.
+        value = getattr(metric, '__wrapped__', metric)(cm)
+        self.__store(key, value)
+        return value
+
+    def __store(self, key: tuple, value: float) -> None:
+        size = sys.getsizeof(key) + sys.getsizeof(key[1]) + sys.getsizeof(value)
+        if size > self.max_bytes:
+            return
+
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.__size -= previous[1]
+
+            self.__entries[key] = (value, size)
+            self.__size += size
+
+            #evict the least recently used entries until we are back under the cap.
+            while self.__size > self.max_bytes:
+                _, (_, evicted_size) = self.__entries.popitem(last=False)
+                self.__size -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Removes every entry from the cache and resets its statistics.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of lookups that were served from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    @property
+    def size_bytes(self) -> int:
+        """The approximate number of bytes currently held by the cache."""
+        return self.__size
+
+    def stats(self) -> dict[str, int | float]:
+        """Returns the statistics of the cache.
+
+        Returns:
+            dict[str, int | float]: The hits, misses, evictions, hit rate, number of entries and size in bytes.
+        """
+        with self.__lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_rate': self.hit_rate,
+                    'entries': len(self.__entries),
+                    'size_bytes': self.__size,
+                    'max_bytes': self.max_bytes}
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+
+#the cache used by cached_metric when none is given.
+default_cache = MetricCache()
+
+
+def cached_metric(metric: Callable[[ConfusionMatrix], float] = None, *, cache: MetricCache = None):
+    """Decorator that memoizes a metric by the contents of the matrices it is called on.
+
+    Can be used either bare or with a specific cache::
+
+        @cached_metric
+        def accuracy(cm: ConfusionMatrix) -> float: ...
+
+        @cached_metric(cache=MetricCache(max_bytes=1024 * 1024))
+        def tau(cm: ConfusionMatrix) -> float: ...
+
+    The decorated function can be passed anywhere a metric is accepted. The cache in use is available as the
+    `cache` attribute of the decorated function, and the original function as `__wrapped__`.
+
+    Args:
+        metric (Callable[[ConfusionMatrix], float]): The metric to memoize.
+        cache (MetricCache, optional): The cache to store results in. Defaults to the module level default_cache.
+    """
+    def decorator(fn: Callable[[ConfusionMatrix], float]) -> Callable[[ConfusionMatrix], float]:
+        target = cache if cache is not None else default_cache
+
+        @functools.wraps(fn)
+        def wrapper(cm: ConfusionMatrix) -> float:
+            return target.evaluate(fn, cm)
+
+        wrapper.cache = target
+        return wrapper
+
+    if metric is None:
+        return decorator
+    return decorator(metric)
+
+
+class SurfaceCache:
+    """A cache of the grids drawn under a contingency space and their scores.
+
+    Surfaces are keyed by the size of each class, the granularity of the grid, the dtype policy and the metric, so
+    re-drawing a space (with another title, projection or set of axes) reuses them instead of generating and
+    scoring the grid again. The coordinates of a grid are stored once and shared by every metric.
+    Entries are evicted in least-recently-used order once the total size of the cache exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        """Create an empty cache.
+
+        Args:
+            max_bytes (int, optional): The upper bound on the memory held by the cached arrays, in bytes. Defaults to 256MiB.
+        """
+        if max_bytes <= 0:
+            raise ValueError('max_bytes must be a positive integer.')
+
+        self.max_bytes: int = max_bytes
+        self.__entries: OrderedDict[tuple, npt.NDArray] = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def surfaces(self, instances_per_class: dict[str, int], step_size: int, metrics: list[Callable[[ConfusionMatrix], float]],
+                 policy: DTypePolicy = None, memory_budget: int = None, n_jobs: int = None) -> tuple[npt.NDArray, npt.NDArray]:
+        """Returns the scores of a grid for each metric, and the coordinates of the grid, generating only what is not cached.
+
+        The metrics missing from the cache are scored together, in a single pass over the grid.
+
+        Args:
+            instances_per_class (dict[str, int]): The number of instances of each class.
+            step_size (int): The number of values along each axis of the grid.
+            metrics (list[Callable[[ConfusionMatrix], float]]): The metrics.
+            policy (DTypePolicy, optional): The dtypes of the grid. Defaults to DEFAULT_POLICY.
+            memory_budget (int, optional): The number of bytes generating the grid may use. Defaults to None, i.e. unlimited.
+            n_jobs (int, optional): The number of processes to score with, or -1 for every core. Defaults to None, i.e. serially.
+
+        Returns:
+            tuple[npt.NDArray, npt.NDArray]: The scores, with shape (M, step_size^k), and the coordinates of the grid, with
+                shape (step_size^k, k). The coordinates are shared with the cache, so they are read-only.
+        """
+        from contingency_space.cm_generator import CMGenerator
+
+        policy = policy if policy is not None else DEFAULT_POLICY
+        grid = (tuple(instances_per_class.items()), step_size, policy.counts.str, policy.scores.str)
+
+        points = self.__get((grid, None))
+        scores = [self.__get((grid, MetricCache.metric_key(metric))) for metric in metrics]
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        generator = CMGenerator(len(instances_per_class), instances_per_class, policy)
+        if missing:
+            new_scores, points = generator.score(step_size, [metrics[i] for i in missing], memory_budget=memory_budget,
+                                                 n_jobs=n_jobs, return_points=True)
+            self.__put((grid, None), points)
+            for i, score in zip(missing, new_scores):
+                scores[i] = score
+                self.__put((grid, MetricCache.metric_key(metrics[i])), score)
+        elif points is None:
+            points = generator.generate_batch(step_size).vectors()
+            self.__put((grid, None), points)
+
+        return np.stack(scores) if scores else np.empty((0, len(points)), dtype=policy.scores), points
+
+    def __get(self, key: tuple) -> npt.NDArray | None:
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        instrumentation.count('surface_cache_hits' if entry is not None else 'surface_cache_misses')
+        return entry
+
+    def __put(self, key: tuple, array: npt.NDArray) -> None:
+        if array.nbytes > self.max_bytes:
+            return
+
+        #the cached arrays are handed out to every caller, so they must not be modified.
+        array.flags.writeable = False
+
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.__size -= previous.nbytes
+
+            self.__entries[key] = array
+            self.__size += array.nbytes
+
+            #evict the least recently used entries until we are back under the cap.
+            while self.__size > self.max_bytes:
+                _, evicted = self.__entries.popitem(last=False)
+                self.__size -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Removes every entry from the cache and resets its statistics.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    @property
+    def size_bytes(self) -> int:
+        """The number of bytes currently held by the cache."""
+        return self.__size
+
+    def stats(self) -> dict[str, int]:
+        """Returns the statistics of the cache.
+
+        Returns:
+            dict[str, int]: The hits, misses, evictions, number of entries and size in bytes.
+        """
+        with self.__lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self.__entries),
+                    'size_bytes': self.__size,
+                    'max_bytes': self.max_bytes}
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+
+#the cache used by ContingencySpace.visualize when none is given.
+default_surface_cache = SurfaceCache()
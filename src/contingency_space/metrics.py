@@ -0,0 +1,196 @@
+import numpy as np
+import numpy.typing as npt
+from typing import TYPE_CHECKING, Callable
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.cm_batch import CMBatch
+from contingency_space.dtype_policy import DEFAULT_POLICY
+from contingency_space import instrumentation
+
+if TYPE_CHECKING:
+    from contingency_space.scoring import ScoringPool
+
+
+def batched(metric: Callable[..., npt.NDArray]) -> Callable[..., npt.NDArray]:
+    """Marks a metric as vectorized.
+
+    A batched metric takes an array of counts of shape (N, k, k) and a `dtype` keyword, and returns an
+    array of N scores. calculate_scores calls it once per batch instead of once per matrix.
+
+    Args:
+        metric (Callable[..., npt.NDArray]): The vectorized metric.
+    """
+    metric.batched = True
+    return metric
+
+
+def is_batched(metric: Callable) -> bool:
+    """Returns whether a metric was marked with the batched decorator.
+    """
+    return getattr(metric, 'batched', False) is True
+
+
+def calculate_scores(matrices: list[ConfusionMatrix] | CMBatch, metric: Callable[[ConfusionMatrix], float], dtype: npt.DTypeLike = None, n_jobs: int = None,
+                     pool: 'ScoringPool' = None) -> npt.NDArray:
+    """Scores every matrix with a metric.
+    
+    Batched metrics are always evaluated in a single call. Other metrics are called once per matrix, spread
+    across `n_jobs` processes if requested (see scoring.score_parallel), or across a running pool if one is given.
+
+    Args:
+        matrices (list[ConfusionMatrix] | CMBatch): The matrices to score.
+        metric (Callable[[ConfusionMatrix], float]): A metric taking a ConfusionMatrix, or a batched metric.
+        dtype (npt.DTypeLike, optional): The dtype of the scores. Defaults to the scores dtype of the batch's policy, or float64.
+        n_jobs (int, optional): The number of processes to score with, or -1 for every core. Defaults to None, i.e. serially.
+        pool (ScoringPool, optional): A pool started with the metric, reused across calls instead of starting processes
+            for this one (see scoring.ScoringPool). Defaults to None.
+
+    Returns:
+        npt.NDArray: The score of each matrix, in order.
+    """
+    if dtype is None:
+        dtype = matrices.policy.scores if isinstance(matrices, CMBatch) else DEFAULT_POLICY.scores
+
+    if is_batched(metric):
+        counts = matrices.counts if isinstance(matrices, CMBatch) else np.stack([cm.array() for cm in matrices])
+        instrumentation.count('metric_calls')
+        instrumentation.count('matrices_scored', len(counts))
+        with instrumentation.phase('metrics.calculate_scores'):
+            return np.asarray(metric(counts, dtype=dtype), dtype=dtype)
+
+    instrumentation.count('metric_calls', len(matrices))
+    instrumentation.count('matrices_scored', len(matrices))
+
+    if pool is not None:
+        batch = matrices if isinstance(matrices, CMBatch) else CMBatch.from_matrices(matrices)
+        return pool.score(batch, metric, dtype=dtype)
+
+    if n_jobs not in (None, 1):
+        from contingency_space.scoring import score_parallel
+        
+        batch = matrices if isinstance(matrices, CMBatch) else CMBatch.from_matrices(matrices)
+        return score_parallel(batch, metric, n_jobs=n_jobs, dtype=dtype)
+
+    with instrumentation.phase('metrics.calculate_scores'):
+        return np.fromiter((metric(cm) for cm in matrices), dtype=dtype, count=len(matrices))
+
+
+@batched
+def accuracy(counts: npt.NDArray, dtype: npt.DTypeLike = np.float64) -> npt.NDArray:
+    """Calculates the accuracy of each matrix in a batch.
+
+    .. math::
+
+        ACC = sum(diagonal) / sum(matrix)
+
+    Following sklearn's implementation, an empty matrix has an accuracy of 0.
+
+    Args:
+        counts (npt.NDArray): The counts, of shape (N, k, k).
+        dtype (npt.DTypeLike, optional): The dtype of the result. Defaults to np.float64.
+
+    Returns:
+        npt.NDArray: The accuracy of each matrix.
+    """
+    true_values = np.trace(counts, axis1=1, axis2=2)
+    total_values = counts.sum(axis=(1, 2))
+
+    scores = np.zeros(len(counts), dtype=dtype)
+    np.divide(true_values, total_values, out=scores, where=total_values > 0)
+    return scores
+
+
+def _rates(counts: npt.NDArray, dtype: npt.DTypeLike = np.float64) -> npt.NDArray:
+    #the rate at which each class was correctly classified, with shape (N, k). classes with no instances have a rate of 0.
+    sizes = counts.sum(axis=2)
+    rates = np.zeros(sizes.shape, dtype=dtype)
+    np.divide(np.diagonal(counts, axis1=1, axis2=2), sizes, out=rates, where=sizes != 0)
+    return rates
+
+
+def tau_weighted(counts: npt.NDArray, weights: npt.ArrayLike = (1, 1, 1), dtype: npt.DTypeLike = np.float64) -> npt.NDArray:
+    """Calculates the weighted tau of every binary matrix in a batch, for every weight triple at once.
+
+    Tau measures how close a model is to the perfect model at (tnr, tpr) = (1, 1). The weights (a, b, c) scale
+    the squared distance along the tpr and tnr axes and then sharpen the result:
+
+    .. math::
+
+        TAU_W = (1 - sqrt(a * (1 - tpr)^2 + b * (1 - tnr)^2) / sqrt(a + b))^c
+
+    With weights (1, 1, 1) this is the unweighted tau. The first class of each matrix is the positive class.
+
+    Args:
+        counts (npt.NDArray): The counts, of shape (N, 2, 2).
+        weights (npt.ArrayLike, optional): A weight triple (a, b, c), or W of them with shape (W, 3). Defaults to (1, 1, 1).
+        dtype (npt.DTypeLike, optional): The dtype of the result. Defaults to np.float64.
+
+    Returns:
+        npt.NDArray: The tau of every matrix under every weight triple, with shape (N, W).
+    """
+    counts = np.asarray(counts)
+    if counts.ndim != 3 or counts.shape[1:] != (2, 2):
+        raise ValueError(f'Weighted tau is defined on binary matrices of shape (N, 2, 2), not {counts.shape}.')
+
+    weights = np.atleast_2d(np.asarray(weights, dtype=dtype))
+    if weights.ndim != 2 or weights.shape[1] != 3:
+        raise ValueError(f'Weights must be a triple (a, b, c) or of shape (W, 3), not {weights.shape}.')
+
+    #the squared distance to the perfect model along each axis, (1 - tpr)^2 and (1 - tnr)^2, weighted by a and b.
+    misses = (1 - _rates(counts, dtype)) ** 2
+    distance = np.sqrt(misses @ weights[:, :2].T)
+
+    return (1 - distance / np.sqrt(weights[:, 0] + weights[:, 1])) ** weights[:, 2]
+
+
+def tau_components(counts: npt.NDArray, dtype: npt.DTypeLike = np.float64) -> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    """Calculates the position of every matrix in a batch and its distance to the perfect and random-guess models.
+
+    The position of a matrix is the vector of its per-class rates. The perfect model has a rate of 1 for every
+    class, and the random-guess model a rate of 1/k, which for binary problems is the point (0.5, 0.5).
+
+    Args:
+        counts (npt.NDArray): The counts, of shape (N, k, k).
+        dtype (npt.DTypeLike, optional): The dtype of the results. Defaults to np.float64.
+
+    Returns:
+        tuple[npt.NDArray, npt.NDArray, npt.NDArray]: The rates, with shape (N, k), and the distances from the perfect
+            and random-guess models, each with shape (N,).
+    """
+    counts = np.asarray(counts)
+    k = counts.shape[1]
+
+    rates = _rates(counts, dtype)
+    dist_from_perfect = np.sqrt(((1 - rates) ** 2).sum(axis=1))
+    dist_from_random = np.sqrt(((rates - 1 / k) ** 2).sum(axis=1))
+    return rates, dist_from_perfect, dist_from_random
+
+
+@batched
+def tau(counts: npt.NDArray, dtype: npt.DTypeLike = np.float64) -> npt.NDArray:
+    """Calculates the generalized tau of each matrix in a batch.
+
+    Tau is the distance of a model from the perfect model in the contingency space, rescaled so that the perfect
+    model scores 1 and the model that misclassifies everything scores 0:
+
+    .. math::
+
+        TAU = 1 - sqrt(sum((1 - rate_i)^2)) / sqrt(k)
+
+    For binary problems this is the tau of the deprecated Tau class.
+
+    Args:
+        counts (npt.NDArray): The counts, of shape (N, k, k).
+        dtype (npt.DTypeLike, optional): The dtype of the result. Defaults to np.float64.
+
+    Returns:
+        npt.NDArray: The tau of each matrix.
+    """
+    _, dist_from_perfect, _ = tau_components(counts, dtype)
+    return 1 - dist_from_perfect / np.sqrt(counts.shape[1])
+
+
+#the built-in batched metrics, by name.
+METRICS: dict[str, Callable[..., npt.NDArray]] = {
+    'accuracy': accuracy,
+    'tau': tau,
+}
@@ -0,0 +1,393 @@
+import heapq
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+from collections import deque
+from typing import Callable
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.cm_batch import CMBatch
+from contingency_space.contingency_space import ContingencySpace
+
+
+def _farthest(points: npt.NDArray, start: int, stop: int) -> tuple[float, int]:
+    #the point between start and stop farthest from the segment joining them, and its distance to it.
+    if stop - start < 2:
+        return 0.0, start
+
+    inner = points[start + 1:stop]
+    a, b = points[start], points[stop]
+    direction = b - a
+    length = direction @ direction
+
+    if length == 0:
+        distances = np.linalg.norm(inner - a, axis=1)
+    else:
+        #project onto the segment, clamping to its ends, so that paths which double back are measured correctly.
+        t = np.clip((inner - a) @ direction / length, 0.0, 1.0)
+        distances = np.linalg.norm(inner - (a + t[:, np.newaxis] * direction), axis=1)
+
+    i = int(np.argmax(distances))
+    return float(distances[i]), start + 1 + i
+
+
+def simplify_indices(points: npt.ArrayLike, max_points: int = None, tolerance: float = 0.0) -> npt.NDArray:
+    """Selects the points of a path to keep when simplifying it with the Ramer-Douglas-Peucker algorithm.
+
+    Starting from the first and last points, the point farthest from the simplified path is added back until
+    either every point lies within `tolerance` of the simplified path or `max_points` points have been kept.
+    Points are added in order of decreasing error, so when `max_points` stops the simplification early, the
+    points dropped are the ones closest to the simplified path.
+
+    Args:
+        points (npt.ArrayLike): The path, of shape (N, d), e.g. the coordinates of a history in the contingency space.
+        max_points (int, optional): The largest number of points to keep. Defaults to None, i.e. no limit.
+        tolerance (float, optional): The largest distance allowed between a dropped point and the simplified path. Defaults to 0.0.
+
+    Returns:
+        npt.NDArray: The sorted indices of the points to keep, always including the first and last.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 2:
+        raise ValueError(f'A path must be of shape (N, d), not {points.shape}.')
+    if max_points is not None and max_points < 2:
+        raise ValueError('At least 2 points must be kept.')
+
+    n = len(points)
+    if n <= 2 or (max_points is not None and n <= max_points):
+        return np.arange(n)
+
+    keep = [0, n - 1]
+    distance, index = _farthest(points, 0, n - 1)
+
+    #a max-heap of the segments of the simplified path, by the error of their farthest point.
+    segments = [(-distance, index, 0, n - 1)]
+    while segments:
+        distance, index, start, stop = heapq.heappop(segments)
+        if -distance <= tolerance or (max_points is not None and len(keep) >= max_points):
+            break
+
+        keep.append(index)
+        for a, b in ((start, index), (index, stop)):
+            distance, farthest = _farthest(points, a, b)
+            if distance > 0:
+                heapq.heappush(segments, (-distance, farthest, a, b))
+
+    return np.sort(np.array(keep))
+
+
+def resample(points: npt.ArrayLike, num_points: int) -> npt.NDArray:
+    """Resamples a path to points evenly spaced along its length.
+
+    Unlike simplify_indices, the points returned are interpolated rather than taken from the path, so sharp
+    corners can be cut. It is faster, and suits paths whose points are dense compared to their features.
+
+    Args:
+        points (npt.ArrayLike): The path, of shape (N, d).
+        num_points (int): The number of points to return.
+
+    Returns:
+        npt.NDArray: The resampled path, of shape (num_points, d), starting and ending where the path does.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 2:
+        raise ValueError(f'A path must be of shape (N, d), not {points.shape}.')
+    if num_points < 2:
+        raise ValueError('At least 2 points must be returned.')
+
+    steps = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    distance = np.concatenate([[0.0], np.cumsum(steps)])
+    if distance[-1] == 0:
+        return np.repeat(points[:1], num_points, axis=0)
+
+    targets = np.linspace(0.0, distance[-1], num_points)
+    return np.column_stack([np.interp(targets, distance, points[:, d]) for d in range(points.shape[1])])
+
+
+def simplify(points: npt.ArrayLike, max_points: int = None, tolerance: float = 0.0, method: str = 'rdp') -> npt.NDArray:
+    """Reduces a path to fewer points.
+
+    Args:
+        points (npt.ArrayLike): The path, of shape (N, d).
+        max_points (int, optional): The largest number of points to keep. Required by 'resample'. Defaults to None.
+        tolerance (float, optional): The largest error allowed by 'rdp'. Defaults to 0.0.
+        method (str, optional): 'rdp' to keep the points of the path that matter most, or 'resample' to
+            interpolate points evenly spaced along it. Defaults to 'rdp'.
+
+    Returns:
+        npt.NDArray: The simplified path.
+    """
+    match method:
+        case 'rdp':
+            points = np.asarray(points)
+            return points[simplify_indices(points, max_points, tolerance)]
+        case 'resample':
+            if max_points is None:
+                raise ValueError("max_points is required by the 'resample' method.")
+            return resample(points, max_points)
+        case _:
+            raise ValueError(f"Unknown method {method!r}. Expected 'rdp' or 'resample'.")
+
+
+def max_error(points: npt.ArrayLike, indices: npt.ArrayLike) -> float:
+    """Returns the largest distance between a point of a path and the simplified path made of the given points.
+
+    Args:
+        points (npt.ArrayLike): The path, of shape (N, d).
+        indices (npt.ArrayLike): The sorted indices of the points kept, as returned by simplify_indices.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    indices = np.asarray(indices)
+    return max((_farthest(points, a, b)[0] for a, b in zip(indices[:-1], indices[1:])), default=0.0)
+
+
+class ChangeDetector:
+    """Flags abrupt jumps and sustained drift in the path of a model through the contingency space.
+
+    A 'jump' is a step between two consecutive points that is unusually long compared to the steps before it:
+    longer than `min_jump` and more than `jump_z` standard deviations above their mean. 'drift' is flagged when
+    the model has moved further than `drift_threshold` over the last `drift_window` points, once per drifting
+    period. Both statistics are kept incrementally, so each point is processed in constant time::
+
+        detector = ChangeDetector(drift_window=20, drift_threshold=0.1)
+        while training:
+            space.add_history(matrix)
+            for alert in detector.update_space(space):
+                print(alert)
+
+    The same rules can be applied to a stored history at once with detect().
+    """
+
+    def __init__(self, jump_z: float = 4.0, min_jump: float = 0.0, warmup: int = 10, drift_window: int = 50, drift_threshold: float = 0.1):
+        """Create a detector.
+
+        Args:
+            jump_z (float, optional): How many standard deviations above the mean step a jump is. Defaults to 4.0.
+            min_jump (float, optional): The shortest step that can be a jump. Defaults to 0.0.
+            warmup (int, optional): The number of steps seen before jumps are flagged. Defaults to 10.
+            drift_window (int, optional): The number of points over which drift is measured. Defaults to 50.
+            drift_threshold (float, optional): The distance moved over drift_window points that counts as drift. Defaults to 0.1.
+        """
+        if drift_window < 1:
+            raise ValueError('drift_window must be a positive integer.')
+
+        self.jump_z: float = jump_z
+        self.min_jump: float = min_jump
+        self.warmup: int = warmup
+        self.drift_window: int = drift_window
+        self.drift_threshold: float = drift_threshold
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets every point seen so far.
+        """
+        self.points_seen: int = 0
+        self.__steps: int = 0
+        self.__sum: float = 0.0
+        self.__sum_squares: float = 0.0
+        self.__recent: deque = deque(maxlen=self.drift_window + 1)
+        self.__drifting: bool = False
+
+    def update(self, point: npt.ArrayLike, key: str = None) -> list[dict]:
+        """Processes the next point of the path.
+
+        Args:
+            point (npt.ArrayLike): The coordinates of the point, optionally followed by a metric score.
+            key (str, optional): The key of the point in its history, reported in alerts. Defaults to its index.
+
+        Returns:
+            list[dict]: The alerts raised by this point, each with its 'index', 'key', 'kind' ('jump' or 'drift'),
+                'value' and the 'threshold' it exceeded.
+        """
+        point = np.asarray(point, dtype=np.float64)
+        index = self.points_seen
+        key = str(index) if key is None else key
+        alerts = []
+
+        if self.__recent:
+            step = float(np.linalg.norm(point - self.__recent[-1]))
+            threshold = float(self.__jump_threshold(self.__steps, self.__sum, self.__sum_squares))
+            if self.__steps >= self.warmup and step > threshold:
+                alerts.append({'index': index, 'key': key, 'kind': 'jump', 'value': step, 'threshold': threshold})
+
+            self.__steps += 1
+            self.__sum += step
+            self.__sum_squares += step * step
+
+        self.__recent.append(point)
+        if len(self.__recent) > self.drift_window:
+            moved = float(np.linalg.norm(point - self.__recent[0]))
+            drifting = moved > self.drift_threshold
+            if drifting and not self.__drifting:
+                alerts.append({'index': index, 'key': key, 'kind': 'drift', 'value': moved, 'threshold': self.drift_threshold})
+            self.__drifting = drifting
+
+        self.points_seen += 1
+        return alerts
+
+    def update_space(self, space: ContingencySpace, metric: Callable[[ConfusionMatrix], float] = None) -> list[dict]:
+        """Processes the matrices added to a space since the last call, using its cached coordinates.
+
+        Args:
+            space (ContingencySpace): The space. Its history must only grow between calls.
+            metric (Callable[[ConfusionMatrix], float], optional): A metric to use as an extra axis. Defaults to None.
+
+        Returns:
+            list[dict]: The alerts raised by the new matrices, as returned by update.
+        """
+        from contingency_space.metrics import calculate_scores
+
+        points = space.coordinates()[self.points_seen:]
+        if metric is not None:
+            points = np.column_stack([points, calculate_scores(space.batch()[self.points_seen:], metric)])
+
+        keys = list(space.matrices.keys())[self.points_seen:]
+        return [alert for key, point in zip(keys, points) for alert in self.update(point, key)]
+
+    def detect(self, points: npt.ArrayLike, keys: list[str] = None) -> pd.DataFrame:
+        """Applies the rules of this detector to a whole path at once, as if its points were passed to update in order.
+
+        The state of the detector is not used or changed.
+
+        Args:
+            points (npt.ArrayLike): The path, of shape (N, d), e.g. ContingencySpace.coordinates().
+            keys (list[str], optional): The key of each point. Defaults to their indices.
+
+        Returns:
+            pd.DataFrame: One row per alert, with the columns of the alerts returned by update, ordered by index.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        n = len(points)
+        keys = np.asarray([str(i) for i in range(n)] if keys is None else [str(key) for key in keys], dtype=object)
+
+        #the statistics of the steps before each step, as update keeps them.
+        steps = np.linalg.norm(np.diff(points, axis=0), axis=1)
+        before = np.arange(len(steps))
+        sums = np.concatenate([[0.0], np.cumsum(steps)[:-1]]) if len(steps) else steps
+        sum_squares = np.concatenate([[0.0], np.cumsum(steps * steps)[:-1]]) if len(steps) else steps
+        thresholds = self.__jump_threshold(before, sums, sum_squares)
+        jumps = np.flatnonzero((before >= self.warmup) & (steps > thresholds))
+
+        moved = np.linalg.norm(points[self.drift_window:] - points[:-self.drift_window], axis=1) if n > self.drift_window else np.empty(0)
+        drifting = moved > self.drift_threshold
+        drifts = np.flatnonzero(drifting & ~np.concatenate([[False], drifting[:-1]]))
+
+        #jumps come first so that, as in update, a jump is reported before drift raised by the same point.
+        indices = np.concatenate([jumps + 1, drifts + self.drift_window])
+        alerts = pd.DataFrame({'index': indices,
+                               'key': keys[indices],
+                               'kind': ['jump'] * len(jumps) + ['drift'] * len(drifts),
+                               'value': np.concatenate([steps[jumps], moved[drifts]]),
+                               'threshold': np.concatenate([thresholds[jumps], np.full(len(drifts), self.drift_threshold)])})
+        return alerts.sort_values('index', kind='stable').reset_index(drop=True)
+
+    def __jump_threshold(self, count, total, total_squares):
+        #the mean plus jump_z standard deviations of the steps seen so far, and never below min_jump.
+        count = np.maximum(count, 1)
+        mean = total / count
+        std = np.sqrt(np.maximum(total_squares / count - mean * mean, 0.0))
+        return np.maximum(mean + self.jump_z * std, self.min_jump)
+
+
+def _run_counts(run) -> npt.NDArray:
+    match run:
+        case ContingencySpace():
+            return run.batch().counts
+        case CMBatch():
+            return run.counts
+        case _:
+            counts = np.asarray(run)
+            if counts.ndim != 3 or counts.shape[1] != counts.shape[2]:
+                raise ValueError(f'Each run must be of shape (M, k, k), not {counts.shape}.')
+            return counts
+
+
+def analyze_runs(runs: npt.ArrayLike | list | dict, metric: Callable[[ConfusionMatrix], float] = None, threshold: float = None,
+                 return_steps: bool = False) -> pd.DataFrame | tuple[pd.DataFrame, pd.DataFrame]:
+    """Measures the learning path of many runs at once, e.g. the configurations of a hyperparameter sweep.
+
+    Every matrix of every run is handled in the same vectorized pass: the runs are concatenated, their positions
+    and scores computed together, and the steps that would cross from one run into the next are masked out.
+
+    Args:
+        runs (npt.ArrayLike | list | dict): The runs, as an array of shape (R, M, k, k), or a list (or dict, by name) of
+            runs of any length, each an array of shape (M, k, k), a CMBatch or a ContingencySpace.
+        metric (Callable[[ConfusionMatrix], float], optional): A metric to use as an extra axis, as in
+            learning_path_length_3D. Defaults to None, i.e. paths are measured on the rates alone.
+        threshold (float, optional): A score to reach. The score is that of the metric, or tau if no metric is given.
+            Defaults to None.
+        return_steps (bool, optional): Whether to also return the speed of every step. Defaults to False.
+
+    Returns:
+        pd.DataFrame: One row per run, indexed by run, with its 'num_points', 'path_length', 'mean_speed' and
+            'max_speed' (the length of its steps), and its 'final_distance_to_perfect'. With a metric, also its
+            'final_score'. With a threshold, also the 'time_to_threshold', i.e. the index of the first point
+            whose score reaches it, or -1 if none does.
+        pd.DataFrame: If return_steps is True, one row per step of every run, in order, with its 'run', the 'step'
+            (the index within the run of the point it leads to) and its 'speed'. A run of one point has no steps.
+    """
+    from contingency_space.metrics import calculate_scores, tau
+
+    match runs:
+        case dict():
+            names, runs = list(runs.keys()), list(runs.values())
+        case np.ndarray() if runs.ndim == 4:
+            names, runs = list(range(len(runs))), list(runs)
+        case _:
+            names, runs = list(range(len(runs))), list(runs)
+
+    if len(runs) == 0:
+        raise ValueError('At least one run is needed.')
+    counts = [_run_counts(run) for run in runs]
+    if any(len(run) == 0 for run in counts):
+        raise ValueError('Every run needs at least one matrix.')
+    if len({run.shape[1] for run in counts}) != 1:
+        raise ValueError('Every run must have the same number of classes.')
+
+    lengths = np.array([len(run) for run in counts])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    ends = starts + lengths - 1
+    k = counts[0].shape[1]
+    batch = CMBatch(np.concatenate(counts), [str(i) for i in range(k)])
+
+    rates = batch.rates()
+    points = rates
+    scores = None
+    if metric is not None:
+        scores = calculate_scores(batch, metric)
+        points = np.column_stack([rates, scores])
+
+    #the step from each point to the next, and the run it belongs to. steps from the last point of a run lead into
+    #the next run, so they are dropped.
+    steps = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    run_of_step = np.repeat(np.arange(len(counts)), lengths)[:-1]
+    within = np.ones(len(steps), dtype=bool)
+    within[ends[:-1]] = False
+    steps, run_of_step = steps[within], run_of_step[within]
+    #the index within its run of the point each step leads to.
+    step_index = np.flatnonzero(within) + 1 - starts[run_of_step]
+
+    path_length = np.bincount(run_of_step, weights=steps, minlength=len(counts))
+    max_speed = np.zeros(len(counts))
+    np.maximum.at(max_speed, run_of_step, steps)
+
+    result = pd.DataFrame({'num_points': lengths,
+                           'path_length': path_length,
+                           'mean_speed': np.divide(path_length, lengths - 1, out=np.zeros(len(counts)), where=lengths > 1),
+                           'max_speed': max_speed,
+                           'final_distance_to_perfect': np.linalg.norm(1 - rates[ends], axis=1)},
+                          index=pd.Index(names, name='run'))
+
+    if scores is not None:
+        result['final_score'] = scores[ends]
+
+    if threshold is not None:
+        targets = scores if scores is not None else calculate_scores(batch, tau)
+        reached = targets >= threshold
+        #the first point reaching the threshold at or after the start of each run, if it is still within the run.
+        following = np.append(np.flatnonzero(reached), len(reached))
+        first = following[np.searchsorted(following, starts)]
+        result['time_to_threshold'] = np.where(first <= ends, first - starts, -1)
+
+    if return_steps:
+        return result, pd.DataFrame({'run': result.index.take(run_of_step), 'step': step_index, 'speed': steps})
+    return result
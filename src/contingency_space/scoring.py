@@ -0,0 +1,204 @@
+import os
+import multiprocessing
+import numpy as np
+import numpy.typing as npt
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.cm_batch import CMBatch
+from contingency_space.metrics import is_batched
+from contingency_space import instrumentation
+
+#the metrics of a worker process, set up once by _init_worker, and the blocks of shared memory it has attached to.
+_worker: dict = {}
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attaches to an existing block of shared memory owned by the parent process.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        #before Python 3.13 every attach is tracked. Workers share the parent's tracker, which ignores the
+        #duplicate registration, so the block is still only unlinked by the parent.
+        return shared_memory.SharedMemory(name=name)
+
+
+def _init_worker(metrics: list[Callable[[ConfusionMatrix], float]]) -> None:
+    _worker.update({'metrics': metrics, 'blocks': {}})
+
+
+def _block(name: str, names: tuple[str, ...]) -> shared_memory.SharedMemory:
+    blocks = _worker['blocks']
+    #the parent replaces its blocks when a batch outgrows them, so let go of any it no longer uses.
+    for stale in [other for other in blocks if other not in names]:
+        blocks.pop(stale).close()
+    if name not in blocks:
+        blocks[name] = _attach(name)
+    return blocks[name]
+
+
+def _score_slice(task: tuple) -> None:
+    (counts_name, shape, counts_dtype, scores_name, scores_dtype, labels, metric_index, start, stop) = task
+    names = (counts_name, scores_name)
+    counts = np.ndarray(shape, dtype=counts_dtype, buffer=_block(counts_name, names).buf)
+    scores = np.ndarray(shape[:1], dtype=scores_dtype, buffer=_block(scores_name, names).buf)
+    metric = _worker['metrics'][metric_index]
+
+    if is_batched(metric):
+        scores[start:stop] = metric(counts[start:stop], dtype=scores.dtype)
+        return
+
+    for i in range(start, stop):
+        scores[i] = metric(ConfusionMatrix(dict(zip(labels, counts[i].tolist()))))
+
+
+def resolve_jobs(n_jobs: int | None) -> int:
+    """Returns the number of processes to use for a given n_jobs argument.
+
+    Args:
+        n_jobs (int | None): None or 1 for serial execution, -1 for every core, or a number of processes.
+
+    Returns:
+        int: The number of processes.
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs == -1:
+        return os.cpu_count() or 1
+    if n_jobs < 1:
+        raise ValueError('n_jobs must be -1, None, or a positive integer.')
+    return n_jobs
+
+
+class ScoringPool:
+    """A pool of processes that scores many batches, e.g. every chunk of a grid, without starting again for each.
+
+    The metrics are sent to each worker once, when the pool starts; they must therefore be picklable if the
+    platform does not fork (e.g. functions defined at the top level of a module). The counts of each batch are
+    copied into shared memory, and the workers score disjoint slices of it straight into a shared output array,
+    so no matrices or scores are pickled between processes. The shared memory is kept between batches, and only
+    replaced when a batch outgrows it. Use as a context manager::
+
+        with ScoringPool([metric], n_jobs=-1) as pool:
+            for batch in chunks:
+                scores = pool.score(batch, metric)
+    """
+
+    def __init__(self, metrics: list[Callable[[ConfusionMatrix], float]], n_jobs: int = -1):
+        """Start the pool.
+
+        Args:
+            metrics (list[Callable[[ConfusionMatrix], float]]): The metrics the pool may score with.
+            n_jobs (int, optional): The number of processes, or -1 for every core. Defaults to -1.
+        """
+        self.metrics: list[Callable[[ConfusionMatrix], float]] = list(metrics)
+        self.processes: int = resolve_jobs(n_jobs)
+        #the workers must share this process's resource tracker. if each started its own, the tracker would unlink
+        #the blocks a worker attached to when that worker exits, while the pool still uses them.
+        resource_tracker.ensure_running()
+        self.__pool = multiprocessing.get_context().Pool(self.processes, initializer=_init_worker, initargs=(self.metrics,))
+        self.__counts_shm: shared_memory.SharedMemory | None = None
+        self.__scores_shm: shared_memory.SharedMemory | None = None
+
+    def score(self, batch: CMBatch, metric: Callable[[ConfusionMatrix], float], chunk_size: int = None, dtype: npt.DTypeLike = None) -> npt.NDArray:
+        """Scores a batch of matrices across the pool.
+
+        Args:
+            batch (CMBatch): The matrices to score.
+            metric (Callable[[ConfusionMatrix], float]): One of the metrics of the pool.
+            chunk_size (int, optional): The number of matrices scored per task. Defaults to an even split into 4 tasks per process.
+            dtype (npt.DTypeLike, optional): The dtype of the scores. Defaults to the scores dtype of the batch's policy.
+
+        Returns:
+            npt.NDArray: The score of each matrix, in order.
+
+        Raises:
+            ValueError: The metric is not one of the metrics of the pool, or the pool is closed.
+        """
+        if self.__pool is None:
+            raise ValueError('The pool is closed.')
+        if metric not in self.metrics:
+            raise ValueError('The metric was not given to the pool when it started.')
+
+        dtype = np.dtype(dtype if dtype is not None else batch.policy.scores)
+        n = len(batch)
+        if n == 0:
+            return np.empty(0, dtype=dtype)
+
+        if chunk_size is None:
+            chunk_size = -(-n // (self.processes * 4))
+
+        counts = np.ascontiguousarray(batch.counts)
+        instrumentation.record_array(counts)
+        self.__counts_shm = self.__reserve(self.__counts_shm, counts.nbytes)
+        self.__scores_shm = self.__reserve(self.__scores_shm, n * dtype.itemsize)
+
+        scores = None
+        try:
+            np.ndarray(counts.shape, dtype=counts.dtype, buffer=self.__counts_shm.buf)[:] = counts
+            scores = np.ndarray((n,), dtype=dtype, buffer=self.__scores_shm.buf)
+
+            task = (self.__counts_shm.name, counts.shape, counts.dtype.str, self.__scores_shm.name, dtype.str,
+                    batch.labels, self.metrics.index(metric))
+            with instrumentation.phase('scoring.score_parallel'):
+                self.__pool.map(_score_slice, [task + (start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)])
+
+            return scores.copy()
+        finally:
+            #release our view of the output, or the buffer cannot be freed.
+            scores = None
+
+    @staticmethod
+    def __reserve(shm: shared_memory.SharedMemory | None, nbytes: int) -> shared_memory.SharedMemory:
+        #reuses a block of shared memory if it is large enough, and replaces it otherwise.
+        if shm is not None and shm.size >= nbytes:
+            return shm
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        return shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+
+    def close(self) -> None:
+        """Stops the workers and frees the shared memory.
+        """
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+        for shm in (self.__counts_shm, self.__scores_shm):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self.__counts_shm = self.__scores_shm = None
+
+    def __enter__(self) -> 'ScoringPool':
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.close()
+        return False
+
+
+def score_parallel(batch: CMBatch, metric: Callable[[ConfusionMatrix], float], n_jobs: int = -1, chunk_size: int = None, dtype: npt.DTypeLike = None) -> npt.NDArray:
+    """Scores a batch of matrices across a pool of processes started for this batch alone.
+
+    To score many batches, use a ScoringPool instead, which starts its processes only once.
+
+    Args:
+        batch (CMBatch): The matrices to score.
+        metric (Callable[[ConfusionMatrix], float]): A metric taking a ConfusionMatrix, or a batched metric.
+        n_jobs (int, optional): The number of processes, or -1 for every core. Defaults to -1.
+        chunk_size (int, optional): The number of matrices scored per task. Defaults to an even split into 4 tasks per process.
+        dtype (npt.DTypeLike, optional): The dtype of the scores. Defaults to the scores dtype of the batch's policy.
+
+    Returns:
+        npt.NDArray: The score of each matrix, in order.
+    """
+    if len(batch) == 0:
+        return np.empty(0, dtype=dtype if dtype is not None else batch.policy.scores)
+
+    processes = min(resolve_jobs(n_jobs), len(batch))
+    with ScoringPool([metric], processes) as pool:
+        return pool.score(batch, metric, chunk_size, dtype)
@@ -0,0 +1,381 @@
+import io
+import json
+import asyncio
+import argparse
+import numpy as np
+import numpy.typing as npt
+from urllib.parse import urlsplit, parse_qs
+from typing import Callable
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.contingency_space import ContingencySpace
+from contingency_space.cm_batch import CMBatch
+from contingency_space.dtype_policy import DTypePolicy, DEFAULT_POLICY
+from contingency_space.metrics import METRICS, calculate_scores
+
+
+class _Request:
+    """A pending scoring request, waiting to be coalesced into a batch."""
+
+    def __init__(self, run: str, metric: str, labels: tuple[str, ...], counts: npt.NDArray, future: asyncio.Future):
+        self.run = run
+        self.metric = metric
+        self.labels = labels
+        self.counts = counts
+        self.future = future
+
+
+class RunState:
+    """The position and learning path of a run, as seen by the service."""
+
+    def __init__(self, keep_history: bool = False):
+        self.steps: int = 0
+        self.path_length: float = 0.0
+        self.last_point: npt.NDArray | None = None
+        self.history: ContingencySpace | None = ContingencySpace() if keep_history else None
+
+    def advance(self, points: npt.NDArray) -> npt.NDArray:
+        """Moves the run through the given points and returns the running path length after each one.
+
+        Raises:
+            ValueError: The points have a different number of classes than the run so far.
+        """
+        if self.last_point is not None and points.shape[1] != len(self.last_point):
+            raise ValueError(f'The run has {len(self.last_point)} classes, so its matrices cannot change to {points.shape[1]} classes.')
+
+        path = points if self.last_point is None else np.vstack([self.last_point[np.newaxis], points])
+        segments = np.linalg.norm(np.diff(path, axis=0), axis=1)
+
+        #the first point of a run starts its path, so it adds no length.
+        if self.last_point is None:
+            segments = np.concatenate([[0.0], segments])
+
+        lengths = self.path_length + np.cumsum(segments)
+        self.path_length = float(lengths[-1])
+        self.last_point = points[-1]
+        self.steps += len(points)
+        return lengths
+
+
+class ScoringService:
+    """Scores confusion matrices for many concurrent clients.
+
+    Requests are queued and coalesced: once a request arrives, the service waits up to `window` seconds (or
+    until `max_batch` matrices are queued) for others, then scores every queued matrix of the same metric and
+    classes in a single call to calculate_scores. Each request gets back the score and contingency space
+    coordinates of its matrices, and the running learning path length of its run.
+    """
+
+    def __init__(self, metrics: dict[str, Callable] = None, window: float = 0.002, max_batch: int = 4096,
+                 policy: DTypePolicy = None, keep_history: bool = False):
+        """Create a service. It starts batching on the first call to score.
+
+        Args:
+            metrics (dict[str, Callable], optional): The metrics clients may request, by name. Defaults to metrics.METRICS.
+            window (float, optional): How long to wait for other requests once one arrives, in seconds. Defaults to 0.002.
+            max_batch (int, optional): The number of matrices after which a batch is scored without waiting. Defaults to 4096.
+            policy (DTypePolicy, optional): The dtypes used for counts and scores. Defaults to DEFAULT_POLICY.
+            keep_history (bool, optional): Whether to record every matrix of each run in a ContingencySpace. Defaults to False.
+        """
+        self.metrics: dict[str, Callable] = dict(metrics if metrics is not None else METRICS)
+        self.window: float = window
+        self.max_batch: int = max_batch
+        self.policy: DTypePolicy = policy if policy is not None else DEFAULT_POLICY
+        self.keep_history: bool = keep_history
+        self.runs: dict[str, RunState] = {}
+
+        self.requests_served: int = 0
+        self.matrices_scored: int = 0
+        self.batches_scored: int = 0
+
+        self.__queue: asyncio.Queue | None = None
+        self.__batcher: asyncio.Task | None = None
+
+    async def score(self, run: str, counts: npt.ArrayLike, labels: tuple[str, ...] | list[str] = None, metric: str = 'accuracy') -> dict:
+        """Scores one or more matrices of a run.
+
+        Args:
+            run (str): The run the matrices belong to, in order.
+            counts (npt.ArrayLike): A matrix of shape (k, k), or matrices of shape (M, k, k).
+            labels (tuple[str, ...] | list[str], optional): The class labels. Defaults to '0', '1', ..., 'k-1'.
+            metric (str, optional): The name of the metric to score with. Defaults to 'accuracy'.
+
+        Returns:
+            dict: The run, its scores, coordinates, running path length after each matrix, and number of steps so far.
+        """
+        if metric not in self.metrics:
+            raise KeyError(f'Unknown metric "{metric}". Available metrics: {sorted(self.metrics)}.')
+
+        counts = self.policy.counts_array(counts)
+        if counts.ndim == 2:
+            counts = counts[np.newaxis]
+        if counts.ndim != 3 or counts.shape[1] != counts.shape[2] or len(counts) == 0:
+            raise ValueError(f'Matrices must be of shape (k, k) or (M, k, k), not {counts.shape}.')
+
+        labels = tuple(labels) if labels is not None else tuple(str(i) for i in range(counts.shape[1]))
+        if len(labels) != counts.shape[1]:
+            raise ValueError(f'Expected {counts.shape[1]} labels, got {len(labels)}.')
+
+        self.__ensure_started()
+
+        future = asyncio.get_running_loop().create_future()
+        await self.__queue.put(_Request(str(run), metric, labels, counts, future))
+        return await future
+
+    def __ensure_started(self) -> None:
+        if self.__batcher is None or self.__batcher.done():
+            self.__queue = asyncio.Queue()
+            self.__batcher = asyncio.get_running_loop().create_task(self.__run_batcher())
+
+    async def close(self) -> None:
+        """Stops the batcher. Requests still queued are cancelled.
+        """
+        if self.__batcher is not None:
+            self.__batcher.cancel()
+            try:
+                await self.__batcher
+            except asyncio.CancelledError:
+                pass
+            self.__batcher = None
+
+        while self.__queue is not None and not self.__queue.empty():
+            self.__queue.get_nowait().future.cancel()
+
+    async def __run_batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self.__queue.get()]
+            size = len(batch[0].counts)
+            deadline = loop.time() + self.window
+
+            #gather whatever else arrives within the window.
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.__queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(request)
+                size += len(request.counts)
+
+            #score off the event loop so clients can keep queueing requests, which form the next batch. if the
+            #batch fails as a whole, every request in it fails rather than waiting forever.
+            try:
+                results = await loop.run_in_executor(None, self.__process, batch)
+            except asyncio.CancelledError:
+                for request in batch:
+                    request.future.cancel()
+                raise
+            except Exception as e:
+                results = [e] * len(batch)
+
+            for request, result in zip(batch, results):
+                if request.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    request.future.set_exception(result)
+                else:
+                    request.future.set_result(result)
+
+    def __process(self, batch: list[_Request]) -> list[dict | Exception]:
+        scores: dict[int, npt.NDArray] = {}
+        points: dict[int, npt.NDArray] = {}
+        failed: dict[int, Exception] = {}
+
+        #requests can only be stacked together if they share a metric and classes.
+        groups: dict[tuple, list[int]] = {}
+        for i, request in enumerate(batch):
+            groups.setdefault((request.metric, request.labels), []).append(i)
+
+        for (metric, labels), indices in groups.items():
+            try:
+                stacked = CMBatch(np.concatenate([batch[i].counts for i in indices]), labels, self.policy)
+                group_scores = calculate_scores(stacked, self.metrics[metric])
+                group_points = stacked.vectors()
+            except Exception as e:
+                for i in indices:
+                    failed[i] = e
+                continue
+
+            start = 0
+            for i in indices:
+                stop = start + len(batch[i].counts)
+                scores[i], points[i] = group_scores[start:stop], group_points[start:stop]
+                start = stop
+
+            self.batches_scored += 1
+            self.matrices_scored += len(stacked)
+
+        #walk the learning paths in arrival order, so each run sees its matrices in the order they were sent.
+        results: list[dict | Exception] = []
+        for i, request in enumerate(batch):
+            if i in failed:
+                results.append(failed[i])
+                continue
+
+            #a request that cannot join its run fails on its own, without failing the rest of the batch.
+            try:
+                state = self.runs.setdefault(request.run, RunState(self.keep_history))
+                lengths = state.advance(points[i])
+                if state.history is not None:
+                    for counts in request.counts:
+                        state.history.add_history(ConfusionMatrix(dict(zip(request.labels, counts.tolist()))))
+            except Exception as e:
+                results.append(e)
+                continue
+
+            self.requests_served += 1
+            results.append({'run': request.run,
+                            'scores': scores[i].tolist(),
+                            'coordinates': points[i].tolist(),
+                            'path_length': lengths.tolist(),
+                            'steps': state.steps})
+        return results
+
+    def stats(self) -> dict[str, int | float]:
+        """Returns the number of requests, matrices and batches served, and the mean batch size.
+        """
+        return {'requests': self.requests_served,
+                'matrices': self.matrices_scored,
+                'batches': self.batches_scored,
+                'mean_batch_size': self.matrices_scored / self.batches_scored if self.batches_scored > 0 else 0.0,
+                'runs': len(self.runs)}
+
+
+class ScoringServer:
+    """A minimal HTTP/1.1 front end for a ScoringService, meant to run as a sidecar on localhost.
+
+    Routes::
+
+        POST /score       score matrices. JSON bodies take the form
+                          {"run": str, "matrices": [[...]], "labels": [str], "metric": str}, where only run and
+                          matrices are required. Bodies with Content-Type application/octet-stream hold a .npy
+                          array of the matrices, and take run, metric and labels (comma separated) from the query.
+        GET  /runs/<run>  the steps taken and path length of a run.
+        GET  /stats       the statistics of the service.
+        GET  /health      returns {"status": "ok"}.
+
+    Connections are kept alive unless the client asks otherwise.
+    """
+
+    def __init__(self, service: ScoringService = None, host: str = '127.0.0.1', port: int = 8765):
+        """Create a server. Call start() to begin accepting connections.
+
+        Args:
+            service (ScoringService, optional): The service to expose. Defaults to a ScoringService with default settings.
+            host (str, optional): The address to bind to. Defaults to '127.0.0.1'.
+            port (int, optional): The port to bind to, or 0 to pick a free one. Defaults to 8765.
+        """
+        self.service: ScoringService = service if service is not None else ScoringService()
+        self.host: str = host
+        self.port: int = port
+        self.__server: asyncio.Server | None = None
+
+    async def start(self) -> None:
+        self.__server = await asyncio.start_server(self.__handle_connection, self.host, self.port)
+        self.port = self.__server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+        await self.service.close()
+
+    async def serve_forever(self) -> None:
+        if self.__server is None:
+            await self.start()
+        await self.__server.serve_forever()
+
+    async def __handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                method, target, version = request_line.split(' ', 2)
+                headers = {}
+                for line in header_lines:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, payload = await self.__route(method, target, headers, body)
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                data = json.dumps(payload).encode()
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n'
+                             f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + data)
+                await writer.drain()
+
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    async def __route(self, method: str, target: str, headers: dict[str, str], body: bytes) -> tuple[str, dict]:
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        try:
+            match (method, url.path):
+                case ('POST', '/score'):
+                    if headers.get('content-type', '').startswith('application/octet-stream'):
+                        counts = np.load(io.BytesIO(body), allow_pickle=False)
+                        labels = query['labels'].split(',') if 'labels' in query else None
+                        result = await self.service.score(query['run'], counts, labels, query.get('metric', 'accuracy'))
+                    else:
+                        request = json.loads(body)
+                        result = await self.service.score(request['run'], request['matrices'], request.get('labels'), request.get('metric', 'accuracy'))
+                    return '200 OK', result
+                case ('GET', '/stats'):
+                    return '200 OK', self.service.stats()
+                case ('GET', '/health'):
+                    return '200 OK', {'status': 'ok'}
+                case ('GET', path) if path.startswith('/runs/'):
+                    run = path[len('/runs/'):]
+                    if run not in self.service.runs:
+                        return '404 Not Found', {'error': f'Unknown run "{run}".'}
+                    state = self.service.runs[run]
+                    return '200 OK', {'run': run, 'steps': state.steps, 'path_length': state.path_length}
+                case (_, '/score' | '/stats' | '/health'):
+                    return '405 Method Not Allowed', {'error': f'{method} is not allowed on {url.path}.'}
+                case _:
+                    return '404 Not Found', {'error': f'No route for {url.path}.'}
+        except KeyError as e:
+            return '400 Bad Request', {'error': f'Missing or unknown value: {e}'}
+        except (ValueError, TypeError, OverflowError) as e:
+            return '400 Bad Request', {'error': str(e)}
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description='Run the contingency space scoring service.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--window', type=float, default=0.002, help='batching window, in seconds.')
+    parser.add_argument('--max-batch', type=int, default=4096, help='matrices per batch before scoring without waiting.')
+    args = parser.parse_args(argv)
+
+    async def run():
+        server = ScoringServer(ScoringService(window=args.window, max_batch=args.max_batch), args.host, args.port)
+        await server.start()
+        print(f'Serving on http://{server.host}:{server.port}')
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
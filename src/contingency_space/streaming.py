@@ -0,0 +1,159 @@
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+from collections import deque
+from itertools import islice
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.contingency_space import ContingencySpace
+
+
+class WindowedCMBuilder:
+    """Builds confusion matrices over windows of a stream of (y_true, y_pred) pairs.
+
+    Every `step` events, the matrix of the last `window` events is emitted into a ContingencySpace, keyed by the
+    number of events seen so far. With `step` equal to `window` (the default) the windows are tumbling; with a
+    smaller `step` they slide and overlap. The counts of the current window are kept up to date as events arrive,
+    adding each incoming event and subtracting the one that leaves the window, so windows are never recounted::
+
+        builder = WindowedCMBuilder(['t', 'f'], window=1000, step=100)
+        for y_true, y_pred in stream:
+            builder.add(y_true, y_pred)
+        builder.space.visualize(metric)
+    """
+
+    def __init__(self, labels: list[str] | tuple[str, ...], window: int, step: int = None, space: ContingencySpace = None):
+        """Create a builder.
+
+        Args:
+            labels (list[str] | tuple[str, ...]): The class labels, in the order of the rows of the matrices.
+            window (int): The number of events in each window.
+            step (int, optional): The number of events between two emitted windows. Defaults to window, i.e. tumbling windows.
+            space (ContingencySpace, optional): The space to emit windows into. Defaults to a new, empty space.
+        """
+        step = window if step is None else step
+        if window < 1 or step < 1:
+            raise ValueError('window and step must be positive integers.')
+        if step > window:
+            raise ValueError('step cannot be larger than window, or some events would never be counted.')
+
+        self.labels: tuple[str, ...] = tuple(labels)
+        self.window: int = window
+        self.step: int = step
+        self.space: ContingencySpace = space if space is not None else ContingencySpace()
+        self.events_seen: int = 0
+
+        k = len(self.labels)
+        self.__index: dict[str, int] = {label: i for i, label in enumerate(self.labels)}
+        self.__counts: npt.NDArray = np.zeros(k * k, dtype=np.int64)
+        #the cell (true * k + pred) of each event in the current window, oldest first.
+        self.__cells: deque[int] = deque(maxlen=window)
+
+    def __cell(self, y_true: str, y_pred: str) -> int:
+        try:
+            return self.__index[y_true] * len(self.labels) + self.__index[y_pred]
+        except KeyError as e:
+            raise ValueError(f'Unknown class {e.args[0]!r}. Expected one of {self.labels}.') from None
+
+    def __to_matrix(self, counts: npt.NDArray) -> ConfusionMatrix:
+        k = len(self.labels)
+        return ConfusionMatrix(dict(zip(self.labels, counts.reshape(k, k).tolist())))
+
+    def add(self, y_true: str, y_pred: str) -> ConfusionMatrix | None:
+        """Adds one event, in constant time.
+
+        Args:
+            y_true (str): The real class.
+            y_pred (str): The predicted class.
+
+        Returns:
+            ConfusionMatrix | None: The matrix of the window ending with this event, if one was emitted.
+        """
+        cell = self.__cell(y_true, y_pred)
+
+        if len(self.__cells) == self.window:
+            #the deque drops its oldest event as this one is appended, so take it out of the counts.
+            self.__counts[self.__cells[0]] -= 1
+        self.__cells.append(cell)
+        self.__counts[cell] += 1
+        self.events_seen += 1
+
+        if self.events_seen % self.step == 0 and self.events_seen >= self.window:
+            matrix = self.__to_matrix(self.__counts)
+            self.space.add_history({str(self.events_seen): matrix})
+            return matrix
+        return None
+
+    def extend(self, y_true: npt.ArrayLike, y_pred: npt.ArrayLike, chunk_size: int = 65536) -> list[ConfusionMatrix]:
+        """Adds many events at once, counting every window they complete.
+
+        The counts are carried from one window to the next by the events of each chunk that arrive and leave, so the
+        work and memory are proportional to the chunk (and the windows emitted), never to the window.
+
+        Args:
+            y_true (npt.ArrayLike): The real class of each event.
+            y_pred (npt.ArrayLike): The predicted class of each event.
+            chunk_size (int, optional): The number of events processed at once, bounding the memory used. Defaults to 65536.
+
+        Returns:
+            list[ConfusionMatrix]: The matrices of the windows emitted, in order.
+        """
+        if len(y_true) != len(y_pred):
+            raise ValueError(f'Got {len(y_true)} real classes for {len(y_pred)} predictions.')
+
+        k = len(self.labels)
+        true_codes = pd.Categorical(y_true, categories=self.labels).codes
+        pred_codes = pd.Categorical(y_pred, categories=self.labels).codes
+        if (true_codes < 0).any() or (pred_codes < 0).any():
+            unknown = set(np.asarray(y_true)[true_codes < 0]) | set(np.asarray(y_pred)[pred_codes < 0])
+            raise ValueError(f'Unknown classes {sorted(map(str, unknown))}. Expected one of {self.labels}.')
+        cells = true_codes.astype(np.int64) * k + pred_codes
+
+        emitted = []
+        for start in range(0, len(cells), chunk_size):
+            emitted.extend(self.__extend(cells[start:start + chunk_size]))
+        return emitted
+
+    def __extend(self, cells: npt.NDArray) -> list[ConfusionMatrix]:
+        k = len(self.labels)
+        held = len(self.__cells)
+        first = self.events_seen
+
+        #the event each new one pushes out of the window, counted from the start of the stream, or -1 while the
+        #window is still filling up. only the oldest events of the window can leave, so at most one per new event
+        #is read from it.
+        leaving = np.full(len(cells), -1, dtype=np.int64)
+        low, high = max(first - self.window, 0), first + len(cells) - self.window
+        if high > low:
+            oldest = first - held
+            from_window = np.fromiter(islice(self.__cells, low - oldest, min(high, first) - oldest), dtype=np.int64)
+            from_chunk = cells[max(low, first) - first:max(high - first, 0)]
+            leaving[low + self.window - first:] = np.concatenate([from_window, from_chunk])
+
+        #the events, counted from the start of the stream, at which a window ends.
+        ends = np.arange(first + 1, first + len(cells) + 1)
+        ends = ends[(ends % self.step == 0) & (ends >= self.window)]
+
+        #move the counts from one window end to the next, adding the events that arrive and removing those that
+        #leave, so the work is proportional to the chunk rather than to the window.
+        counts = self.__counts
+        windows = []
+        start = 0
+        for stop in (ends - first).tolist() + [len(cells)]:
+            incoming, outgoing = cells[start:stop], leaving[start:stop]
+            counts = counts + np.bincount(incoming, minlength=k * k) - np.bincount(outgoing[outgoing >= 0], minlength=k * k)
+            windows.append(counts)
+            start = stop
+
+        self.__cells.extend(cells.tolist())
+        self.__counts = counts
+        self.events_seen += len(cells)
+
+        matrices = [self.__to_matrix(counts) for counts in windows[:len(ends)]]
+        if matrices:
+            self.space.add_history({str(end): matrix for end, matrix in zip(ends.tolist(), matrices)})
+        return matrices
+
+    def current(self) -> ConfusionMatrix:
+        """Returns the matrix of the last `window` events (or fewer, early in the stream), without emitting it.
+        """
+        return self.__to_matrix(self.__counts)
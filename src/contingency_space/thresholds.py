@@ -0,0 +1,137 @@
+import numbers
+import numpy as np
+import numpy.typing as npt
+from contingency_space.cm_batch import CMBatch
+from contingency_space.contingency_space import ContingencySpace
+from contingency_space.dtype_policy import DTypePolicy
+
+
+def _as_positives(scores: npt.ArrayLike, y_true: npt.ArrayLike, pos_label) -> tuple[npt.NDArray, npt.NDArray]:
+    scores = np.asarray(scores)
+    y_true = np.asarray(y_true)
+    if scores.ndim != 1 or scores.shape != y_true.shape:
+        raise ValueError(f'Expected one score per label, got scores of shape {scores.shape} and labels of shape {y_true.shape}.')
+    if len(scores) == 0:
+        raise ValueError('At least one score is needed to sweep thresholds.')
+    return scores, y_true == pos_label
+
+
+def _distinct_counts(scores: npt.NDArray, positive: npt.NDArray) -> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    #sort once, highest score first. lowering the threshold to the next distinct score predicts every sample
+    #up to the last one with that score as positive, so the counts are running totals taken at those ends.
+    order = np.argsort(scores, kind='stable')[::-1]
+    sorted_scores = scores[order]
+    if np.isnan(sorted_scores[0]) or np.isnan(sorted_scores[-1]):
+        raise ValueError('Scores must not be NaN.')
+
+    ends = np.append(np.flatnonzero(sorted_scores[1:] != sorted_scores[:-1]), len(scores) - 1)
+    true_positives = np.cumsum(positive[order], dtype=np.int64)[ends]
+    false_positives = ends + 1 - true_positives
+    return sorted_scores[ends], true_positives, false_positives
+
+
+def _binned_counts(scores: npt.NDArray, positive: npt.NDArray, thresholds: npt.NDArray,
+                   chunk_size: int) -> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    #count each sample in the bin of the thresholds it reaches, a chunk at a time, so memory stays bounded by the
+    #chunk and the number of thresholds. the counts at a threshold are then the totals of the bins above it.
+    ascending = np.sort(thresholds)
+    positive_bins = np.zeros(len(ascending) + 1, dtype=np.int64)
+    negative_bins = np.zeros(len(ascending) + 1, dtype=np.int64)
+
+    for start in range(0, len(scores), chunk_size):
+        chunk = scores[start:start + chunk_size]
+        if np.isnan(chunk).any():
+            raise ValueError('Scores must not be NaN.')
+        bins = np.searchsorted(ascending, chunk, side='right')
+        chunk_positive = positive[start:start + chunk_size]
+        positive_bins += np.bincount(bins[chunk_positive], minlength=len(ascending) + 1)
+        negative_bins += np.bincount(bins[~chunk_positive], minlength=len(ascending) + 1)
+
+    #a sample in bin b reaches the b lowest thresholds, so walk the bins from the top.
+    true_positives = np.cumsum(positive_bins[::-1])[:-1]
+    false_positives = np.cumsum(negative_bins[::-1])[:-1]
+    return ascending[::-1], true_positives, false_positives
+
+
+def threshold_sweep(scores: npt.ArrayLike, y_true: npt.ArrayLike, thresholds: int | npt.ArrayLike = None, pos_label=1,
+                    labels: tuple[str, str] = ('t', 'f'), policy: DTypePolicy = None,
+                    chunk_size: int = 1 << 22) -> tuple[npt.NDArray, CMBatch]:
+    """Builds the confusion matrix of a probabilistic binary classifier at every threshold of its scores.
+
+    A sample is predicted positive at a threshold if its score is at least the threshold. Each matrix holds the
+    positive class in its first row, i.e. [[tp, fn], [fp, tn]], so the batch can be scored and placed in a
+    contingency space like any other.
+
+    With every distinct score as a threshold, the scores are sorted once and the counts are running totals over
+    them. With a given number or list of thresholds, the samples are instead binned between the thresholds a
+    chunk at a time, which never sorts or copies the whole array and suits tens of millions of scores, including
+    memory-mapped ones.
+
+    Args:
+        scores (npt.ArrayLike): The score of each sample, higher meaning more likely positive.
+        y_true (npt.ArrayLike): The real class of each sample.
+        thresholds (int | npt.ArrayLike, optional): The number of evenly spaced thresholds between the lowest and
+            highest score, or the thresholds themselves. Defaults to None, i.e. every distinct score.
+        pos_label (optional): The value of y_true for the positive class. Defaults to 1.
+        labels (tuple[str, str], optional): The labels of the positive and negative class. Defaults to ('t', 'f').
+        policy (DTypePolicy, optional): The dtypes of the batch. Defaults to DEFAULT_POLICY.
+        chunk_size (int, optional): The number of samples binned at once when thresholds are given. Defaults to 4194304.
+
+    Returns:
+        tuple[npt.NDArray, CMBatch]: The thresholds, from highest to lowest, and the matrix at each of them.
+
+    Raises:
+        ValueError: The scores and labels do not match, are empty, or the scores hold NaN.
+        TypeError: The number of thresholds is a bool.
+    """
+    if len(labels) != 2:
+        raise ValueError(f'A threshold sweep has two classes, got labels {labels}.')
+
+    scores, positive = _as_positives(scores, y_true, pos_label)
+
+    match thresholds:
+        case None:
+            values, true_positives, false_positives = _distinct_counts(scores, positive)
+        case bool():
+            raise TypeError('The number of thresholds must be an integer, not a bool.')
+        case numbers.Integral():
+            #any integer counts, numpy's included, so np.int64(10) means ten thresholds rather than a threshold of 10.
+            thresholds = int(thresholds)
+            if thresholds < 1:
+                raise ValueError('The number of thresholds must be positive.')
+            #the range of the scores is found a chunk at a time as well.
+            low = min(np.nanmin(scores[start:start + chunk_size]) for start in range(0, len(scores), chunk_size))
+            high = max(np.nanmax(scores[start:start + chunk_size]) for start in range(0, len(scores), chunk_size))
+            values, true_positives, false_positives = _binned_counts(scores, positive, np.linspace(low, high, thresholds), chunk_size)
+        case _:
+            values, true_positives, false_positives = _binned_counts(scores, positive, np.asarray(thresholds, dtype=np.float64).ravel(), chunk_size)
+
+    num_positive = int(np.count_nonzero(positive))
+    num_negative = len(scores) - num_positive
+
+    counts = np.empty((len(values), 2, 2), dtype=np.int64)
+    counts[:, 0, 0] = true_positives
+    counts[:, 0, 1] = num_positive - true_positives
+    counts[:, 1, 0] = false_positives
+    counts[:, 1, 1] = num_negative - false_positives
+
+    return values, CMBatch(counts, labels, policy)
+
+
+def threshold_space(scores: npt.ArrayLike, y_true: npt.ArrayLike, thresholds: int | npt.ArrayLike = None, pos_label=1,
+                    labels: tuple[str, str] = ('t', 'f'), policy: DTypePolicy = None) -> ContingencySpace:
+    """Builds the matrices of threshold_sweep as a contingency space, keyed by their threshold.
+
+    Args:
+        scores (npt.ArrayLike): The score of each sample.
+        y_true (npt.ArrayLike): The real class of each sample.
+        thresholds (int | npt.ArrayLike, optional): The number of thresholds, or the thresholds. Defaults to None, i.e. every distinct score.
+        pos_label (optional): The value of y_true for the positive class. Defaults to 1.
+        labels (tuple[str, str], optional): The labels of the positive and negative class. Defaults to ('t', 'f').
+        policy (DTypePolicy, optional): The dtypes of the space. Defaults to DEFAULT_POLICY.
+
+    Returns:
+        ContingencySpace: The space, with the operating curve from the highest threshold to the lowest as its history.
+    """
+    values, batch = threshold_sweep(scores, y_true, thresholds, pos_label, labels, policy)
+    return ContingencySpace(dict(zip(map(str, values.tolist()), batch.to_matrices())), policy)
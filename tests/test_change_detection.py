@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+from contingency_space.cm_batch import CMBatch
+from contingency_space.contingency_space import ContingencySpace
+from contingency_space.paths import ChangeDetector
+
+
+def path_with_a_jump() -> np.ndarray:
+    #small noisy steps around (0.5, 0.5), a jump to (0.9, 0.9) at point 40, then a slow drift back from point 70.
+    rng = np.random.default_rng(0)
+    points = 0.5 + rng.normal(0, 0.005, (120, 2))
+    points[40:] += 0.4
+    points[70:] -= np.linspace(0, 0.3, 50)[:, np.newaxis]
+    return points
+
+
+def updates(detector: ChangeDetector, points: np.ndarray) -> pd.DataFrame:
+    alerts = [alert for point in points for alert in detector.update(point)]
+    return pd.DataFrame(alerts, columns=['index', 'key', 'kind', 'value', 'threshold'])
+
+
+def test_jump_and_drift_are_flagged_once():
+    detector = ChangeDetector(drift_window=10, drift_threshold=0.05)
+    alerts = updates(detector, path_with_a_jump())
+
+    assert alerts.loc[alerts['kind'] == 'jump', 'index'].tolist() == [40]
+    #the jump itself moves the model, so drift is flagged with it, and again once the slow drift is under way.
+    drifts = alerts.loc[alerts['kind'] == 'drift', 'index'].tolist()
+    assert drifts[0] == 40
+    assert len(drifts) == 2 and 70 < drifts[1] < 90
+
+
+def test_detect_matches_incremental_updates():
+    points = path_with_a_jump()
+    for settings in ({}, {'drift_window': 5, 'drift_threshold': 0.02}, {'jump_z': 2, 'warmup': 3, 'min_jump': 0.01}):
+        detector = ChangeDetector(**settings)
+        expected = updates(detector, points)
+        found = detector.detect(points)
+
+        pd.testing.assert_frame_equal(found[['index', 'key', 'kind']], expected[['index', 'key', 'kind']], check_dtype=False)
+        assert np.allclose(found['value'], expected['value'])
+        assert np.allclose(found['threshold'], expected['threshold'])
+
+
+def test_update_space_reads_only_new_matrices():
+    rates = np.clip(path_with_a_jump(), 0, 1)
+    counts = np.zeros((len(rates), 2, 2), dtype=int)
+    #tpr and tnr, in thousandths.
+    counts[:, 0, 0] = np.rint(rates[:, 1] * 1000)
+    counts[:, 0, 1] = 1000 - counts[:, 0, 0]
+    counts[:, 1, 1] = np.rint(rates[:, 0] * 1000)
+    counts[:, 1, 0] = 1000 - counts[:, 1, 1]
+    matrices = CMBatch(counts, ('t', 'f')).to_matrices()
+
+    detector = ChangeDetector(drift_window=10, drift_threshold=0.05)
+    space = ContingencySpace()
+    alerts = []
+    for start in range(0, len(matrices), 25):
+        space.add_history(matrices[start:start + 25])
+        alerts += detector.update_space(space)
+
+    assert detector.points_seen == len(matrices)
+    expected = ChangeDetector(drift_window=10, drift_threshold=0.05).detect(space.coordinates(), list(space.matrices))
+    assert [(alert['index'], alert['kind']) for alert in alerts] == list(zip(expected['index'], expected['kind']))
+
+
+def test_reset_forgets_the_path():
+    detector = ChangeDetector(warmup=0)
+    updates(detector, path_with_a_jump()[:41])
+    detector.reset()
+    assert detector.points_seen == 0
+    assert detector.update([0.5, 0.5]) == []
+
+    with pytest.raises(ValueError):
+        ChangeDetector(drift_window=0)
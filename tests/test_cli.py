@@ -0,0 +1,76 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+from contingency_space import instrumentation
+from contingency_space.cli import ResultStore, main
+
+
+def read(directory) -> pd.DataFrame:
+    return ResultStore(str(directory), [], 'csv').read()
+
+
+def test_sensitivity(tmp_path):
+    argv = ['sensitivity', '-o', str(tmp_path), '--format', 'csv', '--ratios', '1:2,1:16', '--metrics', 'accuracy,tau',
+            '--granularity', '5']
+    assert main(argv) == 0
+
+    results = read(tmp_path)
+    assert len(results) == 4
+    assert set(results['ratio']) == {'1:2', '1:16'}
+    assert results['sensitivity'].notna().all()
+
+    #a second run finds every cell done.
+    assert main(argv) == 0
+    assert len(read(tmp_path)) == 4
+
+
+def test_sensitivity_reports_bad_ratios(tmp_path, capsys):
+    assert main(['sensitivity', '-o', str(tmp_path), '--format', 'csv', '--ratios', '0:2', '--metrics', 'accuracy']) == 1
+    assert 'positive' in capsys.readouterr().err
+
+
+def test_surface(tmp_path):
+    argv = ['surface', '-o', str(tmp_path), '--format', 'csv', '--classes', 't=10,f=20', '--metrics', 'accuracy',
+            '--granularity', '6', '--chunk-size', '10']
+    assert main(argv) == 0
+
+    results = read(tmp_path)
+    assert sorted(results['position']) == list(range(36))
+    assert set(results['chunk']) == set(range(4))
+    assert results['score'].between(0, 1).all()
+
+
+def test_surface_resumes_only_missing_chunks(tmp_path):
+    argv = ['surface', '-o', str(tmp_path), '--format', 'csv', '--classes', 't=10,f=20', '--metrics', 'accuracy',
+            '--granularity', '6', '--chunk-size', '10']
+    assert main(argv) == 0
+    complete = read(tmp_path).sort_values('position', ignore_index=True)
+
+    os.remove(sorted(tmp_path.glob('part-*.csv'))[1])
+    with instrumentation.instrument() as stats:
+        assert main(argv) == 0
+    assert stats.counters['matrices_generated'] == 10
+
+    resumed = read(tmp_path).sort_values('position', ignore_index=True)
+    pd.testing.assert_frame_equal(resumed, complete)
+
+
+def test_path(tmp_path):
+    history = tmp_path / 'history.npy'
+    np.save(history, np.array([[[5, 5], [5, 5]], [[8, 2], [2, 8]], [[10, 0], [0, 10]]]))
+
+    output = tmp_path / 'out'
+    assert main(['path', str(history), '-o', str(output), '--format', 'csv', '--metrics', 'accuracy']) == 0
+
+    results = read(output)
+    assert results['num_points'].tolist() == [3]
+    assert np.isclose(results['path_length'][0], np.sqrt(3) * 0.5)
+
+
+def test_parquet_without_an_engine_is_reported(tmp_path, monkeypatch, capsys):
+    for engine in ('pyarrow', 'fastparquet'):
+        monkeypatch.setitem(sys.modules, engine, None)
+
+    assert main(['sensitivity', '-o', str(tmp_path), '--ratios', '1:2', '--metrics', 'accuracy']) == 1
+    assert 'pyarrow' in capsys.readouterr().err
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from contingency_space.cm_batch import CMBatch
+from contingency_space.confusion_matrix import one_vs_rest_counts
+from contingency_space.dtype_policy import DTypePolicy
+
+
+def test_one_vs_rest_matches_binary_cells():
+    counts = np.array([[[5, 1, 0], [2, 6, 1], [0, 1, 7]]])
+    binary = CMBatch(counts, 'abc').one_vs_rest()
+
+    assert binary.shape == (1, 3, 2, 2)
+    assert binary[0, 1].tolist() == [[6, 3], [2, 12]]
+    assert (binary.sum(axis=(2, 3)) == counts.sum()).all()
+
+
+def test_one_vs_rest_does_not_wrap_compact_counts():
+    counts = np.eye(3, dtype=np.int8)[np.newaxis] * 100
+    assert one_vs_rest_counts(counts)[0, 0, 1, 1] == 200
+
+    batch = CMBatch(counts, 'abc', DTypePolicy.fit(100))
+    with pytest.raises(OverflowError):
+        batch.one_vs_rest()
+    with pytest.raises(OverflowError):
+        batch.binary('a')
+
+    assert batch.astype(DTypePolicy.fit(300)).binary('a').counts[0].tolist() == [[100, 0], [0, 200]]
@@ -0,0 +1,42 @@
+import numpy as np
+from contingency_space import instrumentation
+from contingency_space.cm_generator import CMGenerator
+from contingency_space.metrics import accuracy, tau
+
+
+def unbatched_accuracy(cm) -> float:
+    return cm.get_total_true() / sum(map(sum, cm.matrix.values()))
+
+
+def test_scores_match_with_and_without_deduplication():
+    generator = CMGenerator(2, {'t': 40, 'f': 60})
+    scores, points = generator.score(20, [accuracy, tau], return_points=True)
+    deduplicated, deduplicated_points = generator.score(20, [accuracy, tau], return_points=True, deduplicate=True)
+
+    assert np.array_equal(scores, deduplicated)
+    assert np.array_equal(points, deduplicated_points)
+    assert np.allclose(generator.score(20, unbatched_accuracy), scores[0])
+
+
+def test_only_unbatched_metrics_are_deduplicated():
+    generator = CMGenerator(2, {'t': 40, 'f': 60})
+    assert generator.plan(20, deduplicate=False)['estimated_bytes'] < generator.plan(20)['estimated_bytes']
+
+    with instrumentation.instrument() as stats:
+        generator.score(20, [accuracy, tau])
+    assert 'cm_generator.unique' not in stats.phases
+
+    with instrumentation.instrument() as stats:
+        generator.score(20, [accuracy, unbatched_accuracy])
+    assert stats.phases['cm_generator.unique']['calls'] == 1
+
+
+def test_unique_matrices_and_inverse_rebuild_the_grid():
+    #a small class and a high granularity give many identical matrices.
+    unique, inverse = CMGenerator(2, {'t': 3, 'f': 5}).generate_cms(12, return_inverse=True)
+    grid = CMGenerator(2, {'t': 3, 'f': 5}).generate_cms(12)
+
+    assert len(inverse) == len(grid) == 144
+    assert len(unique) < len(grid)
+    assert len(set(matrix.freeze() for matrix in unique)) == len(unique)
+    assert [unique[i] for i in inverse] == grid
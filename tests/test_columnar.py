@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from contingency_space.cm_generator import CMGenerator
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.contingency_space import ContingencySpace
+from contingency_space.metrics import accuracy, calculate_scores
+
+pytest.importorskip('pyarrow')
+from contingency_space import columnar
+
+
+def history() -> ContingencySpace:
+    rng = np.random.default_rng(0)
+    return ContingencySpace({str(step): ConfusionMatrix({'t': rng.integers(0, 50, 2).tolist(), 'f': rng.integers(0, 50, 2).tolist()})
+                             for step in range(0, 100, 10)})
+
+
+def test_space_round_trips_through_parquet(tmp_path):
+    space = history()
+    path = str(tmp_path / 'history.parquet')
+    columnar.write_space(space, path, metrics={'accuracy': accuracy}, row_group_size=3)
+
+    loaded = columnar.read_space(path)
+    assert list(loaded.matrices) == list(space.matrices)
+    assert list(loaded.matrices.values()) == list(space.matrices.values())
+
+    some = columnar.read_space(path, filters=[('key', 'in', ['10', '40'])])
+    assert list(some.matrices) == ['10', '40']
+
+
+def test_grid_is_written_with_its_scores(tmp_path):
+    generator = CMGenerator(2, {'t': 40, 'f': 60})
+    path = str(tmp_path / 'grid.parquet')
+    assert columnar.write_grid(generator, 12, path, metrics={'accuracy': accuracy}, chunk_size=50) == 144
+
+    batch = generator.generate_batch(12)
+    assert np.array_equal(columnar.read_batch(path).counts, batch.counts)
+
+    import pyarrow.parquet as pq
+    table = pq.read_table(path)
+    assert table.column('position').to_pylist() == list(range(144))
+    assert np.allclose(table.column(columnar.score_column('accuracy')).to_numpy(), calculate_scores(batch, accuracy))
+
+    good = columnar.read_batch(path, filters=[(columnar.score_column('accuracy'), '>=', 0.9)])
+    assert (calculate_scores(good, accuracy) >= 0.9).all()
+    assert 0 < len(good) < 144
+
+
+def test_table_without_labels_is_rejected():
+    import pyarrow as pa
+    with pytest.raises(ValueError):
+        columnar.table_to_batch(pa.table({'count_t_t': [1]}))
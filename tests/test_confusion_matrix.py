@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from contingency_space.cm_batch import CMBatch
+from contingency_space.confusion_matrix import ConfusionMatrix, FrozenConfusionMatrix, normalize_counts
+
+
+def test_equality_compares_every_cell():
+    assert ConfusionMatrix({'t': [8, 2], 'f': [1, 9]}) == ConfusionMatrix({'t': [8, 2], 'f': [1, 9]})
+    assert ConfusionMatrix({'t': [8, 2], 'f': [1, 9]}) != ConfusionMatrix({'t': [8, 2], 'f': [2, 8]})
+    assert ConfusionMatrix({'t': [8, 2], 'f': [1, 9]}) != ConfusionMatrix({'f': [8, 2], 't': [1, 9]})
+    assert ConfusionMatrix({'t': [8, 2], 'f': [1, 9]}) != ConfusionMatrix({'a': [8, 2, 0], 'b': [1, 9, 0], 'c': [0, 0, 1]})
+
+
+def test_frozen_matrices_hash_by_content():
+    frozen = FrozenConfusionMatrix({'t': [8, 2], 'f': [1, 9]})
+    same = ConfusionMatrix({'t': [8, 2], 'f': [1, 9]}).freeze()
+    other = FrozenConfusionMatrix({'t': [9, 1], 'f': [1, 9]})
+
+    assert frozen == same and hash(frozen) == hash(same)
+    assert frozen != other
+    assert len({frozen, same, other}) == 2
+    assert {frozen: 'seen'}[same] == 'seen'
+
+    #equal matrices hash equally whatever the dtype of their counts.
+    assert hash(FrozenConfusionMatrix({'t': [8.0, 2.0], 'f': [1.0, 9.0]})) == hash(frozen)
+
+
+def test_frozen_and_mutable_matrices_compare_equal():
+    matrix = ConfusionMatrix({'t': [8, 2], 'f': [1, 9]})
+    frozen = matrix.freeze()
+
+    assert frozen == matrix and matrix == frozen
+    assert frozen.thaw() == matrix
+    assert type(frozen.thaw()) is ConfusionMatrix
+    with pytest.raises(TypeError):
+        hash(matrix)
+
+
+def test_frozen_matrices_reject_mutation():
+    frozen = FrozenConfusionMatrix({'t': [8, 2], 'f': [1, 9]})
+
+    with pytest.raises(TypeError):
+        frozen.add_class('u', [0, 0])
+    with pytest.raises(TypeError):
+        frozen.normalize()
+    with pytest.raises(TypeError):
+        frozen.matrix = {'t': [1, 0], 'f': [0, 1]}
+    with pytest.raises(ValueError):
+        frozen.array()[0, 0] = 0
+
+    frozen.matrix['t'][0] = 0
+    assert frozen.array().tolist() == [[8, 2], [1, 9]]
+
+
+def test_normalized_view_leaves_the_counts():
+    matrix = ConfusionMatrix({'a': [30, 60, 10], 'b': [0, 0, 0], 'c': [30, 20, 50]})
+    normalized = matrix.normalized()
+
+    assert normalized.tolist() == [[0.3, 0.6, 0.1], [0, 0, 0], [0.3, 0.2, 0.5]]
+    assert matrix.array().tolist() == [[30, 60, 10], [0, 0, 0], [30, 20, 50]]
+    assert matrix.normalized() is normalized
+    with pytest.raises(ValueError):
+        normalized[0, 0] = 1
+
+
+def test_normalized_view_follows_changes_to_the_matrix():
+    matrix = ConfusionMatrix({'t': [8, 2], 'f': [1, 9]})
+    matrix.normalized()
+    matrix.matrix = {'t': [5, 5], 'f': [0, 10]}
+    assert matrix.normalized().tolist() == [[0.5, 0.5], [0, 1]]
+
+    matrix.normalize()
+    assert matrix.matrix == {'t': [0.5, 0.5], 'f': [0, 1]}
+    assert matrix.class_freqs == {'t': 1, 'f': 1}
+
+
+def test_batches_normalize_like_single_matrices():
+    counts = np.random.default_rng(0).integers(0, 10, (50, 3, 3))
+    counts[0, 1] = 0
+    batch = CMBatch(counts, 'abc')
+
+    assert np.allclose(normalize_counts(counts), [normalize_counts(matrix) for matrix in counts])
+    assert np.array_equal(batch.normalized(), [ConfusionMatrix(dict(zip('abc', matrix.tolist()))).normalized() for matrix in counts])
+    assert batch.normalized()[0, 1].tolist() == [0, 0, 0]
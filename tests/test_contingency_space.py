@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.contingency_space import ContingencySpace
+from contingency_space.dtype_policy import DEFAULT_POLICY
+from contingency_space.merge import merge_histories
+
+
+def three_classes() -> ConfusionMatrix:
+    return ConfusionMatrix({'a': [5, 1, 0], 'b': [2, 6, 1], 'c': [0, 1, 7]})
+
+
+def test_multi_class_space_from_dict_accepts_history():
+    space = ContingencySpace({'x': three_classes()})
+    assert space.num_classes == 3
+
+    space.add_history({'y': three_classes()})
+    space.log(5, three_classes())
+    assert space.commit() == 1
+    assert list(space.matrices) == ['x', 'y', '5']
+
+
+def test_multi_class_space_from_list():
+    space = ContingencySpace([three_classes(), three_classes()])
+    assert space.num_classes == 3
+    assert list(space.matrices) == ['0', '1']
+
+    space.add_history(three_classes())
+    assert len(space.matrices) == 3
+
+
+def test_space_from_list_rejects_mixed_classes():
+    with pytest.raises(ValueError):
+        ContingencySpace([three_classes(), ConfusionMatrix({'t': [8, 2], 'f': [1, 9]})])
+
+
+def test_multi_class_npy_history_loads(tmp_path):
+    from contingency_space.cli import load_history
+
+    path = tmp_path / 'history.npy'
+    np.save(path, np.stack([three_classes().array()] * 4))
+    space = load_history(str(path))
+    assert space.num_classes == 3
+    assert len(space.batch()) == 4
+
+
+def test_merged_multi_class_space_accepts_history():
+    space = ContingencySpace({'0': three_classes(), '1': three_classes()})
+    merged = merge_histories([space, space])
+    assert merged.num_classes == 3
+
+    merged.add_history(three_classes())
+    assert len(merged.matrices) == 3
+
+
+def test_space_pickled_without_policy_loads_with_default_policy():
+    space = ContingencySpace({'0': ConfusionMatrix({'t': [8, 2], 'f': [1, 9]})})
+    state = space.__getstate__()
+    del state['policy']
+
+    loaded = ContingencySpace.__new__(ContingencySpace)
+    loaded.__setstate__(state)
+    assert loaded.policy == DEFAULT_POLICY
+    assert loaded.coordinates().tolist() == [[0.9, 0.8]]
+
+
+def test_multi_class_table_without_keys_converts_to_space():
+    pytest.importorskip('pyarrow')
+    from contingency_space.cm_batch import CMBatch
+    from contingency_space.columnar import batch_to_table, table_to_space
+
+    batch = CMBatch(np.stack([three_classes().array()] * 2), ('a', 'b', 'c'))
+    space = table_to_space(batch_to_table(batch))
+    assert space.num_classes == 3
+    assert list(space.matrices) == ['0', '1']
+
+
+def test_add_history_with_a_mismatched_matrix_adds_nothing():
+    space = ContingencySpace({'x': three_classes()})
+    binary = ConfusionMatrix({'t': [8, 2], 'f': [1, 9]})
+
+    with pytest.raises(ValueError):
+        space.add_history([three_classes(), binary])
+    with pytest.raises(ValueError):
+        space.add_history({'y': three_classes(), 'z': binary})
+    assert list(space.matrices) == ['x']
+
+
+def test_commit_with_a_mismatched_matrix_keeps_every_buffered_matrix():
+    space = ContingencySpace({'x': three_classes()})
+    space.log(1, three_classes())
+    space.log(2, ConfusionMatrix({'t': [8, 2], 'f': [1, 9]}))
+    space.log(3, three_classes())
+
+    with pytest.raises(ValueError):
+        space.commit()
+    assert list(space.matrices) == ['x']
+    with pytest.raises(ValueError):
+        space.commit()
+    assert list(space.matrices) == ['x']
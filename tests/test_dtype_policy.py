@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from contingency_space.cm_batch import CMBatch
+from contingency_space.cm_generator import CMGenerator
+from contingency_space.dtype_policy import COMPACT_POLICY, DEFAULT_POLICY, DTypePolicy
+from contingency_space.metrics import accuracy, calculate_scores
+
+
+def test_whole_float_counts_are_converted():
+    counts = DEFAULT_POLICY.counts_array(np.array([[2.0, 3.0], [0.0, 7.0]]))
+    assert counts.dtype == np.int64
+    assert counts.tolist() == [[2, 3], [0, 7]]
+
+
+@pytest.mark.parametrize('values', [[[2.7, 3], [0, 7]], [[np.nan, 3], [0, 7]]])
+def test_fractional_counts_are_rejected(values):
+    with pytest.raises(ValueError):
+        DEFAULT_POLICY.counts_array(values)
+    with pytest.raises(ValueError):
+        CMBatch(np.array([values]), ('t', 'f'))
+
+
+def test_counts_out_of_range_are_rejected():
+    with pytest.raises(OverflowError):
+        DTypePolicy(np.int8).counts_array([[200, 0], [0, 1]])
+    with pytest.raises(OverflowError):
+        DEFAULT_POLICY.counts_array([[np.inf, 0], [0, 1]])
+
+
+def test_fit_picks_the_smallest_counts_dtype():
+    assert DTypePolicy.fit(100).counts == np.int8
+    assert DTypePolicy.fit(1000).counts == np.int16
+    assert DTypePolicy.fit(1 << 40).counts == np.int64
+    with pytest.raises(OverflowError):
+        DTypePolicy.fit(1 << 64)
+    with pytest.raises(TypeError):
+        DTypePolicy(np.float32)
+
+
+def test_compact_policy_matches_the_default_scores():
+    compact = CMGenerator(2, {'t': 40, 'f': 60}, COMPACT_POLICY).generate_batch(15)
+    default = CMGenerator(2, {'t': 40, 'f': 60}).generate_batch(15)
+
+    assert compact.counts.dtype == np.int32
+    assert np.array_equal(compact.counts, default.counts)
+    scores = calculate_scores(compact, accuracy)
+    assert scores.dtype == np.float32
+    assert np.allclose(scores, calculate_scores(default, accuracy), atol=1e-6)
+
+    with pytest.raises(OverflowError):
+        CMGenerator(2, {'t': 200, 'f': 60}, DTypePolicy(np.int8))
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from contingency_space.cm_batch import CMBatch
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.imbalance_sensitivity import prior_shift_curve, shift_priors
+from contingency_space.metrics import accuracy, tau
+
+
+def test_shift_priors_matches_a_hand_computed_matrix():
+    #tpr = 0.8 and tnr = 0.9, shifted to 1 positive for every 4 negatives.
+    matrix = ConfusionMatrix({'t': [8, 2], 'f': [1, 9]})
+    assert shift_priors(matrix, [(1, 4)], total=1000).counts.tolist() == [[[160, 40], [80, 720]]]
+    #20 instances: 4 positives and 16 negatives, rounded to the nearest count.
+    assert shift_priors(matrix, [4]).counts.tolist() == [[[3, 1], [2, 14]]]
+
+
+def test_every_ratio_of_every_matrix_is_shifted():
+    matrices = [ConfusionMatrix({'t': [8, 2], 'f': [1, 9]}), ConfusionMatrix({'t': [5, 5], 'f': [3, 7]})]
+    ratios = [1, '1:3', (3, 1)]
+    shifted = shift_priors(matrices, ratios, total=4000)
+
+    assert len(shifted) == 6
+    for i, matrix in enumerate(matrices):
+        for j, ratio in enumerate(ratios):
+            alone = shift_priors(matrix, [ratio], total=4000)
+            assert np.array_equal(shifted.counts[i * len(ratios) + j], alone.counts[0])
+
+    #the rates are kept, and the class sizes follow the ratio.
+    assert np.allclose(shifted.rates(), np.repeat(CMBatch.from_matrices(matrices).rates(), 3, axis=0))
+    assert shifted.counts.sum(axis=2)[:3].tolist() == [[2000, 2000], [1000, 3000], [3000, 1000]]
+
+
+def test_multi_class_priors_and_empty_classes():
+    counts = np.array([[[6, 2, 2], [0, 0, 0], [1, 1, 8]]])
+    shifted = shift_priors(CMBatch(counts, 'abc'), np.array([[1, 1, 2]]), total=400)
+    assert shifted.counts.tolist() == [[[60, 20, 20], [0, 0, 0], [20, 20, 160]]]
+
+    with pytest.raises(ValueError):
+        shift_priors(CMBatch(counts, 'abc'), [(1, 2)])
+    with pytest.raises(ValueError):
+        shift_priors(CMBatch(counts, 'abc'), np.array([[1, 0, 2]]))
+
+
+def test_prior_shift_curve_keeps_tau_and_moves_accuracy():
+    matrix = ConfusionMatrix({'t': [8, 2], 'f': [1, 9]})
+    ratios = [1, 4, 16]
+    curve = prior_shift_curve(matrix, ratios, accuracy, total=17000)
+    assert curve.shape == (1, 3)
+    assert curve[0].tolist() == pytest.approx([(0.8 + 0.9) / 2, (0.8 + 4 * 0.9) / 5, (0.8 + 16 * 0.9) / 17])
+    assert prior_shift_curve(matrix, ratios, tau, total=17000)[0] == pytest.approx(tau(matrix.array()[np.newaxis])[0])
@@ -0,0 +1,54 @@
+import json
+import threading
+from contingency_space import instrumentation
+from contingency_space.cm_generator import CMGenerator
+from contingency_space.metrics import accuracy, calculate_scores
+
+
+def test_nothing_is_recorded_while_disabled():
+    assert not instrumentation.enabled()
+    assert instrumentation.phase('a') is instrumentation.phase('b')
+    instrumentation.count('events')
+
+    with instrumentation.instrument() as stats:
+        assert instrumentation.enabled()
+    assert not instrumentation.enabled()
+    assert stats.to_dict() == {'phases': {}, 'counters': {}, 'peak_array_bytes': 0}
+
+
+def test_hot_paths_are_recorded():
+    with instrumentation.instrument() as stats:
+        batch = CMGenerator(2, {'t': 40, 'f': 60}).generate_batch(10)
+        calculate_scores(batch, accuracy)
+
+    assert stats.counters['matrices_generated'] == 100
+    assert stats.counters['matrices_scored'] == 100
+    assert stats.peak_array_bytes == batch.counts.nbytes
+
+
+def test_phases_accumulate_across_blocks_and_threads(tmp_path):
+    @instrumentation.timed('work')
+    def work():
+        instrumentation.count('events', 2)
+
+    stats = instrumentation.Stats()
+    with instrumentation.instrument(stats):
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    with instrumentation.instrument(stats):
+        with instrumentation.phase('work'):
+            pass
+
+    assert stats.phases['work']['calls'] == 5
+    assert stats.phases['work']['max_s'] <= stats.phases['work']['total_s']
+    assert stats.counters['events'] == 8
+
+    path = tmp_path / 'stats.json'
+    stats.to_json(str(path))
+    assert json.loads(path.read_text()) == stats.to_dict()
+
+    stats.reset()
+    assert stats.to_dict() == {'phases': {}, 'counters': {}, 'peak_array_bytes': 0}
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from contingency_space.cm_batch import CMBatch
+from contingency_space.merge import merge, merge_histories, tree_reduce
+
+
+def ranks(n: int, aligned: bool = False, seed: int = 0) -> list[tuple[list[str], CMBatch]]:
+    #the partial history of each rank. unless aligned, each holds a random subset of the steps, shuffled.
+    rng = np.random.default_rng(seed)
+    histories = []
+    for _ in range(n):
+        steps = np.arange(0, 200, 10) if aligned else rng.permutation(np.arange(0, 200, 10))[:rng.integers(5, 20)]
+        histories.append(([str(step) for step in steps], CMBatch(rng.integers(0, 30, (len(steps), 2, 2)), ('t', 'f'))))
+    return histories
+
+
+def serial_sum(histories, weights=None) -> dict[str, list]:
+    totals = {}
+    for i, (keys, batch) in enumerate(histories):
+        for key, counts in zip(keys, batch.counts):
+            weight = 1 if weights is None else weights[i]
+            totals[key] = totals.get(key, 0) + weight * counts
+    return {key: np.rint(totals[key]).tolist() for key in sorted(totals, key=int)}
+
+
+@pytest.mark.parametrize('aligned', [True, False])
+def test_merge_matches_a_serial_sum(aligned):
+    histories = ranks(5, aligned)
+    expected = serial_sum(histories)
+
+    keys, batch = merge(histories)
+    assert keys == list(expected)
+    assert batch.counts.tolist() == list(expected.values())
+
+    weights = [0.5, 1, 2, 1, 0.25]
+    keys, batch = merge(histories, weights)
+    assert batch.counts.tolist() == list(serial_sum(histories, weights).values())
+
+
+def test_inner_join_keeps_only_shared_steps():
+    histories = [(['1', '2', '3'], CMBatch(np.ones((3, 2, 2), dtype=int), 'tf')),
+                 (['3', '1'], CMBatch(np.ones((2, 2, 2), dtype=int), 'tf'))]
+    keys, batch = merge(histories, join='inner')
+    assert keys == ['1', '3']
+    assert (batch.counts == 2).all()
+
+
+def test_keys_that_are_not_steps_keep_their_first_order():
+    histories = [(['b', 'a'], CMBatch(np.ones((2, 2, 2), dtype=int), 'tf')),
+                 (['c', 'a'], CMBatch(np.ones((2, 2, 2), dtype=int), 'tf'))]
+    assert merge(histories)[0] == ['b', 'a', 'c']
+    assert list(merge_histories(histories).matrices) == ['b', 'a', 'c']
+
+
+@pytest.mark.parametrize('fanout', [2, 3, 16])
+def test_tree_reduce_matches_a_serial_sum(fanout):
+    histories = ranks(11, seed=1)
+    expected = serial_sum(histories)
+
+    keys, batch = tree_reduce(iter(histories), fanout=fanout)
+    assert keys == list(expected)
+    assert batch.counts.tolist() == list(expected.values())
+
+    weights = np.arange(1, 12)
+    assert tree_reduce(histories, weights, fanout=fanout)[1].counts.tolist() == list(serial_sum(histories, weights).values())
+
+
+def test_mismatched_histories_are_rejected():
+    with pytest.raises(ValueError):
+        merge([(['1'], CMBatch(np.ones((1, 2, 2), dtype=int), 'tf')), (['1'], CMBatch(np.ones((1, 2, 2), dtype=int), 'ab'))])
+    with pytest.raises(ValueError):
+        tree_reduce(ranks(3), weights=[1, 1])
+    with pytest.raises(ValueError):
+        tree_reduce(ranks(2), weights=[1, 1, 1])
+    with pytest.raises(ValueError):
+        tree_reduce([])
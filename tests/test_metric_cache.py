@@ -0,0 +1,34 @@
+import gc
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.metric_cache import MetricCache, SurfaceCache
+
+
+def test_new_metrics_are_not_served_scores_of_collected_ones():
+    cache = MetricCache()
+    cm = ConfusionMatrix({'t': [3, 1], 'f': [2, 4]})
+
+    for i in range(50):
+        metric = lambda cm, i=i: float(i)
+        assert cache.evaluate(metric, cm) == i
+        del metric
+        gc.collect()
+
+
+def test_same_metric_hits_the_cache():
+    cache = MetricCache()
+    cm = ConfusionMatrix({'t': [3, 1], 'f': [2, 4]})
+    metric = lambda cm: 0.5
+
+    cache.evaluate(metric, cm)
+    cache.evaluate(metric, ConfusionMatrix({'t': [3, 1], 'f': [2, 4]}))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_surfaces_of_new_metrics_are_scored():
+    cache = SurfaceCache()
+    for i in range(20):
+        metric = lambda cm, i=i: float(i)
+        scores, _ = cache.surfaces({'t': 10, 'f': 10}, 3, [metric])
+        assert (scores == i).all()
+        del metric
+        gc.collect()
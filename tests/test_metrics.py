@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from contingency_space.metrics import tau, tau_components, tau_weighted
+
+
+def binary_batch(n: int = 200, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 50, (n, 2, 2))
+
+
+def test_unit_weights_give_tau():
+    counts = binary_batch()
+    assert tau_weighted(counts).shape == (200, 1)
+    assert np.allclose(tau_weighted(counts)[:, 0], tau(counts))
+    assert np.allclose(tau_weighted(counts, [[1, 1, 1], [2, 2, 1]]), tau(counts)[:, np.newaxis])
+
+
+def test_weighted_tau_matches_the_formula():
+    #tpr = 0.8 and tnr = 0.9.
+    counts = np.array([[[8, 2], [1, 9]]])
+    expected = (1 - np.sqrt(2 * 0.2 ** 2 + 1 * 0.1 ** 2) / np.sqrt(3)) ** 2
+    assert tau_weighted(counts, (2, 1, 2))[0, 0] == pytest.approx(expected)
+
+
+def test_weight_sweep_matches_each_weight_alone():
+    counts = binary_batch()
+    a, b, c = np.meshgrid([0.5, 1, 2], [1, 3], [1, 2], indexing='ij')
+    weights = np.column_stack([a.ravel(), b.ravel(), c.ravel()])
+
+    swept = tau_weighted(counts, weights)
+    assert swept.shape == (200, len(weights))
+    for i, triple in enumerate(weights):
+        assert np.allclose(swept[:, i], tau_weighted(counts, triple)[:, 0])
+
+
+def test_weighted_tau_rejects_bad_shapes():
+    with pytest.raises(ValueError):
+        tau_weighted(np.ones((2, 3, 3)))
+    with pytest.raises(ValueError):
+        tau_weighted(binary_batch(), (1, 1))
+
+
+def test_tau_matches_the_binary_formula():
+    counts = binary_batch()
+    tpr = counts[:, 0, 0] / counts[:, 0].sum(axis=1)
+    tnr = counts[:, 1, 1] / counts[:, 1].sum(axis=1)
+    assert np.allclose(tau(counts), 1 - np.sqrt((1 - tpr) ** 2 + (1 - tnr) ** 2) / np.sqrt(2))
+
+
+def test_tau_of_k_classes_matches_a_loop():
+    counts = np.random.default_rng(1).integers(0, 20, (50, 4, 4))
+    expected = []
+    for matrix in counts:
+        rates = [matrix[i, i] / matrix[i].sum() if matrix[i].sum() else 0 for i in range(4)]
+        expected.append(1 - np.sqrt(sum((1 - rate) ** 2 for rate in rates)) / 2)
+    assert np.allclose(tau(counts), expected)
+
+
+def test_tau_of_perfect_random_and_worst_models():
+    perfect, worst = np.eye(3, dtype=int) * 10, (1 - np.eye(3, dtype=int)) * 5
+    random_guess = np.full((3, 3), 4)
+    counts = np.stack([perfect, worst, random_guess])
+
+    assert tau(counts).tolist() == pytest.approx([1, 0, 1 - np.sqrt(3 * (2 / 3) ** 2) / np.sqrt(3)])
+    rates, dist_from_perfect, dist_from_random = tau_components(counts)
+    assert np.allclose(rates, [[1, 1, 1], [0, 0, 0], [1 / 3, 1 / 3, 1 / 3]])
+    assert dist_from_perfect.tolist() == pytest.approx([0, np.sqrt(3), np.sqrt(3) * 2 / 3])
+    assert dist_from_random[2] == pytest.approx(0)
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+from contingency_space.confusion_matrix import ConfusionMatrix
+from contingency_space.contingency_space import ContingencySpace
+from contingency_space.metrics import accuracy, tau
+from contingency_space.paths import analyze_runs, max_error, resample, simplify, simplify_indices
+
+
+#an L-shaped path: along the x axis with a small bump at 1, then up x = 2 with a larger bump at 4.
+L_PATH = np.array([[0, 0], [1, 0.05], [2, 0], [2, 1], [2.08, 2], [2, 3]])
+
+
+def test_simplify_indices_keeps_the_corner_within_tolerance():
+    assert simplify_indices(L_PATH, tolerance=0.1).tolist() == [0, 2, 5]
+    #once 4 is kept, 3 lies 0.04 off the segment from 2 to 4.
+    assert simplify_indices(L_PATH, tolerance=0.045).tolist() == [0, 1, 2, 4, 5]
+    assert simplify_indices(L_PATH).tolist() == list(range(6))
+
+
+def test_max_points_drops_the_points_closest_to_the_path():
+    assert simplify_indices(L_PATH, max_points=4).tolist() == [0, 2, 4, 5]
+    assert simplify_indices(L_PATH, max_points=2).tolist() == [0, 5]
+    assert simplify_indices(L_PATH, max_points=10).tolist() == list(range(6))
+    with pytest.raises(ValueError):
+        simplify_indices(L_PATH, max_points=1)
+
+
+def test_simplified_random_walks_keep_their_ends_and_tolerance():
+    rng = np.random.default_rng(0)
+    for tolerance in (0.0, 0.05, 0.5):
+        walk = np.cumsum(rng.normal(0, 0.1, (500, 2)), axis=0)
+        indices = simplify_indices(walk, tolerance=tolerance)
+
+        assert indices[0] == 0 and indices[-1] == len(walk) - 1
+        assert (np.diff(indices) > 0).all()
+        assert max_error(walk, indices) <= tolerance
+        assert np.array_equal(simplify(walk, tolerance=tolerance), walk[indices])
+
+
+def test_resample_spaces_points_evenly():
+    resampled = resample(L_PATH[[0, 2, 5]], 6)
+    assert resampled[0].tolist() == [0, 0] and resampled[-1].tolist() == [2, 3]
+    assert np.allclose(np.linalg.norm(np.diff(resampled, axis=0), axis=1), 1)
+    with pytest.raises(ValueError):
+        simplify(L_PATH, method='resample')
+
+
+def test_step_speeds_match_a_hand_computed_path():
+    #the rates of these matrices are (0.5, 0.5), (0.8, 0.8) and (1, 1).
+    half, most, perfect = [[5, 5], [5, 5]], [[8, 2], [2, 8]], [[10, 0], [0, 10]]
+    runs = {'a': [half, most, perfect], 'b': [perfect, half], 'c': [most]}
+
+    summary, steps = analyze_runs(runs, return_steps=True)
+
+    assert steps['run'].tolist() == ['a', 'a', 'b']
+    assert steps['step'].tolist() == [1, 2, 1]
+    assert steps['speed'].to_numpy() == pytest.approx([0.3 * np.sqrt(2), 0.2 * np.sqrt(2), 0.5 * np.sqrt(2)])
+
+    by_run = steps.groupby('run')['speed']
+    assert summary.loc[['a', 'b'], 'path_length'].to_numpy() == pytest.approx(by_run.sum().to_numpy())
+    assert summary.loc[['a', 'b'], 'max_speed'].to_numpy() == pytest.approx(by_run.max().to_numpy())
+    assert summary.loc['c', 'path_length'] == 0
+
+
+def test_single_point_runs_have_no_steps():
+    summary, steps = analyze_runs(np.array([[[[8, 2], [2, 8]]]] * 2), return_steps=True)
+    assert len(summary) == 2
+    assert steps.empty
+    pd.testing.assert_frame_equal(summary, analyze_runs(np.array([[[[8, 2], [2, 8]]]] * 2)))
+
+
+def random_runs(seed: int = 0) -> dict[str, np.ndarray]:
+    #runs of different lengths, each a history of binary matrices over 50 positives and 50 negatives.
+    rng = np.random.default_rng(seed)
+    runs = {}
+    for name, length in zip('abcd', (12, 1, 30, 7)):
+        tp, tn = rng.integers(0, 51, length), rng.integers(0, 51, length)
+        runs[name] = np.stack([np.column_stack([tp, 50 - tp]), np.column_stack([50 - tn, tn])], axis=1)
+    return runs
+
+
+def unbatched_accuracy(cm) -> float:
+    return cm.get_total_true() / sum(map(sum, cm.matrix.values()))
+
+
+def test_summaries_match_each_run_measured_alone():
+    runs = random_runs()
+    summary = analyze_runs(runs, metric=unbatched_accuracy)
+
+    assert summary.index.tolist() == list(runs)
+    for name, counts in runs.items():
+        space = ContingencySpace([ConfusionMatrix({'t': matrix[0].tolist(), 'f': matrix[1].tolist()}) for matrix in counts])
+        keys = list(space.matrices)
+        assert summary.loc[name, 'num_points'] == len(counts)
+        assert summary.loc[name, 'path_length'] == pytest.approx(space.learning_path_length_3D((keys[0], keys[-1]), unbatched_accuracy))
+        assert summary.loc[name, 'final_score'] == pytest.approx(accuracy(counts[-1:])[0])
+        assert summary.loc[name, 'final_distance_to_perfect'] == pytest.approx(np.linalg.norm(1 - space.coordinates()[-1]))
+
+
+def test_time_to_threshold_is_the_first_point_within_each_run():
+    runs = random_runs()
+    summary = analyze_runs(list(runs.values()), threshold=0.6)
+
+    for i, counts in enumerate(runs.values()):
+        reached = np.flatnonzero(tau(counts) >= 0.6)
+        assert summary.loc[i, 'time_to_threshold'] == (reached[0] if len(reached) else -1)
+
+
+def test_runs_must_share_their_classes():
+    with pytest.raises(ValueError):
+        analyze_runs([np.ones((3, 2, 2)), np.ones((3, 3, 3))])
+    with pytest.raises(ValueError):
+        analyze_runs([])
@@ -0,0 +1,93 @@
+import os
+import sys
+import subprocess
+import multiprocessing
+import numpy as np
+import pytest
+from contingency_space import scoring
+from contingency_space.cm_batch import CMBatch
+from contingency_space.cm_generator import CMGenerator
+from contingency_space.imbalance_sensitivity import imbalance_sensitivity
+from contingency_space.metrics import accuracy
+from contingency_space.scoring import ScoringPool, score_parallel
+
+
+def true_positive_rate(cm) -> float:
+    return cm.matrix['t'][0] / sum(cm.matrix['t'])
+
+
+def unbatched_accuracy(cm) -> float:
+    return cm.get_total_true() / sum(map(sum, cm.matrix.values()))
+
+
+def test_pool_scores_batches_of_any_size():
+    rng = np.random.default_rng(0)
+    with ScoringPool([unbatched_accuracy, accuracy], n_jobs=2) as pool:
+        for n in (5, 300, 40):
+            batch = CMBatch(rng.integers(1, 50, (n, 2, 2)), ('t', 'f'))
+            assert np.allclose(pool.score(batch, unbatched_accuracy), accuracy(batch.counts))
+            assert np.allclose(pool.score(batch, accuracy), accuracy(batch.counts))
+
+    with pytest.raises(ValueError):
+        pool.score(batch, accuracy)
+
+
+def test_score_parallel_matches_serial():
+    batch = CMBatch(np.random.default_rng(1).integers(1, 50, (100, 2, 2)), ('t', 'f'))
+    assert np.allclose(score_parallel(batch, unbatched_accuracy, n_jobs=2), accuracy(batch.counts))
+
+
+@pytest.fixture
+def started(monkeypatch) -> list:
+    #records the arguments of every process pool started.
+    started = []
+    context = multiprocessing.get_context()
+
+    def get_context():
+
+        class Context:
+            def Pool(self, *args, **kwargs):
+                started.append(args)
+                return context.Pool(*args, **kwargs)
+
+        return Context()
+
+    monkeypatch.setattr(scoring.multiprocessing, 'get_context', get_context)
+    return started
+
+
+def test_chunked_scoring_starts_one_pool(started):
+    generator = CMGenerator(2, {'t': 30, 'f': 50})
+    metrics = [unbatched_accuracy, true_positive_rate, accuracy]
+    scores = generator.score(20, metrics, memory_budget=60000, n_jobs=2)
+
+    assert len(started) == 1
+    assert np.allclose(scores, generator.score(20, metrics))
+
+
+def test_imbalance_sensitivity_shares_one_pool_between_grids(started):
+    serial = imbalance_sensitivity((1, 4), unbatched_accuracy, granularity=12)
+    parallel = imbalance_sensitivity((1, 4), unbatched_accuracy, granularity=12, n_jobs=2, memory_budget=1 << 16)
+
+    assert len(started) == 1
+    assert parallel == pytest.approx(serial)
+
+
+def test_pool_in_a_fresh_process_keeps_its_shared_memory():
+    #a fresh interpreter has no resource tracker yet, which the workers would otherwise each start on their own.
+    code = """
+from contingency_space.cm_generator import CMGenerator
+from contingency_space.metrics import accuracy
+
+def unbatched_accuracy(cm):
+    return cm.get_total_true() / sum(map(sum, cm.matrix.values()))
+
+if __name__ == '__main__':
+    generator = CMGenerator(2, {'t': 30, 'f': 50})
+    scores = generator.score(40, [unbatched_accuracy, accuracy], memory_budget=100000, n_jobs=2)
+    assert abs(scores[0] - scores[1]).max() < 1e-12
+"""
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=environment, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert 'leaked' not in result.stderr
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import numpy as np
+import pytest
+from contingency_space.service import ScoringService, ScoringServer
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_score_returns_scores_coordinates_and_path():
+    async def scenario():
+        service = ScoringService(window=0.001)
+        try:
+            first = await service.score('a', [[8, 2], [1, 9]])
+            second = await service.score('a', [[[9, 1], [1, 9]], [[10, 0], [0, 10]]])
+        finally:
+            await service.close()
+        return first, second
+
+    first, second = run(scenario())
+    assert first['scores'] == [0.85]
+    assert first['coordinates'] == [[0.9, 0.8]]
+    assert first['path_length'] == [0.0]
+    assert second['steps'] == 3
+    assert second['scores'] == [0.9, 1.0]
+    assert second['path_length'][-1] == pytest.approx(0.1 + np.hypot(0.1, 0.1))
+
+
+def test_concurrent_requests_are_batched():
+    async def scenario():
+        service = ScoringService(window=0.05)
+        try:
+            results = await asyncio.gather(*(service.score(str(i), [[5, 5], [5, 5]]) for i in range(10)))
+        finally:
+            await service.close()
+        return service, results
+
+    service, results = run(scenario())
+    assert [result['scores'] for result in results] == [[0.5]] * 10
+    assert service.stats()['batches'] < 10
+
+
+def test_class_change_fails_only_that_request():
+    async def scenario():
+        service = ScoringService(window=0.05, keep_history=True)
+        try:
+            await service.score('a', [[8, 2], [1, 9]])
+            return await asyncio.wait_for(asyncio.gather(
+                service.score('a', np.eye(3, dtype=int)),
+                service.score('b', [[5, 5], [5, 5]]),
+                return_exceptions=True), timeout=5)
+        finally:
+            await service.close()
+
+    changed, other = run(scenario())
+    assert isinstance(changed, ValueError)
+    assert other['scores'] == [0.5]
+
+
+def test_failed_batch_fails_every_request():
+    async def scenario():
+        service = ScoringService(window=0.05)
+
+        def fail(batch):
+            raise RuntimeError('scoring failed')
+
+        service._ScoringService__process = fail
+        try:
+            return await asyncio.wait_for(asyncio.gather(
+                service.score('a', [[8, 2], [1, 9]]),
+                service.score('b', [[5, 5], [5, 5]]),
+                return_exceptions=True), timeout=5)
+        finally:
+            await service.close()
+
+    results = run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_unknown_metric_is_rejected():
+    async def scenario():
+        service = ScoringService()
+        try:
+            await service.score('a', [[1, 0], [0, 1]], metric='nope')
+        finally:
+            await service.close()
+
+    with pytest.raises(KeyError):
+        run(scenario())
+
+
+async def post(port: int, body: dict) -> tuple[int, dict]:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    data = json.dumps(body).encode()
+    writer.write(f'POST /score HTTP/1.1\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n'
+                 f'Connection: close\r\n\r\n'.encode() + data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+
+    head, payload = response.split(b'\r\n\r\n', 1)
+    return int(head.split(b' ')[1]), json.loads(payload)
+
+
+def test_server_rejects_class_change_with_400():
+    async def scenario():
+        server = ScoringServer(ScoringService(window=0.001), port=0)
+        await server.start()
+        try:
+            first = await post(server.port, {'run': 'a', 'matrices': [[8, 2], [1, 9]]})
+            changed = await asyncio.wait_for(post(server.port, {'run': 'a', 'matrices': np.eye(3, dtype=int).tolist()}), timeout=5)
+            after = await post(server.port, {'run': 'a', 'matrices': [[9, 1], [1, 9]]})
+        finally:
+            await server.close()
+        return first, changed, after
+
+    first, changed, after = run(scenario())
+    assert first[0] == 200
+    assert changed[0] == 400
+    assert 'classes' in changed[1]['error']
+    assert after[0] == 200 and after[1]['steps'] == 2
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from contingency_space.streaming import WindowedCMBuilder
+
+
+def events(n: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return rng.choice(['a', 'b', 'c'], n), rng.choice(['a', 'b', 'c'], n)
+
+
+def brute_force(y_true, y_pred, labels, end: int, window: int) -> list[list[int]]:
+    counts = np.zeros((len(labels), len(labels)), dtype=int)
+    for real, pred in zip(y_true[end - window:end], y_pred[end - window:end]):
+        counts[labels.index(real), labels.index(pred)] += 1
+    return counts.tolist()
+
+
+@pytest.mark.parametrize('window, step, chunk_size', [(10, 10, 7), (10, 3, 4), (25, 5, 100), (7, 1, 3)])
+def test_extend_matches_add_and_brute_force(window, step, chunk_size):
+    labels = ['a', 'b', 'c']
+    y_true, y_pred = events(203)
+
+    one_by_one = WindowedCMBuilder(labels, window, step)
+    added = [m for m in (one_by_one.add(t, p) for t, p in zip(y_true, y_pred)) if m is not None]
+
+    #the events are split between calls too, so chunks start with a partly filled window.
+    chunked = WindowedCMBuilder(labels, window, step)
+    extended = chunked.extend(y_true[:50], y_pred[:50], chunk_size) + chunked.extend(y_true[50:], y_pred[50:], chunk_size)
+
+    assert [m.matrix for m in extended] == [m.matrix for m in added]
+    assert list(chunked.space.matrices) == list(one_by_one.space.matrices)
+    assert chunked.current().matrix == one_by_one.current().matrix
+
+    for key, matrix in chunked.space.matrices.items():
+        assert list(matrix.matrix.values()) == brute_force(y_true, y_pred, labels, int(key), window)
+
+
+def test_add_continues_after_extend():
+    labels = ['a', 'b', 'c']
+    y_true, y_pred = events(40, seed=1)
+
+    builder = WindowedCMBuilder(labels, 8, 4)
+    builder.extend(y_true[:30], y_pred[:30], chunk_size=6)
+    for real, pred in zip(y_true[30:], y_pred[30:]):
+        builder.add(real, pred)
+
+    assert list(builder.space.matrices) == [str(end) for end in range(8, 41, 4)]
+    assert list(builder.current().matrix.values()) == brute_force(y_true, y_pred, labels, 40, 8)
+
+
+def test_unknown_classes_are_rejected():
+    builder = WindowedCMBuilder(['a', 'b'], 4)
+    with pytest.raises(ValueError):
+        builder.add('a', 'z')
+    with pytest.raises(ValueError):
+        builder.extend(['a', 'q'], ['a', 'b'])
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from contingency_space.thresholds import threshold_sweep
+
+
+def test_numpy_integer_is_a_number_of_thresholds():
+    rng = np.random.default_rng(0)
+    scores, y_true = rng.random(200), rng.integers(0, 2, 200)
+
+    values, batch = threshold_sweep(scores, y_true, np.int64(10))
+    expected_values, expected = threshold_sweep(scores, y_true, 10)
+    assert len(values) == 10
+    assert np.array_equal(values, expected_values)
+    assert np.array_equal(batch.counts, expected.counts)
+
+    with pytest.raises(TypeError):
+        threshold_sweep(scores, y_true, True)
+
+
+def brute_force(scores, y_true, thresholds) -> list:
+    counts = []
+    for threshold in thresholds:
+        predicted, positive = scores >= threshold, y_true == 1
+        counts.append([[np.sum(predicted & positive), np.sum(~predicted & positive)],
+                       [np.sum(predicted & ~positive), np.sum(~predicted & ~positive)]])
+    return counts
+
+
+def test_every_distinct_score_matches_brute_force():
+    rng = np.random.default_rng(1)
+    #rounded scores, so that many samples share a threshold.
+    scores, y_true = np.round(rng.random(500), 2), rng.integers(0, 2, 500)
+
+    values, batch = threshold_sweep(scores, y_true)
+    assert values.tolist() == sorted(set(scores.tolist()), reverse=True)
+    assert batch.counts.tolist() == brute_force(scores, y_true, values)
+
+
+@pytest.mark.parametrize('chunk_size', [7, 1 << 22])
+def test_given_thresholds_match_brute_force(chunk_size):
+    rng = np.random.default_rng(2)
+    scores, y_true = rng.random(300), rng.integers(0, 2, 300)
+
+    thresholds = [0.9, 0.1, 0.5, scores[17], 2.0, -1.0]
+    values, batch = threshold_sweep(scores, y_true, thresholds, chunk_size=chunk_size)
+    assert values.tolist() == sorted(thresholds, reverse=True)
+    assert batch.counts.tolist() == brute_force(scores, y_true, values)
+
+    values, batch = threshold_sweep(scores, y_true, 25, chunk_size=chunk_size)
+    assert values[0] == scores.max() and values[-1] == scores.min()
+    assert batch.counts.tolist() == brute_force(scores, y_true, values)
+
+
+def test_labels_and_bad_scores():
+    values, batch = threshold_sweep([0.2, 0.8, 0.8], ['no', 'yes', 'no'], pos_label='yes', labels=('yes', 'no'))
+    assert batch.labels == ('yes', 'no')
+    assert batch.counts.tolist() == [[[1, 0], [1, 1]], [[1, 0], [2, 0]]]
+
+    with pytest.raises(ValueError):
+        threshold_sweep([0.5, np.nan], [1, 0])
+    with pytest.raises(ValueError):
+        threshold_sweep([0.5, np.nan], [1, 0], 5)
+    with pytest.raises(ValueError):
+        threshold_sweep([0.5, 0.2], [1])
+    with pytest.raises(ValueError):
+        threshold_sweep([], [])
@@ -0,0 +1,74 @@
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+from contingency_space import instrumentation
+from contingency_space.cm_batch import CMBatch
+from contingency_space.contingency_space import ContingencySpace
+from contingency_space.metric_cache import SurfaceCache
+from contingency_space.metrics import accuracy, tau
+
+
+@pytest.fixture(autouse=True)
+def close_figures():
+    yield
+    plt.close('all')
+
+
+def population(n: int = 2000) -> ContingencySpace:
+    #n models evaluated on 40 positives and 60 negatives.
+    rng = np.random.default_rng(0)
+    tp, tn = rng.integers(0, 41, n), rng.integers(0, 61, n)
+    counts = np.stack([np.column_stack([tp, 40 - tp]), np.column_stack([60 - tn, tn])], axis=1)
+    return ContingencySpace(CMBatch(counts, ('t', 'f')).to_matrices())
+
+
+def test_hist2d_density_bins_every_model():
+    _, ax = plt.subplots()
+    population().visualize(accuracy, 20, ax=ax, density='hist2d', surface_cache=None)
+
+    assert len(ax.images) == 1
+    assert ax.images[0].get_array().sum() == 2000
+    assert len(ax.lines) == 0
+
+
+def test_hexbin_density_bins_every_model():
+    _, ax = plt.subplots()
+    population().visualize(accuracy, 20, ax=ax, density='hexbin', surface_cache=None)
+    assert ax.collections[-1].get_array().sum() == 2000
+
+
+def test_density_needs_a_2d_projection():
+    with pytest.raises(ValueError):
+        population(10).visualize(accuracy, 10, density='hist2d', projection='3d')
+    with pytest.raises(ValueError):
+        population(10).visualize(accuracy, 10, density='kde')
+
+
+def test_several_metrics_share_one_grid():
+    space = population(10)
+    _, axes = plt.subplots(1, 2)
+    with instrumentation.instrument() as stats:
+        space.visualize([accuracy, tau], 15, ax=axes, surface_cache=None)
+
+    assert stats.counters['matrices_generated'] == 15 * 15
+    assert [ax.get_title() for ax in axes] == ['accuracy', 'tau']
+
+    with pytest.raises(ValueError):
+        space.visualize([accuracy, tau], 15, ax=axes[:1], surface_cache=None)
+
+
+def test_redrawing_a_surface_reuses_the_cache():
+    space = population(10)
+    cache = SurfaceCache()
+    _, ax = plt.subplots()
+    space.visualize(accuracy, 15, ax=ax, surface_cache=cache)
+
+    with instrumentation.instrument() as stats:
+        space.visualize(accuracy, 15, ax=ax, surface_cache=cache)
+        space.visualize([tau, accuracy], 15, ax=plt.subplots(1, 2)[1], surface_cache=cache)
+
+    #only tau is new, so the grid is generated once more, for tau alone.
+    assert stats.counters['matrices_generated'] == 15 * 15
+    assert stats.counters['surface_cache_hits'] == 4